@@ -15,6 +15,30 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE_MB: int = 20
     CORS_ORIGINS: str = "http://localhost:5173,http://127.0.0.1:5173"
     RATE_LIMIT_PAPERS_PER_DAY: int = 10
+    CHAT_VERBATIM_MESSAGES: int = 6  # Most recent chat messages replayed as-is to Gemini
+    CHAT_HISTORY_TOKEN_BUDGET: int = 6000  # Cap for summary + verbatim history (paper itself excluded)
+    CHAT_SUMMARY_MAX_TOKENS: int = 600
+    CHAT_FOLD_BATCH_MESSAGES: int = 6  # Aged-out messages folded into the summary per Gemini call
+    GEMINI_CONTEXT_CACHE: str = "gemini"  # gemini | local (in-process stand-in) | off
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = 1024  # Provider minimum for explicit caching
+    LEARNING_DEBOUNCE_SECONDS: int = 45  # Quiet period per user before extracting learnings
+    LEARNING_MAX_WAIT_SECONDS: int = 300  # Extract anyway if a user keeps chatting this long
+    LEARNING_BATCH_MAX_USERS: int = 8  # Users per extraction call
+    LEARNINGS_CACHE_TTL_SECONDS: int = 600  # Safety net if an invalidation broadcast is missed
+    LEARNINGS_CACHE_BROADCAST: str = "local"  # local | postgres (LISTEN/NOTIFY across workers)
+    ANALYSIS_BATCH_MAX_CHARS: int = 6000  # Normalized papers up to this size are batched for analysis
+    ANALYSIS_BATCH_WINDOW_SECONDS: float = 4.0  # How long a small paper waits for company
+    ANALYSIS_BATCH_MAX_PAPERS: int = 6
+    ANALYSIS_BATCH_MAX_TOTAL_CHARS: int = 30000
+    ANALYSIS_BATCH_WORKERS: int = 4  # Concurrent Gemini calls for small papers, single or batched
+    QUESTION_DEDUP_THRESHOLD: float = 0.8  # Estimated text similarity at which an ingested question is flagged as a near-duplicate
+    PDF_BACKEND: str = "xhtml2pdf"  # xhtml2pdf | pymupdf (see benchmark_pdf.py)
+    EXPORT_CACHE_MAX_MB: int = 500  # Rendered exports kept in EXPORT_DIR
+    EXPORT_CACHE_MAX_AGE_HOURS: int = 72
+    EXPORT_POOL_WORKERS: int = 2  # Renderer processes; also the max concurrent renders
+    EXPORT_BULK_MAX_PAPERS: int = 100  # Papers per bulk ZIP export
+    EXPORT_PRERENDER: bool = True  # Render exports in the background whenever a paper changes
     KEEP_ALIVE_URL: str = ""  # Set to public health URL to prevent Render free-tier spin-down
 
     class Config:
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .config import settings
 
@@ -42,34 +42,62 @@ async def get_db():
         yield session
 
 
+def _column_names(sync_conn, table: str) -> set[str]:
+    return {c["name"] for c in inspect(sync_conn).get_columns(table)}
+
+
+async def _add_column(conn, table: str, column: str, ddl: str) -> bool:
+    """Add a column to an existing table. Returns True if it was missing."""
+    if column in await conn.run_sync(_column_names, table):
+        return False
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def _create_missing_indexes(sync_conn):
+    """Indexes declared on models that existing tables don't have yet."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 async def init_db():
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         # Migrate existing DBs: add missing columns
         # (create_all only creates new tables, it won't ALTER existing ones)
-        if "postgresql" in settings.DATABASE_URL:
-            await conn.execute(
-                text("ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR(20) DEFAULT 'user'")
-            )
-            await conn.execute(
-                text("UPDATE users SET role = 'admin' WHERE role IS NULL")
-            )
-            await conn.execute(
-                text("ALTER TABLE users ADD COLUMN IF NOT EXISTS plain_password VARCHAR(255)")
-            )
-        else:
-            try:
-                await conn.execute(
-                    text("ALTER TABLE users ADD COLUMN role VARCHAR(20) DEFAULT 'user'")
-                )
-            except Exception:
-                pass  # Column already exists
-            await conn.execute(
-                text("UPDATE users SET role = 'admin' WHERE role IS NULL")
-            )
-            try:
-                await conn.execute(
-                    text("ALTER TABLE users ADD COLUMN plain_password VARCHAR(255)")
-                )
-            except Exception:
-                pass  # Column already exists
+        await _add_column(conn, "users", "role", "VARCHAR(20) DEFAULT 'user'")
+        await conn.execute(
+            text("UPDATE users SET role = 'admin' WHERE role IS NULL")
+        )
+        await _add_column(conn, "users", "plain_password", "VARCHAR(255)")
+        await _add_column(conn, "generated_papers", "chat_summary", "TEXT")
+        await _add_column(conn, "generated_papers", "chat_summary_through_id", "INTEGER")
+        if await _add_column(conn, "user_learnings", "learning_key", "TEXT"):
+            from .services.learning_worker import backfill as backfill_learning_keys
+            await backfill_learning_keys(conn)
+        await _add_column(conn, "uploaded_papers", "format_skeleton", "TEXT")
+        await _add_column(conn, "generated_papers", "batch_id", "VARCHAR(32)")
+        await _add_column(conn, "generated_papers", "variant_label", "VARCHAR(5)")
+        await _add_column(conn, "generated_papers", "answer_key_status", "VARCHAR(20)")
+        if await _add_column(conn, "uploaded_papers", "question_count", "INTEGER NOT NULL DEFAULT 0"):
+            await conn.execute(text(
+                "UPDATE uploaded_papers SET question_count = "
+                "(SELECT COUNT(*) FROM extracted_questions WHERE extracted_questions.paper_id = uploaded_papers.id)"
+            ))
+        await _add_column(
+            conn, "extracted_questions", "duplicate_of_id",
+            "INTEGER REFERENCES extracted_questions(id) ON DELETE SET NULL",
+        )
+        # Also covers ix_generated_papers_batch_id and the composite indexes in __table_args__
+        await conn.run_sync(_create_missing_indexes)
+
+        from .services.question_search import init_search
+        await init_search(conn)
+
+        # Before the stats backfill: flagging existing duplicates clears question_stats for a rebuild
+        from .services.question_dedup import backfill as backfill_question_index
+        await backfill_question_index(conn)
+
+        from .services.question_stats import backfill as backfill_question_stats
+        await backfill_question_stats(conn)
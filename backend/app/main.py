@@ -3,8 +3,13 @@ import urllib.request
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from .config import settings
 from .database import init_db
+from .services.learnings_cache import start_broadcast_listener
+from .services.export_pool import export_pool
+from .services import question_stats  # noqa: F401  Registers the flush hook that maintains question_stats
+from .services import question_dedup  # noqa: F401  Registers the flush hook that maintains the similarity index
 from .routers import auth, admin, papers, questions, generation, conversations, export
 
 
@@ -22,22 +27,38 @@ async def _keep_alive():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    start_broadcast_listener()
+    export_pool.start()
     task = None
     if settings.KEEP_ALIVE_URL:
         task = asyncio.create_task(_keep_alive())
     yield
     if task:
         task.cancel()
+    export_pool.shutdown()
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """Gzip API responses, but not exports: PDF, DOCX and ZIP are already compressed."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/api/export"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
 
 app = FastAPI(title="ExamForge API", version="1.0.0", lifespan=lifespan)
 
+app.add_middleware(JSONGZipMiddleware, minimum_size=1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[o.strip() for o in settings.CORS_ORIGINS.split(",")],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 app.include_router(auth.router)
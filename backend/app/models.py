@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Float, Boolean, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 
@@ -28,6 +28,9 @@ class User(Base):
 
 class UploadedPaper(Base):
     __tablename__ = "uploaded_papers"
+    __table_args__ = (
+        Index("ix_uploaded_papers_user_created", "user_id", "created_at"),  # Upload list, newest first
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -37,9 +40,11 @@ class UploadedPaper(Base):
     board = Column(String(50), nullable=True)
     status = Column(String(20), default="pending")  # pending -> extracting -> analyzing -> completed/failed
     extracted_text = Column(Text, nullable=True)
+    format_skeleton = Column(Text, nullable=True)  # Header/sections/numbering/marks layout, used as format reference
     grade_level = Column(String(50), nullable=True)
     subject = Column(String(100), nullable=True)
     topics_json = Column(Text, nullable=True)  # JSON array of topic strings
+    question_count = Column(Integer, nullable=False, default=0)  # Set by paper_processor with the questions
     error_message = Column(Text, nullable=True)
     created_at = Column(DateTime, default=_utcnow)
 
@@ -49,6 +54,18 @@ class UploadedPaper(Base):
 
 class ExtractedQuestion(Base):
     __tablename__ = "extracted_questions"
+    __table_args__ = (
+        # Question bank pages (keyset on id) and per-user counts
+        Index("ix_extracted_questions_user_id_id", "user_id", "id"),
+        # Generation context and the subject/topic filters
+        Index("ix_extracted_questions_user_subject_topic", "user_id", "subject", "topic"),
+        # Topic list and topic filter without a subject
+        Index("ix_extracted_questions_user_topic", "user_id", "topic"),
+        # Per-paper counts and cascade deletes
+        Index("ix_extracted_questions_paper_id", "paper_id"),
+        # Duplicates to promote when their original is deleted
+        Index("ix_extracted_questions_duplicate_of_id", "duplicate_of_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     paper_id = Column(Integer, ForeignKey("uploaded_papers.id", ondelete="CASCADE"), nullable=False)
@@ -66,12 +83,47 @@ class ExtractedQuestion(Base):
     correct_option = Column(String(10), nullable=True)
     bloom_level = Column(String(30), nullable=True)
     order_in_paper = Column(Integer, nullable=False, default=0)
+    # Set at ingest when this is a near-duplicate of an earlier question (services/question_dedup.py)
+    duplicate_of_id = Column(Integer, ForeignKey("extracted_questions.id", ondelete="SET NULL"), nullable=True)
 
     paper = relationship("UploadedPaper", back_populates="questions")
 
 
+class QuestionSignature(Base):
+    """MinHash of a question's normalized text; maintained by services/question_dedup.py."""
+    __tablename__ = "question_signatures"
+
+    question_id = Column(Integer, ForeignKey("extracted_questions.id", ondelete="CASCADE"), primary_key=True)
+    minhash = Column(LargeBinary, nullable=False)  # Empty if the text has nothing to hash
+
+
+class QuestionBucket(Base):
+    """LSH buckets: one row per (question, band); questions sharing a bucket are similarity candidates."""
+    __tablename__ = "question_buckets"
+    __table_args__ = (
+        Index("ix_question_buckets_question_id", "question_id"),  # Removal with the question
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)  # Hash of the band number and the band's MinHash values
+    question_id = Column(Integer, ForeignKey("extracted_questions.id", ondelete="CASCADE"), primary_key=True)
+
+
+class QuestionStat(Base):
+    """Question counts per user by dimension; maintained by services/question_stats.py."""
+    __tablename__ = "question_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    dimension = Column(String(20), primary_key=True)  # total, type, difficulty, subject, grade, board, topic
+    value = Column(String(200), primary_key=True)  # "" for total
+    count = Column(Integer, nullable=False, default=0)
+
+
 class GeneratedPaper(Base):
     __tablename__ = "generated_papers"
+    __table_args__ = (
+        Index("ix_generated_papers_user_created", "user_id", "created_at"),  # Paper list and the daily limit
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -86,7 +138,12 @@ class GeneratedPaper(Base):
     duration_minutes = Column(Integer, nullable=True)
     content_markdown = Column(Text, nullable=True)
     answer_key_markdown = Column(Text, nullable=True)
+    answer_key_status = Column(String(20), nullable=True)  # pending, generating, completed, failed; NULL on legacy rows
     error_message = Column(Text, nullable=True)
+    batch_id = Column(String(32), nullable=True, index=True)  # Shared by the variants of one batch request
+    variant_label = Column(String(5), nullable=True)  # A, B, C...
+    chat_summary = Column(Text, nullable=True)  # Rolling summary of older chat turns
+    chat_summary_through_id = Column(Integer, nullable=True)  # Last Conversation.id folded into chat_summary
     created_at = Column(DateTime, default=_utcnow)
 
     user = relationship("User", back_populates="generated_papers")
@@ -95,6 +152,9 @@ class GeneratedPaper(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_paper_created", "generated_paper_id", "created_at"),  # Chat history in order
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     generated_paper_id = Column(Integer, ForeignKey("generated_papers.id", ondelete="CASCADE"), nullable=False)
@@ -113,8 +173,13 @@ class UserLearning(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     category = Column(String(50), nullable=False, default="general")  # formatting, content, style, structure, general
     learning = Column(Text, nullable=False)
+    learning_key = Column(Text)  # learning_key(learning); unique per user
     source_paper_id = Column(Integer, ForeignKey("generated_papers.id", ondelete="SET NULL"), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime, default=_utcnow)
 
+    __table_args__ = (
+        Index("uq_user_learnings_user_key", "user_id", "learning_key", unique=True),
+    )
+
     user = relationship("User", back_populates="learnings")
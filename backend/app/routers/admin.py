@@ -9,6 +9,10 @@ from ..models import User, UploadedPaper, ExtractedQuestion, GeneratedPaper
 from ..schemas import UserResponse
 from ..utils.auth import hash_password
 from ..utils.deps import get_current_admin
+from ..services.learning_worker import learning_worker
+from ..services import text_normalizer
+from ..services.ingest_scheduler import ingest_scheduler
+from ..services.export_pool import export_pool
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -119,6 +123,19 @@ async def get_admin_stats(
     )
 
 
+@router.get("/metrics")
+async def get_metrics(
+    admin: User = Depends(get_current_admin),
+):
+    """Throughput and lag of background workers in this process."""
+    return {
+        "learning_extraction": learning_worker.metrics(),
+        "text_normalization": text_normalizer.metrics(),
+        "analysis_batching": ingest_scheduler.metrics(),
+        "export_rendering": export_pool.metrics(),
+    }
+
+
 @router.get("/user-detail/{user_id}", response_model=UserDetailResponse)
 async def get_user_detail(
     user_id: int,
@@ -134,9 +151,6 @@ async def get_user_detail(
     papers_uploaded = (await db.execute(
         select(func.count(UploadedPaper.id)).where(UploadedPaper.user_id == user_id)
     )).scalar() or 0
-    questions_extracted = (await db.execute(
-        select(func.count(ExtractedQuestion.id)).where(ExtractedQuestion.user_id == user_id)
-    )).scalar() or 0
     papers_generated = (await db.execute(
         select(func.count(GeneratedPaper.id)).where(GeneratedPaper.user_id == user_id)
     )).scalar() or 0
@@ -148,9 +162,6 @@ async def get_user_detail(
     uploaded_papers_raw = papers_result.scalars().all()
     uploaded_papers = []
     for p in uploaded_papers_raw:
-        qcount = (await db.execute(
-            select(func.count(ExtractedQuestion.id)).where(ExtractedQuestion.paper_id == p.id)
-        )).scalar() or 0
         uploaded_papers.append(UserPaperItem(
             id=p.id,
             original_filename=p.original_filename,
@@ -158,9 +169,11 @@ async def get_user_detail(
             grade_level=p.grade_level,
             subject=p.subject,
             status=p.status,
-            question_count=qcount,
+            question_count=p.question_count,
             created_at=p.created_at,
         ))
+    # Near-duplicates included, so the total matches the per-paper counts
+    questions_extracted = sum(p.question_count for p in uploaded_papers_raw)
 
     # Generated papers
     gen_result = await db.execute(
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
+import asyncio
+import os
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from ..config import settings
 from ..database import get_db
 from ..models import User, GeneratedPaper
+from ..schemas import BulkExportRequest
 from ..utils.deps import get_current_user
-from ..services.export_service import markdown_to_pdf, markdown_to_docx
+from ..utils.http_cache import CACHE_CONTROL, etag_matches, not_modified
+from ..services.export_bundle import BundleEntry, safe_name, stream_bundle
+from ..services.export_cache import MEDIA_TYPES, cache_path
+from ..services.export_pool import open_export
+from ..services.paper_generator import ensure_answer_key
 
 router = APIRouter(prefix="/api/export", tags=["export"])
 
+CHUNK_SIZE = 64 * 1024
+BULK_PARTS = ("paper", "answer_key")
+
 
 async def _get_paper(paper_id: int, db: AsyncSession, user: User) -> GeneratedPaper:
     result = await db.execute(
@@ -23,61 +35,140 @@ async def _get_paper(paper_id: int, db: AsyncSession, user: User) -> GeneratedPa
     return paper
 
 
+async def _answer_key(paper: GeneratedPaper) -> str:
+    """The paper's answer key, generated on first export if it was deferred."""
+    if paper.answer_key_markdown:
+        return paper.answer_key_markdown
+    loop = asyncio.get_event_loop()
+    try:
+        return await loop.run_in_executor(None, ensure_answer_key, paper.id) or ""
+    except Exception:
+        raise HTTPException(502, "Answer key generation failed. Please try again.")
+
+
+async def _export(request: Request, paper: GeneratedPaper, part: str, fmt: str, md_text: str):
+    title = paper.title if part == "paper" else f"{paper.title} - Answer Key"
+    # The cache file name already encodes content hash and renderer, so it doubles as
+    # the ETag and a repeat download is answered before anything is rendered
+    etag = f'"{cache_path(paper.id, part, fmt, md_text, title).stem}"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    try:
+        src = await open_export(paper.id, part, fmt, md_text, title)
+    except Exception:
+        raise HTTPException(500, "Export failed. Please try again.")
+    # Served from the open handle: a newer version finishing meanwhile may delete the file
+    return StreamingResponse(
+        _read_chunks(src), media_type=MEDIA_TYPES[fmt],
+        headers={
+            "Content-Length": str(os.fstat(src.fileno()).st_size),
+            "Content-Disposition": _attachment(f"{title}.{fmt}"),
+            "ETag": etag, "Cache-Control": CACHE_CONTROL,
+        },
+    )
+
+
+async def _read_chunks(src):
+    loop = asyncio.get_event_loop()
+    with src:
+        while chunk := await loop.run_in_executor(None, src.read, CHUNK_SIZE):
+            yield chunk
+
+
+def _attachment(filename: str) -> str:
+    """Content-Disposition for a download, RFC 5987-encoded when the name isn't plain ASCII."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
 @router.get("/{paper_id:int}/pdf")
 async def export_paper_pdf(
     paper_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     paper = await _get_paper(paper_id, db, current_user)
-    pdf_bytes = markdown_to_pdf(paper.content_markdown or "", paper.title)
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{paper.title}.pdf"'},
-    )
+    return await _export(request, paper, "paper", "pdf", paper.content_markdown or "")
 
 
 @router.get("/{paper_id:int}/word")
 async def export_paper_word(
     paper_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     paper = await _get_paper(paper_id, db, current_user)
-    docx_bytes = markdown_to_docx(paper.content_markdown or "", paper.title)
-    return Response(
-        content=docx_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f'attachment; filename="{paper.title}.docx"'},
-    )
+    return await _export(request, paper, "paper", "docx", paper.content_markdown or "")
 
 
 @router.get("/{paper_id:int}/answer-key/pdf")
 async def export_answer_key_pdf(
     paper_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     paper = await _get_paper(paper_id, db, current_user)
-    pdf_bytes = markdown_to_pdf(paper.answer_key_markdown or "", f"{paper.title} - Answer Key")
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{paper.title} - Answer Key.pdf"'},
-    )
+    return await _export(request, paper, "answer_key", "pdf", await _answer_key(paper))
 
 
 @router.get("/{paper_id:int}/answer-key/word")
 async def export_answer_key_word(
     paper_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     paper = await _get_paper(paper_id, db, current_user)
-    docx_bytes = markdown_to_docx(paper.answer_key_markdown or "", f"{paper.title} - Answer Key")
-    return Response(
-        content=docx_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        headers={"Content-Disposition": f'attachment; filename="{paper.title} - Answer Key.docx"'},
+    return await _export(request, paper, "answer_key", "docx", await _answer_key(paper))
+
+
+@router.post("/bulk")
+async def export_bulk(
+    data: BulkExportRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """ZIP of the requested parts and formats for many papers, streamed as renders finish."""
+    paper_ids = list(dict.fromkeys(data.paper_ids))
+    if not paper_ids:
+        raise HTTPException(400, "No papers selected")
+    if len(paper_ids) > settings.EXPORT_BULK_MAX_PAPERS:
+        raise HTTPException(400, f"At most {settings.EXPORT_BULK_MAX_PAPERS} papers per export")
+    parts = [p for p in BULK_PARTS if p in data.parts]
+    formats = [f for f in MEDIA_TYPES if f in data.formats]
+    if not parts or not formats or set(data.parts) - set(parts) or set(data.formats) - set(formats):
+        raise HTTPException(400, f"parts must be from {list(BULK_PARTS)} and formats from {list(MEDIA_TYPES)}")
+
+    result = await db.execute(
+        select(GeneratedPaper).where(
+            GeneratedPaper.id.in_(paper_ids),
+            GeneratedPaper.user_id == current_user.id,
+            GeneratedPaper.status == "completed",
+        )
+    )
+    papers = {p.id: p for p in result.scalars().all()}
+    missing = [i for i in paper_ids if i not in papers]
+    if missing:
+        raise HTTPException(404, f"Completed papers not found: {', '.join(map(str, missing))}")
+
+    # Plain values only: the session is closed before the stream is consumed
+    entries = []
+    for paper_id in paper_ids:
+        paper = papers[paper_id]
+        folder = f"{paper.id} - {safe_name(paper.title)}"
+        for part in parts:
+            title = paper.title if part == "paper" else f"{paper.title} - Answer Key"
+            md_text = (paper.content_markdown or "") if part == "paper" else paper.answer_key_markdown
+            for fmt in formats:
+                entries.append(BundleEntry(f"{folder}/{safe_name(title)}.{fmt}", paper.id, part, fmt, title, md_text))
+
+    return StreamingResponse(
+        stream_bundle(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="exam-papers.zip"'},
     )
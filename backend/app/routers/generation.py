@@ -1,7 +1,9 @@
+import asyncio
 import json
 import threading
+import uuid
 from datetime import date, datetime
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from ..config import settings
@@ -9,37 +11,56 @@ from ..database import get_db
 from ..models import User, GeneratedPaper, Conversation, UserLearning
 from ..schemas import (
     GeneratePaperRequest, GeneratedPaperResponse, GeneratedPaperListResponse,
-    PaperStatusResponse, ChatMessageRequest, ConversationResponse, UserLearningResponse,
+    BatchGeneratePaperRequest, BatchPaperItem, BatchStatusResponse,
+    PaperStatusResponse, AnswerKeyResponse, ChatMessageRequest, ConversationResponse, UserLearningResponse,
 )
 from ..utils.deps import get_current_user
-from ..services.paper_generator import generate_paper_background, refine_paper_with_chat
+from ..utils.http_cache import make_etag, etag_matches, not_modified, json_with_etag
+from ..services.paper_generator import (
+    generate_paper_background, assemble_paper_background, generate_batch_background, ensure_answer_key,
+)
+from ..services.chat_queue import submit_chat_message
+from ..services.context_cache import invalidate_paper
+from ..services.export_cache import drop_paper
+from ..services.export_pool import export_pool
+from ..services import learnings_cache
 
 router = APIRouter(prefix="/api/generate", tags=["generation"])
 
 
-@router.post("", response_model=GeneratedPaperResponse)
-async def create_paper(
-    data: GeneratePaperRequest,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    # Rate limit: max papers per day
-    today_start = datetime.combine(date.today(), datetime.min.time())
-    count_result = await db.execute(
-        select(func.count(GeneratedPaper.id)).where(
-            GeneratedPaper.user_id == current_user.id,
-            GeneratedPaper.created_at >= today_start,
-        )
+MAX_BATCH_VARIANTS = 6
+ANSWER_KEY_MODES = ("eager", "background", "on_demand")
+
+
+def _validate_options(data: GeneratePaperRequest):
+    if data.mode not in ("generate", "assemble"):
+        raise HTTPException(400, "Mode must be 'generate' or 'assemble'")
+    if data.answer_key not in ANSWER_KEY_MODES:
+        raise HTTPException(400, "answer_key must be 'eager', 'background' or 'on_demand'")
+
+
+def _created_since_query(user_id: int, since: datetime):
+    return select(func.count(GeneratedPaper.id)).where(
+        GeneratedPaper.user_id == user_id,
+        GeneratedPaper.created_at >= since,
     )
+
+
+async def _check_daily_limit(db: AsyncSession, user: User, requested: int = 1):
+    """Rate limit: max papers per day."""
+    today_start = datetime.combine(date.today(), datetime.min.time())
+    count_result = await db.execute(_created_since_query(user.id, today_start))
     today_count = count_result.scalar() or 0
-    if today_count >= settings.RATE_LIMIT_PAPERS_PER_DAY:
+    if today_count + requested > settings.RATE_LIMIT_PAPERS_PER_DAY:
         raise HTTPException(
             429,
             f"Daily limit reached ({settings.RATE_LIMIT_PAPERS_PER_DAY} papers/day). Try again tomorrow.",
         )
 
-    paper = GeneratedPaper(
-        user_id=current_user.id,
+
+def _new_paper(data: GeneratePaperRequest, user: User, **extra) -> GeneratedPaper:
+    fields = dict(
+        user_id=user.id,
         title=data.title,
         board=data.board,
         grade_level=data.grade_level,
@@ -50,35 +71,126 @@ async def create_paper(
         duration_minutes=data.duration_minutes,
         status="generating",
     )
+    fields.update(extra)
+    return GeneratedPaper(**fields)
+
+
+@router.post("", response_model=GeneratedPaperResponse)
+async def create_paper(
+    data: GeneratePaperRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _validate_options(data)
+    await _check_daily_limit(db, current_user)
+
+    paper = _new_paper(data, current_user)
     db.add(paper)
     await db.commit()
     await db.refresh(paper)
 
+    if data.mode == "assemble":
+        target, args = assemble_paper_background, (paper.id, data.question_types, data.polish)
+    else:
+        target, args = generate_paper_background, (paper.id, data.answer_key)
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+    return GeneratedPaperResponse.model_validate(paper)
+
+
+@router.post("/batch", response_model=BatchStatusResponse)
+async def create_paper_batch(
+    data: BatchGeneratePaperRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Generate Set A/B/C... of the same paper with no question shared between sets.
+
+    Assembled sets draw disjoint bank questions. Generated sets are compared after
+    generation; a set that repeats another set's question is regenerated, and marked
+    failed if it still does.
+    """
+    _validate_options(data)
+    if not 2 <= data.variant_count <= MAX_BATCH_VARIANTS:
+        raise HTTPException(400, f"variant_count must be between 2 and {MAX_BATCH_VARIANTS}")
+    await _check_daily_limit(db, current_user, data.variant_count)
+
+    batch_id = uuid.uuid4().hex
+    papers = []
+    for label in "ABCDEF"[:data.variant_count]:
+        paper = _new_paper(data, current_user, title=f"{data.title} — Set {label}", batch_id=batch_id, variant_label=label)
+        db.add(paper)
+        papers.append(paper)
+    await db.commit()
+
     threading.Thread(
-        target=generate_paper_background,
-        args=(paper.id,),
+        target=generate_batch_background,
+        args=([p.id for p in papers], data.mode, data.question_types, data.polish, data.answer_key),
         daemon=True,
     ).start()
 
-    return GeneratedPaperResponse.model_validate(paper)
+    return _batch_status(batch_id, papers)
 
 
-@router.get("", response_model=list[GeneratedPaperListResponse])
-async def list_papers(
+def _batch_status(batch_id: str, papers: list[GeneratedPaper]) -> BatchStatusResponse:
+    statuses = [p.status for p in papers]
+    completed, failed = statuses.count("completed"), statuses.count("failed")
+    if completed + failed < len(papers):
+        status = "generating"
+    elif failed == 0:
+        status = "completed"
+    elif completed == 0:
+        status = "failed"
+    else:
+        status = "partial"
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        status=status,
+        total=len(papers),
+        completed=completed,
+        failed=failed,
+        papers=[BatchPaperItem.model_validate(p) for p in papers],
+    )
+
+
+@router.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(
+    batch_id: str,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     result = await db.execute(
         select(GeneratedPaper)
-        .where(GeneratedPaper.user_id == current_user.id)
+        .where(GeneratedPaper.batch_id == batch_id, GeneratedPaper.user_id == current_user.id)
+        .order_by(GeneratedPaper.variant_label)
+    )
+    papers = result.scalars().all()
+    if not papers:
+        raise HTTPException(404, "Batch not found")
+    return _batch_status(batch_id, papers)
+
+
+def _generated_papers_query(user_id: int):
+    return (
+        select(GeneratedPaper)
+        .where(GeneratedPaper.user_id == user_id)
         .order_by(GeneratedPaper.created_at.desc())
     )
+
+
+@router.get("", response_model=list[GeneratedPaperListResponse])
+async def list_papers(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    result = await db.execute(_generated_papers_query(current_user.id))
     return [GeneratedPaperListResponse.model_validate(p) for p in result.scalars().all()]
 
 
 @router.get("/{paper_id:int}", response_model=GeneratedPaperResponse)
 async def get_paper(
     paper_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -91,7 +203,9 @@ async def get_paper(
     paper = result.scalar_one_or_none()
     if not paper:
         raise HTTPException(404, "Paper not found")
-    return GeneratedPaperResponse.model_validate(paper)
+    # The View page refetches after every chat turn; unchanged papers come back as a bodiless 304
+    etag = make_etag(*(getattr(paper, field) for field in GeneratedPaperResponse.model_fields))
+    return json_with_etag(request, etag, lambda: GeneratedPaperResponse.model_validate(paper).model_dump_json())
 
 
 @router.get("/{paper_id:int}/status")
@@ -112,6 +226,33 @@ async def get_paper_status(
     return {"id": paper.id, "status": paper.status, "error_message": paper.error_message}
 
 
+@router.get("/{paper_id:int}/answer-key", response_model=AnswerKeyResponse)
+async def get_answer_key(
+    paper_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Return the answer key, generating it first if the paper was created without one."""
+    result = await db.execute(
+        select(GeneratedPaper).where(
+            GeneratedPaper.id == paper_id,
+            GeneratedPaper.user_id == current_user.id,
+        )
+    )
+    paper = result.scalar_one_or_none()
+    if not paper or paper.status != "completed":
+        raise HTTPException(404, "Completed paper not found")
+
+    answer_key = paper.answer_key_markdown
+    if not answer_key:
+        loop = asyncio.get_event_loop()
+        try:
+            answer_key = await loop.run_in_executor(None, ensure_answer_key, paper_id)
+        except Exception:
+            raise HTTPException(502, "Answer key generation failed. Please try again.")
+    return AnswerKeyResponse(paper_id=paper_id, status="completed", answer_key_markdown=answer_key or "")
+
+
 @router.post("/{paper_id:int}/chat")
 async def chat_with_paper(
     paper_id: int,
@@ -129,11 +270,9 @@ async def chat_with_paper(
     if not result.scalar_one_or_none():
         raise HTTPException(404, "Paper not found")
 
-    # Run synchronous chat in thread
-    import asyncio
-    loop = asyncio.get_event_loop()
-    paper, conversations = await loop.run_in_executor(
-        None, refine_paper_with_chat, paper_id, data.message, current_user.id
+    # Serialized per paper; messages sent mid-turn are coalesced into the next Gemini call
+    paper, conversations = await asyncio.wrap_future(
+        submit_chat_message(paper_id, data.message, current_user.id)
     )
 
     if paper is None:
@@ -162,18 +301,39 @@ async def delete_paper(
         raise HTTPException(404, "Paper not found")
     await db.delete(paper)
     await db.commit()
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, invalidate_paper, paper_id)
+    export_pool.forget_paper(paper_id)
+    await loop.run_in_executor(None, drop_paper, paper_id)
     return {"detail": "Paper deleted"}
 
 
+def _chat_version_query(paper_id: int):
+    return (
+        select(func.count(Conversation.id), func.max(Conversation.id))
+        .where(Conversation.generated_paper_id == paper_id)
+    )
+
+
+def _chat_history_query(paper_id: int):
+    return (
+        select(Conversation)
+        .where(Conversation.generated_paper_id == paper_id)
+        .order_by(Conversation.created_at)
+    )
+
+
 @router.get("/{paper_id:int}/chat", response_model=list[ConversationResponse])
 async def get_chat_history(
     paper_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     # Verify ownership
     result = await db.execute(
-        select(GeneratedPaper).where(
+        select(GeneratedPaper.id).where(
             GeneratedPaper.id == paper_id,
             GeneratedPaper.user_id == current_user.id,
         )
@@ -181,12 +341,16 @@ async def get_chat_history(
     if not result.scalar_one_or_none():
         raise HTTPException(404, "Paper not found")
 
-    result = await db.execute(
-        select(Conversation)
-        .where(Conversation.generated_paper_id == paper_id)
-        .order_by(Conversation.created_at)
-    )
-    return [ConversationResponse.model_validate(c) for c in result.scalars().all()]
+    # Messages are only ever appended (or deleted with the paper), so count + newest id
+    # identifies the history without loading it
+    result = await db.execute(_chat_version_query(paper_id))
+    etag = make_etag("chat", paper_id, *result.one())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    result = await db.execute(_chat_history_query(paper_id))
+    history = [ConversationResponse.model_validate(c).model_dump(mode="json") for c in result.scalars().all()]
+    return json_with_etag(request, etag, lambda: json.dumps(history))
 
 
 # ── Learnings ──────────────────────────────────────────────────────────────
@@ -196,12 +360,12 @@ async def list_learnings(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    result = await db.execute(
-        select(UserLearning)
-        .where(UserLearning.user_id == current_user.id, UserLearning.is_active == True)
-        .order_by(UserLearning.created_at.desc())
-    )
-    return [UserLearningResponse.model_validate(l) for l in result.scalars().all()]
+    entry = learnings_cache.get(current_user.id)
+    if entry is None:
+        loaded_version = learnings_cache.version(current_user.id)
+        result = await db.execute(learnings_cache.active_learnings_query(current_user.id))
+        entry = learnings_cache.store(current_user.id, result.all(), loaded_version)
+    return [UserLearningResponse.model_validate(l) for l in entry.rows]
 
 
 @router.delete("/learnings/{learning_id:int}")
@@ -221,4 +385,7 @@ async def delete_learning(
         raise HTTPException(404, "Learning not found")
     await db.delete(learning)
     await db.commit()
+
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, learnings_cache.invalidate_user, current_user.id)
     return {"detail": "Learning deleted"}
@@ -3,9 +3,9 @@ import threading
 from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select
 from ..database import get_db
-from ..models import User, UploadedPaper, ExtractedQuestion
+from ..models import User, UploadedPaper
 from ..schemas import UploadedPaperResponse, PaperStatusResponse
 from ..utils.deps import get_current_user
 from ..config import settings
@@ -60,37 +60,24 @@ async def upload_paper(
         daemon=True,
     ).start()
 
-    resp = UploadedPaperResponse.model_validate(paper)
-    resp.question_count = 0
-    return resp
+    return UploadedPaperResponse.model_validate(paper)
 
 
-@router.get("", response_model=list[UploadedPaperResponse])
-async def list_papers(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    result = await db.execute(
+def _uploaded_papers_query(user_id: int):
+    return (
         select(UploadedPaper)
-        .where(UploadedPaper.user_id == current_user.id)
+        .where(UploadedPaper.user_id == user_id)
         .order_by(UploadedPaper.created_at.desc())
     )
-    papers = result.scalars().all()
 
-    # Get question counts
-    counts_result = await db.execute(
-        select(ExtractedQuestion.paper_id, func.count(ExtractedQuestion.id))
-        .where(ExtractedQuestion.user_id == current_user.id)
-        .group_by(ExtractedQuestion.paper_id)
-    )
-    counts = dict(counts_result.all())
 
-    responses = []
-    for p in papers:
-        resp = UploadedPaperResponse.model_validate(p)
-        resp.question_count = counts.get(p.id, 0)
-        responses.append(resp)
-    return responses
+@router.get("", response_model=list[UploadedPaperResponse])
+async def list_papers(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    result = await db.execute(_uploaded_papers_query(current_user.id))
+    return [UploadedPaperResponse.model_validate(p) for p in result.scalars().all()]
 
 
 @router.get("/{paper_id:int}", response_model=UploadedPaperResponse)
@@ -108,13 +95,7 @@ async def get_paper(
     paper = result.scalar_one_or_none()
     if not paper:
         raise HTTPException(404, "Paper not found")
-
-    count_result = await db.execute(
-        select(func.count(ExtractedQuestion.id)).where(ExtractedQuestion.paper_id == paper_id)
-    )
-    resp = UploadedPaperResponse.model_validate(paper)
-    resp.question_count = count_result.scalar() or 0
-    return resp
+    return UploadedPaperResponse.model_validate(paper)
 
 
 @router.get("/{paper_id:int}/status", response_model=PaperStatusResponse)
@@ -133,15 +114,11 @@ async def get_paper_status(
     if not paper:
         raise HTTPException(404, "Paper not found")
 
-    count_result = await db.execute(
-        select(func.count(ExtractedQuestion.id)).where(ExtractedQuestion.paper_id == paper_id)
-    )
-
     return PaperStatusResponse(
         id=paper.id,
         status=paper.status,
         error_message=paper.error_message,
-        question_count=count_result.scalar() or 0,
+        question_count=paper.question_count,
     )
 
 
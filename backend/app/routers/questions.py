@@ -1,16 +1,83 @@
-from fastapi import APIRouter, Depends, Query
+import base64
+import binascii
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, distinct
+from sqlalchemy import select, func
 from typing import Optional
 from ..database import get_db
-from ..models import User, ExtractedQuestion
-from ..schemas import ExtractedQuestionResponse, QuestionStatsResponse
+from ..models import User, ExtractedQuestion, QuestionStat
+from ..schemas import ExtractedQuestionResponse, QuestionListItem, QuestionStatsResponse, SimilarQuestionResponse
 from ..utils.deps import get_current_user
+from ..services.question_search import apply_search
+from ..services.question_dedup import find_similar
+from ..services.question_stats import TOTAL
 
 router = APIRouter(prefix="/api/questions", tags=["questions"])
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Fields `fields` can select: the response schema's, where a column backs them
+QUESTION_FIELDS = tuple(f for f in ExtractedQuestionResponse.model_fields if f in ExtractedQuestion.__table__.c)
 
-@router.get("", response_model=list[ExtractedQuestionResponse])
+
+def _encode_cursor(mode: str, position: int, total: int, seen: Optional[int]) -> str:
+    """mode "id": keyset position (last id seen); mode "offset": rows already returned (ranked search).
+
+    `seen` counts the rows returned so far, so the last page can report an exact total
+    (None when resuming a cursor issued before it was tracked).
+    """
+    raw = json.dumps({mode: position, "total": total, "seen": seen}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, mode: str) -> tuple[int, int, Optional[int]]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        seen = data.get("seen")
+        return int(data[mode]), int(data["total"]), None if seen is None else int(seen)
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def _projection(fields: Optional[str]) -> list[str]:
+    if not fields:
+        return list(QUESTION_FIELDS)
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(wanted) - set(QUESTION_FIELDS)
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    return ["id"] + [f for f in QUESTION_FIELDS if f in wanted and f != "id"]
+
+
+def _bank_filters(user_id: int, include_duplicates: bool = False, **equal_to: Optional[str]) -> list:
+    """WHERE clauses for a user's questions; `column=value` filters with no value are skipped."""
+    filters = [ExtractedQuestion.user_id == user_id]
+    if not include_duplicates:
+        filters.append(ExtractedQuestion.duplicate_of_id.is_(None))
+    return filters + [
+        getattr(ExtractedQuestion, column) == value for column, value in equal_to.items() if value
+    ]
+
+
+def _rows_query(columns: list[str], filters: list):
+    return select(*(getattr(ExtractedQuestion, c) for c in columns)).where(*filters)
+
+
+def _count_query(filters: list):
+    return select(func.count(ExtractedQuestion.id)).where(*filters)
+
+
+def _keyset_page(stmt, after_id: Optional[int]):
+    """Newest first, starting below `after_id` (the last id of the previous page)."""
+    if after_id is not None:
+        stmt = stmt.where(ExtractedQuestion.id < after_id)
+    return stmt.order_by(ExtractedQuestion.id.desc())
+
+
+# Rows skip response_model validation, so the schema is only documented
+@router.get("", responses={200: {"model": list[QuestionListItem], "description": "One page of questions"}})
 async def list_questions(
     board: Optional[str] = Query(None),
     grade_level: Optional[str] = Query(None),
@@ -19,56 +86,129 @@ async def list_questions(
     difficulty: Optional[str] = Query(None),
     topic: Optional[str] = Query(None),
     bloom_level: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, description="Full-text search over question text, answer and topic"),
+    include_duplicates: bool = Query(False, description="Also list questions flagged as near-duplicates"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    q = select(ExtractedQuestion).where(ExtractedQuestion.user_id == current_user.id)
-    if board:
-        q = q.where(ExtractedQuestion.board == board)
-    if grade_level:
-        q = q.where(ExtractedQuestion.grade_level == grade_level)
-    if subject:
-        q = q.where(ExtractedQuestion.subject == subject)
-    if question_type:
-        q = q.where(ExtractedQuestion.question_type == question_type)
-    if difficulty:
-        q = q.where(ExtractedQuestion.difficulty == difficulty)
-    if topic:
-        q = q.where(ExtractedQuestion.topic == topic)
-    if bloom_level:
-        q = q.where(ExtractedQuestion.bloom_level == bloom_level)
-
-    q = q.order_by(ExtractedQuestion.id.desc())
-    result = await db.execute(q)
-    return [ExtractedQuestionResponse.model_validate(r) for r in result.scalars().all()]
+    """One page of the user's questions, newest first (best match first with q).
 
+    Paging is keyset on id, so every page is an index range read however deep it
+    is; ranked search results page by offset. The next page's cursor and the total
+    match count come back in the X-Next-Cursor and X-Total-Count headers. The count
+    is taken once, on the first page, and carried in the cursor, so pages in the
+    middle of a scroll don't see questions added or removed since; the last page
+    reports the exact number of rows the scroll returned.
 
-@router.get("/stats", response_model=QuestionStatsResponse)
-async def question_stats(
+    Rows are returned as plain JSON without model validation, holding only the
+    requested `fields` (see QuestionListItem).
+    """
+    columns = _projection(fields)
+    filters = _bank_filters(
+        current_user.id, board=board, grade_level=grade_level, subject=subject,
+        question_type=question_type, difficulty=difficulty, topic=topic, bloom_level=bloom_level,
+        include_duplicates=include_duplicates,
+    )
+
+    stmt = _rows_query(columns, filters)
+    count_stmt = _count_query(filters)
+    total = None
+    seen = 0  # Rows returned by earlier pages
+    search = q.strip() if q else ""
+    if search:
+        stmt, rank = apply_search(stmt, search)
+        if stmt is None:
+            return JSONResponse([], headers={"X-Total-Count": "0"})
+        count_stmt, _ = apply_search(count_stmt, search)
+        offset = 0
+        if cursor:
+            offset, total, _ = _decode_cursor(cursor, "offset")
+            seen = offset
+        stmt = stmt.order_by(rank, ExtractedQuestion.id.desc()).offset(offset)
+    else:
+        after_id = None
+        if cursor:
+            after_id, total, seen = _decode_cursor(cursor, "id")
+        stmt = _keyset_page(stmt, after_id)
+    rows = [dict(r) for r in (await db.execute(stmt.limit(limit + 1))).mappings().all()]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not has_more and seen is not None:
+        total = seen + len(rows)
+    elif total is None:
+        total = (await db.execute(count_stmt)).scalar() or 0
+
+    headers = {"X-Total-Count": str(total)}
+    if has_more:
+        if search:
+            headers["X-Next-Cursor"] = _encode_cursor("offset", offset + limit, total, offset + limit)
+        else:
+            headers["X-Next-Cursor"] = _encode_cursor("id", rows[-1]["id"], total, None if seen is None else seen + limit)
+    return JSONResponse(rows, headers=headers)
+
+
+def _stats_query(user_id: int):
+    return (
+        select(QuestionStat.dimension, QuestionStat.value, QuestionStat.count)
+        .where(QuestionStat.user_id == user_id)
+    )
+
+
+def _topics_query(user_id: int):
+    return (
+        select(QuestionStat.value)
+        .where(QuestionStat.user_id == user_id, QuestionStat.dimension == "topic")
+        .order_by(QuestionStat.value)
+    )
+
+
+@router.get("/{question_id:int}/similar", response_model=list[SimilarQuestionResponse])
+async def similar_questions(
+    question_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    min_similarity: float = Query(0.6, ge=0, le=1),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    base = select(ExtractedQuestion).where(ExtractedQuestion.user_id == current_user.id)
+    """The user's questions whose text is closest to this one, duplicates included."""
+    question = await db.get(ExtractedQuestion, question_id)
+    if not question or question.user_id != current_user.id:
+        raise HTTPException(404, "Question not found")
 
-    total = await db.execute(select(func.count()).select_from(base.subquery()))
-    total_count = total.scalar() or 0
+    matches = await db.run_sync(
+        lambda session: find_similar(session.connection(), question_id, current_user.id, limit, min_similarity)
+    )
+    if not matches:
+        return []
+    result = await db.execute(select(ExtractedQuestion).where(ExtractedQuestion.id.in_([m[0] for m in matches])))
+    by_id = {q.id: q for q in result.scalars().all()}
+    return [
+        SimilarQuestionResponse(**ExtractedQuestionResponse.model_validate(by_id[qid]).model_dump(), similarity=score)
+        for qid, score in matches if qid in by_id
+    ]
 
-    async def group_counts(column):
-        result = await db.execute(
-            select(column, func.count())
-            .where(ExtractedQuestion.user_id == current_user.id)
-            .where(column.isnot(None))
-            .group_by(column)
-        )
-        return {str(k): v for k, v in result.all()}
+
+@router.get("/stats", response_model=QuestionStatsResponse)
+async def question_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    result = await db.execute(_stats_query(current_user.id))
+    counts: dict[str, dict[str, int]] = {}
+    for dimension, value, count in result.all():
+        counts.setdefault(dimension, {})[value] = count
 
     return QuestionStatsResponse(
-        total_questions=total_count,
-        by_type=await group_counts(ExtractedQuestion.question_type),
-        by_difficulty=await group_counts(ExtractedQuestion.difficulty),
-        by_subject=await group_counts(ExtractedQuestion.subject),
-        by_grade=await group_counts(ExtractedQuestion.grade_level),
-        by_board=await group_counts(ExtractedQuestion.board),
+        total_questions=counts.get(TOTAL, {}).get("", 0),
+        by_type=counts.get("type", {}),
+        by_difficulty=counts.get("difficulty", {}),
+        by_subject=counts.get("subject", {}),
+        by_grade=counts.get("grade", {}),
+        by_board=counts.get("board", {}),
     )
 
 
@@ -77,10 +217,5 @@ async def list_topics(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    result = await db.execute(
-        select(distinct(ExtractedQuestion.topic))
-        .where(ExtractedQuestion.user_id == current_user.id)
-        .where(ExtractedQuestion.topic.isnot(None))
-        .order_by(ExtractedQuestion.topic)
-    )
+    result = await db.execute(_topics_query(current_user.id))
     return [row[0] for row in result.all()]
@@ -88,11 +88,36 @@ class ExtractedQuestionResponse(BaseModel):
     correct_option: Optional[str]
     bloom_level: Optional[str]
     order_in_paper: int
+    duplicate_of_id: Optional[int] = None
 
     class Config:
         from_attributes = True
 
 
+class QuestionListItem(BaseModel):
+    """A GET /api/questions row: only the fields asked for with `fields` (all by default) are present."""
+    id: int
+    paper_id: Optional[int] = None
+    question_text: Optional[str] = None
+    answer_text: Optional[str] = None
+    question_type: Optional[str] = None
+    difficulty: Optional[str] = None
+    board: Optional[str] = None
+    grade_level: Optional[str] = None
+    subject: Optional[str] = None
+    topic: Optional[str] = None
+    marks: Optional[float] = None
+    options_json: Optional[str] = None
+    correct_option: Optional[str] = None
+    bloom_level: Optional[str] = None
+    order_in_paper: Optional[int] = None
+    duplicate_of_id: Optional[int] = None
+
+
+class SimilarQuestionResponse(ExtractedQuestionResponse):
+    similarity: float  # Estimated, 0-1
+
+
 class QuestionStatsResponse(BaseModel):
     total_questions: int
     by_type: dict
@@ -114,6 +139,39 @@ class GeneratePaperRequest(BaseModel):
     total_marks: Optional[float] = None
     duration_minutes: Optional[int] = None
     additional_instructions: Optional[str] = None
+    mode: str = "generate"  # generate (Gemini) | assemble (pick from the question bank, no LLM)
+    polish: bool = False  # assemble only: optional Gemini formatting pass
+    answer_key: str = "eager"  # generate only: eager (same call) | background | on_demand
+
+
+class BatchGeneratePaperRequest(GeneratePaperRequest):
+    variant_count: int = 3
+
+
+class BulkExportRequest(BaseModel):
+    paper_ids: list[int]
+    parts: list[str] = ["paper", "answer_key"]  # paper | answer_key
+    formats: list[str] = ["pdf"]  # pdf | docx
+
+
+class BatchPaperItem(BaseModel):
+    id: int
+    title: str
+    variant_label: Optional[str]
+    status: str
+    error_message: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str  # generating, completed, partial, failed
+    total: int
+    completed: int
+    failed: int
+    papers: list[BatchPaperItem]
 
 
 class GeneratedPaperResponse(BaseModel):
@@ -129,13 +187,22 @@ class GeneratedPaperResponse(BaseModel):
     duration_minutes: Optional[int]
     content_markdown: Optional[str]
     answer_key_markdown: Optional[str]
+    answer_key_status: Optional[str] = None
     error_message: Optional[str]
+    batch_id: Optional[str] = None
+    variant_label: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class AnswerKeyResponse(BaseModel):
+    paper_id: int
+    status: str
+    answer_key_markdown: str
+
+
 class GeneratedPaperListResponse(BaseModel):
     id: int
     title: str
@@ -0,0 +1,101 @@
+"""Keep the refinement chat history bounded: recent turns verbatim, older turns folded into a rolling summary."""
+
+import logging
+from ..config import settings
+from ..utils.tokens import estimate_tokens, CHARS_PER_TOKEN
+
+log = logging.getLogger(__name__)
+
+ANSWER_KEY_MARKER = "===ANSWER_KEY==="
+
+# Assistant turns that rewrote the paper are superseded by the paper in the system context
+PAPER_UPDATED_NOTE = "[Updated the paper and answer key — the current version is in the paper context above.]"
+
+SUMMARY_PROMPT = """You maintain a running summary of a chat in which a teacher refines an exam paper with an AI assistant.
+Update the summary with the new messages below.
+
+RULES:
+- Keep every instruction, constraint, or decision the teacher made that still applies (e.g. "Section B uses only 3-mark questions")
+- Drop greetings, acknowledgements, and requests that were later reversed
+- Do NOT reproduce paper or answer key content
+- At most 12 short bullet points
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+Updated summary:"""
+
+
+def compact_message(role: str, content: str) -> str:
+    """Replace full-paper assistant outputs with a short note."""
+    if role == "assistant" and ANSWER_KEY_MARKER in content:
+        return PAPER_UPDATED_NOTE
+    return content
+
+
+def _fold_into_summary(client, summary: str | None, messages: list) -> str:
+    lines = "\n".join(
+        f"{m.role.upper()}: {compact_message(m.role, m.content)[:1500]}" for m in messages
+    )
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none yet)", messages=lines)
+    response = client.models.generate_content(model=settings.GEMINI_MODEL, contents=prompt)
+    return response.text.strip()
+
+
+def condense_history(paper, conversations: list, client) -> list[tuple[str, str]]:
+    """Return (role, text) turns to replay for `paper`, updating its rolling summary in place.
+
+    `conversations` are the paper's messages newer than `paper.chat_summary_through_id`,
+    oldest first, excluding the message about to be sent. The tail that fits the token
+    budget is kept verbatim. Messages before it are folded into `paper.chat_summary` in
+    batches of CHAT_FOLD_BATCH_MESSAGES (sooner if they no longer fit the budget), so
+    most turns make no summary call; until then, or if the fold fails, the newest of
+    them that still fit the budget are replayed verbatim too. The caller is responsible
+    for committing the paper.
+    """
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET - settings.CHAT_SUMMARY_MAX_TOKENS
+    kept = []
+    for conv in reversed(conversations[-settings.CHAT_VERBATIM_MESSAGES:]):
+        text = compact_message(conv.role, conv.content)
+        cost = estimate_tokens(text)
+        if cost > budget:
+            break
+        kept.append((conv.role, text))
+        budget -= cost
+    kept.reverse()
+    # Gemini history should resume on a user turn
+    while kept and kept[0][0] != "user":
+        kept.pop(0)
+
+    aged = conversations[:len(conversations) - len(kept)]
+    aged_texts = [compact_message(conv.role, conv.content) for conv in aged]
+    if len(aged) >= settings.CHAT_FOLD_BATCH_MESSAGES or sum(map(estimate_tokens, aged_texts)) > budget:
+        try:
+            paper.chat_summary = _fold_into_summary(client, paper.chat_summary, aged)
+            paper.chat_summary_through_id = aged[-1].id
+            aged, aged_texts = [], []
+        except Exception as e:
+            # Non-critical: replay what fits this turn and retry the fold next turn
+            log.warning("Chat summary update failed for paper %d: %s", paper.id, e)
+
+    # Unfolded messages still count against the budget; the oldest are dropped if they don't fit
+    replay = []
+    for conv, text in zip(reversed(aged), reversed(aged_texts)):
+        cost = estimate_tokens(text)
+        if cost > budget:
+            break
+        replay.append((conv.role, text))
+        budget -= cost
+    replay.reverse()
+    kept = replay + kept
+    while kept and kept[0][0] != "user":
+        kept.pop(0)
+
+    if paper.chat_summary:
+        max_chars = settings.CHAT_SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN
+        paper.chat_summary = paper.chat_summary[:max_chars]
+
+    return kept
@@ -0,0 +1,59 @@
+"""Serialize chat refinements per paper and coalesce messages that arrive mid-turn.
+
+At most one refine_paper_with_chat call runs per paper in this process. Messages
+submitted while a turn is in flight are queued and answered together by the next
+single Gemini call; every caller's future resolves with that call's result.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from .paper_generator import refine_paper_with_chat
+
+log = logging.getLogger(__name__)
+
+
+class _PaperQueue:
+    def __init__(self):
+        self.pending: list[tuple[str, int, Future]] = []
+        self.running = False
+
+
+_queues: dict[int, _PaperQueue] = {}
+_lock = threading.Lock()
+
+
+def submit_chat_message(paper_id: int, user_message: str, user_id: int) -> Future:
+    """Queue a message for a paper. Resolves to (paper, conversations) like refine_paper_with_chat."""
+    future = Future()
+    with _lock:
+        queue = _queues.setdefault(paper_id, _PaperQueue())
+        queue.pending.append((user_message, user_id, future))
+        if queue.running:
+            return future
+        queue.running = True
+
+    threading.Thread(target=_drain, args=(paper_id,), daemon=True).start()
+    return future
+
+
+def _drain(paper_id: int):
+    """Worker for one paper: run turns until no messages are left."""
+    while True:
+        with _lock:
+            queue = _queues[paper_id]
+            batch, queue.pending = queue.pending, []
+            if not batch:
+                del _queues[paper_id]
+                return
+
+        if len(batch) > 1:
+            log.info("Coalesced %d chat messages for paper %d", len(batch), paper_id)
+        try:
+            result = refine_paper_with_chat(paper_id, [m for m, _, _ in batch], batch[0][1])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, _, future in batch:
+                future.set_result(result)
@@ -1,19 +1,34 @@
-"""Send extracted text to Gemini for question extraction and analysis."""
+"""Send extracted text to Gemini for question extraction and analysis.
+
+Analysis uses schema-constrained JSON output. If a response is cut short or
+damaged, every complete question object in it is kept, and only the text after
+the last recovered question is sent again. analyze_papers_batch() packs several
+small papers into one call (see ingest_scheduler).
+"""
 
 import json
 import logging
+import re
+from typing import Optional
+from pydantic import BaseModel, ValidationError
 from google import genai
+from google.genai import types
 from ..config import settings
 
 log = logging.getLogger(__name__)
 
-ANALYSIS_PROMPT = """You are an expert education analyst. Analyze the following exam paper text and extract every question.
+ANALYSIS_WINDOW_CHARS = 50000  # Paper text sent per call
+MAX_ANALYSIS_CALLS = 4  # First call + re-requests for missing ranges
+LOCATE_WORDS = 6  # Leading words used to find a recovered question in the source text
+
+QUESTION_TYPES = ("mcq", "short_answer", "long_answer", "fill_blank", "true_false")
+DIFFICULTIES = ("easy", "medium", "hard")
 
-CRITICAL RULE — Sub-parts:
+QUESTION_RULES = """CRITICAL RULE — Sub-parts:
 If a question has sub-parts (e.g. 1a, 1b, 1c or 1(i), 1(ii) or Q3 part A, part B), do NOT treat each sub-part as a separate question. Instead, combine ALL sub-parts into ONE question entry. The "question_text" should include the full parent question along with all its sub-parts exactly as they appear.
 
 For each question, return a JSON object with these fields:
-- "question_text": the full question text INCLUDING all sub-parts (a, b, c, i, ii, etc.) as a single combined entry
+- "question_text": the full question text INCLUDING all sub-parts (a, b, c, i, ii, etc.) as a single combined entry, copied exactly as it appears in the paper
 - "answer_text": the answer if provided (include answers for all sub-parts), else null
 - "question_type": one of "mcq", "short_answer", "long_answer", "fill_blank", "true_false"
 - "difficulty": one of "easy", "medium", "hard"
@@ -23,15 +38,150 @@ For each question, return a JSON object with these fields:
 - "correct_option": correct option letter for MCQs (e.g. "A"), else null
 - "bloom_level": one of "Remember", "Understand", "Apply", "Analyze", "Evaluate", "Create"
 
-Example: If the paper has "Q1. (a) Define force. (b) State Newton's third law. (c) Give an example.", that is ONE question with all three parts in "question_text", NOT three separate questions.
+Example: If the paper has "Q1. (a) Define force. (b) State Newton's third law. (c) Give an example.", that is ONE question with all three parts in "question_text", NOT three separate questions."""
+
+ANALYSIS_PROMPT = """You are an expert education analyst. Analyze the following exam paper text and extract every question.
 
-Return ONLY a JSON array of question objects. No explanation, no markdown fences.
+{rules}
+{scope}
+Return a JSON array of question objects in the order they appear in the paper.
 
 Paper text:
 ---
 {text}
 ---"""
 
+BATCH_ANALYSIS_PROMPT = """You are an expert education analyst. Below are {count} SEPARATE exam papers, each wrapped in
+"=== PAPER <key> ===" and "=== END PAPER <key> ===" markers. Extract every question from every paper.
+
+{rules}
+
+Treat each paper independently: topics are clustered per paper, and a question never spans two papers.
+Add a "paper_key" field to every question object with the key of the paper it came from, exactly as written in its marker.
+Return ONE JSON array with the questions of each paper in order, finishing one paper before starting the next.
+
+{papers}"""
+
+CONTINUATION_SCOPE = """
+NOTE: This is a later excerpt of a paper whose earlier questions were already extracted.
+{topics_hint}Skip any incomplete question at the very end of the excerpt — it will be sent again.
+"""
+
+PARTIAL_SCOPE = """
+NOTE: The text below is only the first part of the paper. Skip any incomplete question at the very end of the excerpt — it will be sent again.
+"""
+
+
+class AnalyzedQuestion(BaseModel):
+    question_text: str
+    answer_text: Optional[str]
+    question_type: str
+    difficulty: str
+    topic: Optional[str]
+    marks: Optional[float]
+    options: Optional[list[str]]
+    correct_option: Optional[str]
+    bloom_level: Optional[str]
+
+
+class BatchAnalyzedQuestion(AnalyzedQuestion):
+    paper_key: str
+
+
+_decoder = json.JSONDecoder()
+
+
+def salvage_json_objects(text: str) -> tuple[list[dict], bool]:
+    """Recover every well-formed object from a (possibly truncated or damaged) JSON array.
+
+    Returns (objects, complete); complete is False when the closing bracket was never reached.
+    """
+    start = text.find("[")
+    if start < 0:
+        return [], False
+    objects = []
+    i = start + 1
+    while i < len(text):
+        ch = text[i]
+        if ch in " \t\r\n,":
+            i += 1
+        elif ch == "]":
+            return objects, True
+        elif ch == "{":
+            try:
+                obj, i = _decoder.raw_decode(text, i)
+            except json.JSONDecodeError:
+                # Damaged object: resume at the next one (question objects don't nest)
+                nxt = text.find("{", i + 1)
+                if nxt < 0:
+                    break
+                i = nxt
+                continue
+            if isinstance(obj, dict):
+                objects.append(obj)
+        else:
+            nxt = text.find("{", i)
+            close = text.find("]", i)
+            if close >= 0 and (nxt < 0 or close < nxt):
+                return objects, True
+            if nxt < 0:
+                break
+            i = nxt
+    return objects, False
+
+
+def _validate(obj: dict, schema: type[AnalyzedQuestion] = AnalyzedQuestion) -> dict | None:
+    """Typed, normalised question dict, or None if the object isn't usable."""
+    try:
+        q = schema.model_validate({field: None for field in schema.model_fields} | obj)
+    except ValidationError:
+        return None
+    if not q.question_text.strip():
+        return None
+    q.question_type = q.question_type.strip().lower() if q.question_type else ""
+    if q.question_type not in QUESTION_TYPES:
+        q.question_type = "short_answer"
+    q.difficulty = q.difficulty.strip().lower() if q.difficulty else ""
+    if q.difficulty not in DIFFICULTIES:
+        q.difficulty = "medium"
+    return q.model_dump()
+
+
+def _request(client, prompt: str, schema: type[AnalyzedQuestion] = AnalyzedQuestion) -> tuple[list[dict], bool]:
+    """One analysis call. Returns (valid questions, whether the output was complete)."""
+    response = client.models.generate_content(
+        model=settings.GEMINI_MODEL,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=list[schema],
+        ),
+    )
+    if isinstance(response.parsed, list):
+        raw, complete = [q.model_dump() if isinstance(q, BaseModel) else q for q in response.parsed], True
+    else:
+        raw, complete = salvage_json_objects(response.text or "")
+        if not complete:
+            log.warning("Analysis output was incomplete; salvaged %d questions", len(raw))
+
+    questions = [q for q in (_validate(obj, schema) for obj in raw) if q is not None]
+    if len(questions) < len(raw):
+        log.warning("Dropped %d analysis objects that failed validation", len(raw) - len(questions))
+    return questions, complete
+
+
+def _locate(text: str, question_text: str, start: int) -> int | None:
+    """Offset of a question in the source text, matched on its leading words."""
+    words = question_text.split()[:LOCATE_WORDS]
+    if not words:
+        return None
+    m = re.search(r"\s+".join(re.escape(w) for w in words), text[start:])
+    return start + m.start() if m else None
+
+
+def _question_key(q: dict) -> str:
+    return " ".join(q["question_text"].lower().split())
+
 
 def analyze_paper(extracted_text: str) -> list[dict]:
     if not settings.GEMINI_API_KEY:
@@ -39,27 +189,83 @@ def analyze_paper(extracted_text: str) -> list[dict]:
 
     client = genai.Client(api_key=settings.GEMINI_API_KEY)
 
-    prompt = ANALYSIS_PROMPT.format(text=extracted_text[:50000])  # Limit to ~50k chars
+    questions: list[dict] = []
+    seen: set[str] = set()
+    start = 0
+    calls = 0
+    complete = False
+    while start < len(extracted_text) and calls < MAX_ANALYSIS_CALLS:
+        window = extracted_text[start:start + ANALYSIS_WINDOW_CHARS]
+        window_end = start + len(window)
+        if start:
+            topics = sorted({q["topic"] for q in questions if q.get("topic")})
+            topics_hint = f"Reuse these topic labels where they fit: {', '.join(topics)}.\n" if topics else ""
+            scope = CONTINUATION_SCOPE.format(topics_hint=topics_hint)
+        else:
+            scope = PARTIAL_SCOPE if window_end < len(extracted_text) else ""
 
-    response = client.models.generate_content(model=settings.GEMINI_MODEL, contents=prompt)
+        found, complete = _request(client, ANALYSIS_PROMPT.format(rules=QUESTION_RULES, scope=scope, text=window))
+        calls += 1
+        for q in found:
+            key = _question_key(q)
+            if key not in seen:
+                seen.add(key)
+                questions.append(q)
 
-    response_text = response.text.strip()
+        if complete and window_end >= len(extracted_text):
+            break
 
-    # Strip markdown fences if present
-    if response_text.startswith("```"):
-        lines = response_text.split("\n")
-        lines = lines[1:]  # remove opening fence
-        if lines and lines[-1].strip() == "```":
-            lines = lines[:-1]
-        response_text = "\n".join(lines)
+        # Resume at the last question recovered from this window; it's deduplicated if repeated
+        resume = None
+        for q in reversed(found):
+            resume = _locate(extracted_text, q["question_text"], start)
+            if resume is not None:
+                break
+        if resume is None or resume <= start:
+            if complete:
+                resume = window_end  # Nothing locatable: carry on after the window
+            else:
+                log.warning("Analysis stopped early: could not locate where the output was cut off")
+                break
+        start = resume
 
-    try:
-        questions = json.loads(response_text)
-    except json.JSONDecodeError:
-        log.error("Failed to parse Gemini response as JSON: %s", response_text[:500])
+    if not questions and not complete:
         raise RuntimeError("Gemini returned invalid JSON for question extraction")
+    log.info("Analysis extracted %d questions in %d call(s)", len(questions), calls)
+    return questions
 
-    if not isinstance(questions, list):
-        raise RuntimeError("Gemini response is not a JSON array")
 
-    return questions
+def analyze_papers_batch(texts: dict[str, str]) -> tuple[dict[str, list[dict]], set[str]]:
+    """Analyze several small papers in one call.
+
+    Returns ({key: questions}, keys whose results are complete). When the output
+    was cut short, the last paper seen and any papers after it are left out of the
+    complete set so the caller can re-run them on their own.
+    """
+    if not settings.GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY is not configured")
+
+    client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    papers = "\n\n".join(f"=== PAPER {key} ===\n{text}\n=== END PAPER {key} ===" for key, text in texts.items())
+    prompt = BATCH_ANALYSIS_PROMPT.format(count=len(texts), rules=QUESTION_RULES, papers=papers)
+    found, complete = _request(client, prompt, BatchAnalyzedQuestion)
+
+    results: dict[str, list[dict]] = {key: [] for key in texts}
+    seen: dict[str, set[str]] = {key: set() for key in texts}
+    order: list[str] = []
+    for q in found:
+        key = q.pop("paper_key").strip()
+        if key not in results:
+            log.warning("Batch analysis returned a question for unknown paper key %r", key)
+            continue
+        if key not in order:
+            order.append(key)
+        qkey = _question_key(q)
+        if qkey not in seen[key]:
+            seen[key].add(qkey)
+            results[key].append(q)
+
+    if complete:
+        return results, set(texts)
+    done = set(order[:-1])
+    return {key: results[key] for key in done}, done
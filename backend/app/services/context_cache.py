@@ -0,0 +1,177 @@
+"""Provider-side caching of the per-paper refinement context.
+
+The paper + answer key + learnings prefix is identical on every chat turn, so it is
+uploaded once as a Gemini cached content and referenced by name on later turns.
+A cache entry is keyed by a hash of that prefix; when the paper changes the key
+changes and the stale cache is deleted.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from google import genai
+from google.genai import types
+from ..config import settings
+from ..utils.tokens import estimate_tokens
+
+log = logging.getLogger(__name__)
+
+
+class GeminiContextCache:
+    """Backend that stores the prefix with the Gemini caches API."""
+
+    def create(self, client, contents: list[types.Content], display_name: str) -> str:
+        cache = client.caches.create(
+            model=settings.GEMINI_MODEL,
+            config=types.CreateCachedContentConfig(
+                contents=contents,
+                display_name=display_name,
+                ttl=f"{settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS}s",
+            ),
+        )
+        return cache.name
+
+    def delete(self, client, name: str):
+        client.caches.delete(name=name)
+
+    def resolve(self, name: str) -> tuple[list[types.Content], dict]:
+        """History prefix and chat config needed to reference the cache."""
+        return [], {"cached_content": name}
+
+
+class LocalContextCache:
+    """In-process stand-in for the Gemini caches API, used in tests and offline dev.
+
+    Stores the contents itself and replays them inline, so callers exercise the
+    same create/resolve/delete flow without a provider round-trip.
+    """
+
+    def __init__(self):
+        self.entries: dict[str, list[types.Content]] = {}
+
+    def create(self, client, contents: list[types.Content], display_name: str) -> str:
+        name = f"cachedContents/local-{uuid.uuid4().hex}"
+        self.entries[name] = list(contents)
+        return name
+
+    def delete(self, client, name: str):
+        self.entries.pop(name, None)
+
+    def resolve(self, name: str) -> tuple[list[types.Content], dict]:
+        return list(self.entries.get(name, [])), {}
+
+
+@dataclass
+class _Entry:
+    key: str
+    name: str | None  # None: this version is not cacheable (too small / create failed)
+    expires_at: float
+
+
+CREATE_RETRY_SECONDS = 60  # After a failed create, send the context inline this long before trying again
+CREATE_WAIT_SECONDS = 30  # How long a request waits on another's in-flight create before going inline
+
+_backends = {"gemini": GeminiContextCache, "local": LocalContextCache}
+_backend = _backends[settings.GEMINI_CONTEXT_CACHE]() if settings.GEMINI_CONTEXT_CACHE in _backends else None
+if _backend is None and settings.GEMINI_CONTEXT_CACHE != "off":
+    log.warning(
+        "Unknown GEMINI_CONTEXT_CACHE %r (expected %s or off); context caching is disabled",
+        settings.GEMINI_CONTEXT_CACHE, " | ".join(_backends),
+    )
+_entries: dict[int, _Entry] = {}
+_creating: dict[tuple[int, str], threading.Event] = {}  # (paper_id, key) -> set once that create finishes
+_lock = threading.Lock()
+
+
+def _contents_key(contents: list[types.Content]) -> str:
+    h = hashlib.sha256(settings.GEMINI_MODEL.encode())
+    for content in contents:
+        h.update(content.role.encode())
+        for part in content.parts:
+            h.update((part.text or "").encode())
+    return h.hexdigest()
+
+
+def cached_prefix(client, paper_id: int, contents: list[types.Content]) -> tuple[list[types.Content], types.GenerateContentConfig | None]:
+    """Return (history prefix, chat config) that stand in for `contents`.
+
+    Falls back to sending `contents` inline when caching is disabled, the prefix is
+    below the provider's minimum size, or the cache could not be created.
+    """
+    if _backend is None:
+        return contents, None
+
+    key = _contents_key(contents)
+    while True:
+        now = time.monotonic()
+        stale = creating = None
+        with _lock:
+            entry = _entries.get(paper_id)
+            if entry and (entry.key != key or entry.expires_at <= now):
+                stale, entry = _entries.pop(paper_id), None
+            if entry is None:
+                creating = _creating.get((paper_id, key))
+                if creating is None:
+                    _creating[(paper_id, key)] = threading.Event()
+
+        # Expired caches are already gone provider-side; only superseded ones need deleting
+        if stale and stale.name and stale.expires_at > now:
+            _delete(client, stale.name)
+        if entry is not None or creating is None:
+            break
+        # Another request is creating this same cache; use its result instead of a duplicate
+        if not creating.wait(CREATE_WAIT_SECONDS):
+            return contents, None
+
+    if entry is None:
+        replaced = None
+        try:
+            entry = _create(client, paper_id, key, contents, now)
+        finally:
+            with _lock:
+                if entry is not None:
+                    replaced = _entries.get(paper_id)
+                    _entries[paper_id] = entry
+                _creating.pop((paper_id, key)).set()
+        # A request for another version of the paper cached it meanwhile; keep only ours
+        if replaced and replaced.name and replaced.expires_at > now:
+            _delete(client, replaced.name)
+
+    if entry.name is None:
+        return contents, None
+    prefix, config = _backend.resolve(entry.name)
+    return prefix, types.GenerateContentConfig(**config) if config else None
+
+
+def _create(client, paper_id: int, key: str, contents: list[types.Content], now: float) -> _Entry:
+    name = None
+    # Renew a little before the provider TTL so we never reference an expired cache
+    expires_at = now + settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS - 60
+    size = sum(estimate_tokens(p.text) for c in contents for p in c.parts)
+    if size >= settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+        try:
+            name = _backend.create(client, contents, display_name=f"examforge-paper-{paper_id}")
+        except Exception as e:
+            log.warning("Context cache create failed for paper %d: %s", paper_id, e)
+            # Likely transient: retry soon rather than going uncached for a whole TTL
+            expires_at = now + CREATE_RETRY_SECONDS
+    return _Entry(key, name, expires_at)
+
+
+def invalidate_paper(paper_id: int, client=None):
+    """Drop the cached context for a paper (its content changed or it was deleted)."""
+    with _lock:
+        entry = _entries.pop(paper_id, None)
+    if entry and entry.name and _backend is not None:
+        _delete(client or genai.Client(api_key=settings.GEMINI_API_KEY), entry.name)
+
+
+def _delete(client, name: str):
+    try:
+        _backend.delete(client, name)
+    except Exception as e:
+        # The provider TTL reclaims it anyway
+        log.warning("Context cache delete failed for %s: %s", name, e)
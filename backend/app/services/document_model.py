@@ -0,0 +1,253 @@
+"""Parse paper markdown once into a small document model shared by every export format.
+
+The model is built from markdown-it-py's CommonMark tokens (plus pipe tables):
+headings, paragraphs, nested bullet and numbered lists (numbering as written),
+block quotes, tables, rules and code, with inline bold / italic / code / links
+and line breaks. Inline HTML the papers use (<sup>, <sub>, <b>, <i>, <u>, <br>)
+becomes formatting; other tags are dropped and their text kept.
+
+parse_markdown() is cached per content in the process that calls it. export_pool
+parses in the API process and sends the Document to its workers, so exporting the
+paper and its key in several formats parses each text once.
+"""
+
+import re
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from markdown_it import MarkdownIt
+
+PARSE_CACHE_SIZE = 64
+
+
+# ── Model ────────────────────────────────────────────────────────────────────
+
+@dataclass(frozen=True)
+class Run:
+    text: str
+    bold: bool = False
+    italic: bool = False
+    code: bool = False
+    href: str | None = None
+    underline: bool = False
+    superscript: bool = False
+    subscript: bool = False
+    line_break: bool = False  # Hard break; text is empty
+
+
+@dataclass(frozen=True)
+class Heading:
+    level: int
+    runs: tuple[Run, ...]
+
+
+@dataclass(frozen=True)
+class Paragraph:
+    runs: tuple[Run, ...]
+
+
+@dataclass(frozen=True)
+class ListItem:
+    runs: tuple[Run, ...]  # The item's first paragraph
+    number: int | None  # As written in the source for numbered lists
+    children: tuple["Block", ...] = ()  # Nested lists and any further paragraphs
+
+
+@dataclass(frozen=True)
+class ListBlock:
+    ordered: bool
+    items: tuple[ListItem, ...]
+
+    @property
+    def start(self) -> int:
+        return (self.items[0].number or 1) if self.ordered else 1
+
+
+@dataclass(frozen=True)
+class Table:
+    header: tuple[tuple[Run, ...], ...]
+    rows: tuple[tuple[tuple[Run, ...], ...], ...]
+
+
+@dataclass(frozen=True)
+class Rule:
+    pass
+
+
+@dataclass(frozen=True)
+class CodeBlock:
+    text: str
+
+
+@dataclass(frozen=True)
+class BlockQuote:
+    blocks: tuple["Block", ...]
+
+
+Block = Heading | Paragraph | ListBlock | Table | Rule | CodeBlock | BlockQuote
+
+
+@dataclass(frozen=True)
+class Document:
+    blocks: tuple[Block, ...] = field(default_factory=tuple)
+
+
+# ── Inline tokens ────────────────────────────────────────────────────────────
+
+_md = MarkdownIt("commonmark", {"html": True}).enable("table")
+
+_STYLE_TOKENS = {"strong": "bold", "em": "italic"}
+_STYLE_TAGS = {
+    "b": "bold", "strong": "bold", "i": "italic", "em": "italic", "u": "underline",
+    "sup": "superscript", "sub": "subscript", "code": "code",
+}
+_TAG_RE = re.compile(r"^<(/?)([a-z][a-z0-9]*)\b[^>]*>$", re.I)
+
+
+class _RunBuilder:
+    """Turns inline tokens into runs, merging neighbours with the same formatting."""
+
+    def __init__(self):
+        self.runs: list[Run] = []
+        self.depth = dict.fromkeys(("bold", "italic", "code", "underline", "superscript", "subscript"), 0)
+        self.href: str | None = None
+
+    def text(self, text: str, code: bool = False):
+        if not text:
+            return
+        style = {name: depth > 0 for name, depth in self.depth.items()}
+        style["code"] = style["code"] or code
+        run = Run(text, href=self.href, **style)
+        if self.runs and replace(self.runs[-1], text="") == replace(run, text=""):
+            self.runs[-1] = replace(run, text=self.runs[-1].text + text)
+        else:
+            self.runs.append(run)
+
+    def line_break(self):
+        self.runs.append(Run("", line_break=True))
+
+    def style(self, name: str, opening: bool):
+        self.depth[name] = max(self.depth[name] + (1 if opening else -1), 0)
+
+    def html(self, tag_html: str):
+        tag = _TAG_RE.match(tag_html.strip())
+        if not tag:
+            return
+        closing, name = tag.group(1) == "/", tag.group(2).lower()
+        if name == "br":
+            self.line_break()
+        elif name in _STYLE_TAGS:
+            self.style(_STYLE_TAGS[name], not closing)
+
+    def add(self, tokens):
+        for t in tokens:
+            kind = t.type
+            if kind == "text":
+                self.text(t.content)
+            elif kind == "softbreak":
+                self.text(" ")
+            elif kind == "hardbreak":
+                self.line_break()
+            elif kind == "code_inline":
+                self.text(t.content, code=True)
+            elif kind.endswith(("_open", "_close")) and kind.rsplit("_", 1)[0] in _STYLE_TOKENS:
+                self.style(_STYLE_TOKENS[kind.rsplit("_", 1)[0]], kind.endswith("_open"))
+            elif kind == "link_open":
+                self.href = t.attrGet("href")
+            elif kind == "link_close":
+                self.href = None
+            elif kind == "image":
+                self.text(t.content)  # Alt text
+            elif kind == "html_inline":
+                self.html(t.content)
+        return tuple(self.runs)
+
+
+def _runs(inline_token) -> tuple[Run, ...]:
+    return _RunBuilder().add(inline_token.children or ())
+
+
+def parse_inline(text: str) -> tuple[Run, ...]:
+    """Runs for one line or block of inline markdown/HTML."""
+    return _RunBuilder().add(_md.parseInline(text)[0].children or ())
+
+
+# ── Block tokens ─────────────────────────────────────────────────────────────
+
+def _blocks(tokens, i: int, close: str | None = None) -> tuple[list[Block], int]:
+    """Blocks from tokens[i] up to the `close` token (or the end); returns them and the index after it."""
+    blocks: list[Block] = []
+    while i < len(tokens):
+        t = tokens[i]
+        if t.type == close:
+            return blocks, i + 1
+        if t.type == "heading_open":
+            blocks.append(Heading(int(t.tag[1]), _runs(tokens[i + 1])))
+            i += 3
+        elif t.type == "paragraph_open":
+            blocks.append(Paragraph(_runs(tokens[i + 1])))
+            i += 3
+        elif t.type in ("bullet_list_open", "ordered_list_open"):
+            block, i = _list(tokens, i)
+            blocks.append(block)
+        elif t.type == "blockquote_open":
+            inner, i = _blocks(tokens, i + 1, "blockquote_close")
+            blocks.append(BlockQuote(tuple(inner)))
+        elif t.type == "table_open":
+            block, i = _table(tokens, i)
+            blocks.append(block)
+        elif t.type == "hr":
+            blocks.append(Rule())
+            i += 1
+        elif t.type in ("fence", "code_block"):
+            blocks.append(CodeBlock(t.content.rstrip("\n")))
+            i += 1
+        elif t.type == "html_block":
+            runs = parse_inline(t.content.strip())
+            if any(r.text.strip() for r in runs):
+                blocks.append(Paragraph(runs))
+            i += 1
+        else:
+            i += 1
+    return blocks, i
+
+
+def _list(tokens, i: int) -> tuple[ListBlock, int]:
+    ordered = tokens[i].type == "ordered_list_open"
+    close = tokens[i].type.replace("_open", "_close")
+    start = int(tokens[i].attrGet("start") or 1)
+    items: list[ListItem] = []
+    i += 1
+    while tokens[i].type != close:
+        number = (int(tokens[i].info) if tokens[i].info.isdigit() else start + len(items)) if ordered else None
+        inner, i = _blocks(tokens, i + 1, "list_item_close")
+        runs: tuple[Run, ...] = ()
+        if inner and isinstance(inner[0], Paragraph):
+            runs = inner.pop(0).runs
+        items.append(ListItem(runs, number, tuple(inner)))
+    return ListBlock(ordered, tuple(items)), i + 1
+
+
+def _table(tokens, i: int) -> tuple[Table, int]:
+    rows: list[tuple[tuple[Run, ...], ...]] = []
+    row: list[tuple[Run, ...]] = []
+    header: tuple[tuple[Run, ...], ...] = ()
+    while tokens[i].type != "table_close":
+        t = tokens[i]
+        if t.type == "inline":
+            row.append(_runs(t))
+        elif t.type == "tr_close":
+            rows.append(tuple(row))
+            row = []
+        elif t.type == "thead_close":
+            header = rows.pop() if rows else ()
+        i += 1
+    return Table(header, tuple(rows)), i + 1
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_markdown(md_text: str) -> Document:
+    return Document(tuple(_blocks(_md.parse(md_text), 0)[0]))
+
+
+def plain_text(runs: tuple[Run, ...]) -> str:
+    return "".join("\n" if r.line_break else r.text for r in runs)
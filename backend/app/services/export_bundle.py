@@ -0,0 +1,113 @@
+"""Stream many exports as one ZIP while they render.
+
+Every entry is rendered (or read from the export cache) on the export pool at
+background priority, so one bulk download never takes the worker kept free for
+single downloads. Entries are appended in the order they finish. The archive is
+written to an unseekable sink that is drained after every chunk, so memory stays
+at one chunk no matter how many papers are exported.
+"""
+
+import asyncio
+import logging
+import re
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO
+from .export_pool import BACKGROUND, open_export
+from .paper_generator import ensure_answer_key
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+ERRORS_ENTRY = "export_errors.txt"
+
+_UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def safe_name(name: str) -> str:
+    return _UNSAFE_NAME_RE.sub("_", name).strip(" .") or "paper"
+
+
+@dataclass
+class BundleEntry:
+    name: str  # Path inside the archive
+    paper_id: int
+    part: str
+    fmt: str
+    title: str
+    md_text: str | None  # None: answer key not written yet, generate it first
+
+
+class _ChunkSink:
+    """Write-only file object without tell/seek: zipfile then writes data descriptors
+    after each entry instead of seeking back to patch its header."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _open(entry: BundleEntry) -> BinaryIO:
+    """The rendered export opened for reading, generating a deferred answer key first."""
+    loop = asyncio.get_event_loop()
+    md_text = entry.md_text
+    if md_text is None:
+        md_text = await loop.run_in_executor(None, ensure_answer_key, entry.paper_id)
+        if not md_text:
+            raise RuntimeError("answer key generation failed")
+    return await open_export(
+        entry.paper_id, entry.part, entry.fmt, md_text, entry.title, priority=BACKGROUND, awaited=True,
+    )
+
+
+async def stream_bundle(entries: list[BundleEntry]) -> AsyncIterator[bytes]:
+    """Yield the ZIP archive of `entries` chunk by chunk.
+
+    Entries that fail are listed in export_errors.txt at the end of the archive
+    rather than aborting a download that is already under way.
+    """
+    loop = asyncio.get_event_loop()
+    sink = _ChunkSink()
+    # PDF and DOCX are already compressed; deflating them again costs CPU for nothing
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)
+    tasks = {asyncio.ensure_future(_open(entry)): entry for entry in entries}
+    failed: list[str] = []
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                entry = tasks[task]
+                try:
+                    src = task.result()
+                except Exception as e:
+                    log.warning("Bulk export of %s failed: %s", entry.name, e)
+                    failed.append(f"{entry.name}: {e}")
+                    continue
+                with src, archive.open(entry.name, "w") as dst:
+                    while chunk := await loop.run_in_executor(None, src.read, CHUNK_SIZE):
+                        dst.write(chunk)
+                        yield sink.drain()
+                yield sink.drain()  # Data descriptor
+
+        if failed:
+            archive.writestr(ERRORS_ENTRY, "These exports could not be produced:\n\n" + "\n".join(failed) + "\n")
+        archive.close()
+        yield sink.drain()
+    finally:
+        # Client went away mid-download: stop waiting on renders (queued ones still fill the cache)
+        for task in tasks:
+            task.cancel()
+            if task.done() and not task.cancelled() and task.exception() is None:
+                task.result().close()  # Closing an already-written one again is a no-op
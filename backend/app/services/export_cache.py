@@ -0,0 +1,114 @@
+"""On-disk cache of rendered exports in settings.EXPORT_DIR.
+
+A file is named after (paper, part, format, content hash, renderer version), so an
+unchanged paper is rendered once and later downloads are served straight from
+disk. Older versions of the same export are dropped once the current one is written,
+and the directory is trimmed by age and total size. Rendering itself happens in
+export_pool.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from ..config import settings
+from .export_service import renderer_tag, document_to_pdf, document_to_docx
+
+log = logging.getLogger(__name__)
+
+RENDERERS = {"pdf": document_to_pdf, "docx": document_to_docx}  # Take a parsed Document
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+# Names written by cache_path() and store(); anything else in EXPORT_DIR (e.g. .gitkeep) is left alone
+CACHE_NAME_RE = re.compile(r"^\d+-[a-z_]+-[a-z]+-[0-9a-f]{16}-r[a-z0-9]+\.[a-z]+$")
+TEMP_NAME_RE = re.compile(r"^\.(?P<name>.+)\.\d+\.\d+\.tmp$")
+
+
+def content_hash(md_text: str, title: str) -> str:
+    return hashlib.sha256(f"{title}\0{md_text}".encode()).hexdigest()[:16]
+
+
+def slot_prefix(paper_id: int, part: str, fmt: str) -> str:
+    """File name prefix shared by every version of one export."""
+    return f"{paper_id}-{part}-{fmt}-"
+
+
+def cache_path(paper_id: int, part: str, fmt: str, md_text: str, title: str) -> Path:
+    name = f"{slot_prefix(paper_id, part, fmt)}{content_hash(md_text, title)}-{renderer_tag(fmt)}.{fmt}"
+    return settings.EXPORT_DIR / name
+
+
+def lookup(path: Path) -> bool:
+    """True if `path` is cached; refreshes its mtime so eviction is least-recently-used."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def store(path: Path, data: bytes):
+    """Atomically write a rendered export."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    evict()
+
+
+def drop_other_versions(path: Path):
+    """Delete every other version of the export `path` belongs to."""
+    prefix = path.name.rsplit("-", 2)[0] + "-"
+    for old in settings.EXPORT_DIR.glob(f"{prefix}*"):
+        if old != path:
+            try:
+                old.unlink(missing_ok=True)
+            except OSError:
+                pass  # Open for a download on Windows; eviction removes it later
+
+
+def drop_paper(paper_id: int):
+    """Remove every cached export of a paper (it was deleted)."""
+    for path in settings.EXPORT_DIR.glob(f"{paper_id}-*"):
+        if CACHE_NAME_RE.match(path.name):
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass  # Open for a download on Windows; eviction removes it later
+
+
+def evict():
+    """Delete exports older than the max age, then least-recently-used ones over the size cap."""
+    max_age = settings.EXPORT_CACHE_MAX_AGE_HOURS * 3600
+    now = time.time()
+    entries = []
+    for path in settings.EXPORT_DIR.iterdir():
+        temp = TEMP_NAME_RE.match(path.name)
+        if not CACHE_NAME_RE.match(temp.group("name") if temp else path.name) or not path.is_file():
+            continue
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        if now - st.st_mtime > max_age:
+            path.unlink(missing_ok=True)  # Including temp files left by a crashed render
+        elif not temp:  # In-flight temp files don't count toward the cap
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    if total <= settings.EXPORT_CACHE_MAX_MB * 1024 * 1024:
+        return
+    entries.sort()
+    removed = 0
+    for _, size, path in entries:
+        if total <= settings.EXPORT_CACHE_MAX_MB * 1024 * 1024:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    log.info("Export cache over size cap: evicted %d files", removed)
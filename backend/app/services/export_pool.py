@@ -0,0 +1,320 @@
+"""Render PDF/DOCX exports in a dedicated process pool.
+
+xhtml2pdf can take seconds per paper; running it in the API process would stall
+every request on the worker. Jobs go to a small process pool whose workers
+import the renderers up front. At most EXPORT_POOL_WORKERS renders run at once;
+further jobs wait in a priority queue, and identical jobs (same cache file)
+share one render. After a paper or answer key changes, prerender() queues
+low-priority renders of every export so the first download is a cache hit.
+
+Markdown is parsed here, once per text, and workers get the parsed Document:
+spawned workers don't share parse_markdown's cache, so parsing there would
+repeat the work for every format a worker renders.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+from ..config import settings
+from .document_model import Document, parse_markdown
+from .export_cache import RENDERERS, cache_path, lookup, store, drop_other_versions
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE = 0  # A user is waiting on the download
+BACKGROUND = 1  # Pre-render after a paper changed; never takes the last free worker
+
+OPEN_ATTEMPTS = 3  # Renders of one export a download may need if newer versions keep replacing it
+
+EXPORT_PARTS = (("paper", "pdf"), ("paper", "docx"), ("answer_key", "pdf"), ("answer_key", "docx"))
+
+
+def _warm_renderers():
+    """Pool initializer: pay the heavy imports once per worker, not on the first export."""
+    try:
+        import docx  # noqa: F401
+        from xhtml2pdf import pisa  # noqa: F401
+    except ImportError as e:
+        log.warning("Export worker could not preload renderers: %s", e)
+
+
+def _ping() -> bool:
+    return True
+
+
+def _render_job(fmt: str, document: Document, title: str, path: str) -> tuple[float, float]:
+    """Runs in a pool worker. Returns (started_at, finished_at) wall-clock times."""
+    started = time.time()
+    store(Path(path), RENDERERS[fmt](document, title))
+    return started, time.time()
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    path: Path = field(compare=False)
+    paper_id: int = field(compare=False)
+    slot: tuple = field(compare=False)
+    fmt: str = field(compare=False)
+    document: Document = field(compare=False)
+    title: str = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.time)
+    future: Future = field(compare=False, default_factory=Future)
+    started: bool = field(compare=False, default=False)
+    awaited: bool = field(compare=False, default=False)  # A download request is waiting on it
+
+
+class ExportPool:
+    def __init__(self):
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._queue: list[_Job] = []  # heap by (priority, seq)
+        self._jobs: dict[str, _Job] = {}  # queued or running, by cache file name
+        self._current: dict[tuple, str] = {}  # (paper, part, fmt) -> newest requested file name
+        self._running = 0
+        self._running_background = 0
+        self._seq = itertools.count()
+        self._stats = {
+            "renders": 0,
+            "failures": 0,
+            "cache_hits": 0,
+            "joined": 0,
+            "prerenders_queued": 0,
+            "prerenders_cancelled": 0,
+            "queue_seconds_total": 0.0,
+            "queue_seconds_max": 0.0,
+            "render_seconds_total": 0.0,
+            "render_seconds_max": 0.0,
+        }
+
+    def start(self):
+        """Spawn and warm the workers so the first export doesn't pay for it."""
+        executor = self._get_executor()
+        for _ in range(settings.EXPORT_POOL_WORKERS):
+            executor.submit(_ping)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs threads and an event loop is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.EXPORT_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_warm_renderers,
+                )
+            return self._executor
+
+    def render(
+        self, paper_id: int, part: str, fmt: str, md_text: str, title: str,
+        priority: int = INTERACTIVE, awaited: bool | None = None,
+    ) -> Future:
+        """Future resolving to the cached export's path; renders it in the pool on a miss.
+
+        `awaited` marks a caller that will read the file (defaults to interactive
+        priority only), so a superseded render isn't deleted under it.
+        """
+        if awaited is None:
+            awaited = priority == INTERACTIVE
+        path = cache_path(paper_id, part, fmt, md_text, title)
+        slot = (paper_id, part, fmt)
+        with self._lock:
+            if priority == INTERACTIVE or slot not in self._current:
+                self._current[slot] = path.name
+        if lookup(path):
+            with self._lock:
+                self._stats["cache_hits"] += 1
+            future = Future()
+            future.set_result(path)
+            return future
+
+        document = parse_markdown(md_text)  # Outside the lock; cached, so a join costs nothing
+        with self._lock:
+            job = self._jobs.get(path.name)
+            if job is not None:
+                self._stats["joined"] += 1
+                job.awaited = job.awaited or awaited
+                if priority < job.priority and not job.started:
+                    job.priority = priority
+                    heapq.heapify(self._queue)
+                return job.future
+            job = _Job(priority, next(self._seq), path, paper_id, slot, fmt, document, title)
+            job.awaited = awaited
+            self._jobs[path.name] = job
+            heapq.heappush(self._queue, job)
+        self._dispatch()
+        return job.future
+
+    def prerender(self, paper_id: int, title: str, content_markdown: str | None, answer_key_markdown: str | None):
+        """Queue background renders of a paper's exports and cancel queued renders of older versions."""
+        if not settings.EXPORT_PRERENDER:
+            return
+        sources = {"paper": (content_markdown, title), "answer_key": (answer_key_markdown, f"{title} - Answer Key")}
+        wanted = {}
+        for part, fmt in EXPORT_PARTS:
+            md_text, part_title = sources[part]
+            if md_text:
+                wanted[(part, fmt)] = (md_text, part_title)
+
+        keep = {cache_path(paper_id, part, fmt, md, t).name for (part, fmt), (md, t) in wanted.items()}
+        with self._lock:
+            for part, fmt in wanted:
+                self._current[(paper_id, part, fmt)] = cache_path(paper_id, part, fmt, *wanted[(part, fmt)]).name
+            stale = [
+                j for j in self._queue
+                if j.paper_id == paper_id and j.priority == BACKGROUND and not j.awaited and j.path.name not in keep
+            ]
+            if stale:
+                self._queue = [j for j in self._queue if j not in stale]
+                heapq.heapify(self._queue)
+                for j in stale:
+                    self._jobs.pop(j.path.name, None)
+                self._stats["prerenders_cancelled"] += len(stale)
+        for j in stale:
+            j.future.cancel()
+
+        for (part, fmt), (md_text, part_title) in wanted.items():
+            self.render(paper_id, part, fmt, md_text, part_title, priority=BACKGROUND)
+        with self._lock:
+            self._stats["prerenders_queued"] += len(wanted)
+
+    def _dispatch(self):
+        """Hand queued jobs to the pool while there are free slots."""
+        to_start = []
+        background_limit = max(settings.EXPORT_POOL_WORKERS - 1, 1)
+        with self._lock:
+            while self._queue and self._running < settings.EXPORT_POOL_WORKERS:
+                if self._queue[0].priority == BACKGROUND and self._running_background >= background_limit:
+                    break  # Keep a worker free for downloads someone is waiting on
+                job = heapq.heappop(self._queue)
+                job.started = True
+                self._running += 1
+                if job.priority == BACKGROUND:
+                    self._running_background += 1
+                to_start.append(job)
+
+        for job in to_start:
+            executor = None
+            try:
+                executor = self._get_executor()
+                fut = executor.submit(_render_job, job.fmt, job.document, job.title, str(job.path))
+            except Exception as e:
+                self._finish(job, None, e, executor)
+                continue
+            fut.add_done_callback(lambda f, job=job, executor=executor: self._on_done(job, f, executor))
+
+    def _on_done(self, job: _Job, fut: Future, executor: ProcessPoolExecutor):
+        try:
+            timings = fut.result()
+        except Exception as e:
+            self._finish(job, None, e, executor)
+        else:
+            self._finish(job, timings, None, executor)
+
+    def _finish(
+        self, job: _Job, timings: tuple[float, float] | None, error: Exception | None,
+        executor: ProcessPoolExecutor | None,
+    ):
+        broken = None
+        with self._lock:
+            self._running -= 1
+            if job.priority == BACKGROUND:
+                self._running_background -= 1
+            self._jobs.pop(job.path.name, None)
+            is_current = self._current.get(job.slot) == job.path.name
+            if error is None:
+                started, finished = timings
+                queued, rendered = max(started - job.enqueued_at, 0.0), finished - started
+                self._stats["renders"] += 1
+                self._stats["queue_seconds_total"] += queued
+                self._stats["queue_seconds_max"] = round(max(self._stats["queue_seconds_max"], queued), 3)
+                self._stats["render_seconds_total"] += rendered
+                self._stats["render_seconds_max"] = round(max(self._stats["render_seconds_max"], rendered), 3)
+            else:
+                self._stats["failures"] += 1
+                # A worker died (e.g. OOM); start a fresh pool for the next job. Every job
+                # of the dead pool fails this way, but only the first replaces it.
+                if isinstance(error, BrokenProcessPool) and executor is not None and self._executor is executor:
+                    broken, self._executor = executor, None
+
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)  # Reap its remaining workers
+        if error is None:
+            if is_current:
+                drop_other_versions(job.path)
+            elif not job.awaited:
+                # Superseded while rendering and nobody is waiting for it
+                job.path.unlink(missing_ok=True)
+            job.future.set_result(job.path)
+        else:
+            log.error("Export render failed for %s: %s", job.path.name, error)
+            job.future.set_exception(error)
+        self._dispatch()
+
+    def forget_paper(self, paper_id: int):
+        """Drop queued background renders and version tracking for a deleted paper."""
+        with self._lock:
+            stale = [j for j in self._queue if j.paper_id == paper_id and j.priority == BACKGROUND]
+            self._queue = [j for j in self._queue if j not in stale]
+            heapq.heapify(self._queue)
+            for j in stale:
+                self._jobs.pop(j.path.name, None)
+            for slot in [s for s in self._current if s[0] == paper_id]:
+                del self._current[slot]
+        for j in stale:
+            j.future.cancel()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._queue)
+            stats["running"] = self._running
+        renders = stats["renders"]
+        stats["queue_seconds_avg"] = round(stats.pop("queue_seconds_total") / renders, 3) if renders else 0.0
+        stats["render_seconds_avg"] = round(stats.pop("render_seconds_total") / renders, 3) if renders else 0.0
+        return stats
+
+
+export_pool = ExportPool()
+
+
+async def open_export(
+    paper_id: int, part: str, fmt: str, md_text: str, title: str,
+    priority: int = INTERACTIVE, awaited: bool | None = None,
+) -> BinaryIO:
+    """Render (or find) an export and return it opened for reading.
+
+    Finishing a newer version of the export deletes this one, possibly between the
+    render and the response reading it. An open handle stays readable after that;
+    if the file went before it could be opened, it is rendered again.
+    """
+    for _ in range(OPEN_ATTEMPTS):
+        future = export_pool.render(paper_id, part, fmt, md_text, title, priority=priority, awaited=awaited)
+        try:
+            # Shielded: the render may be shared with other downloads, so giving up on it
+            # here must not cancel it for them
+            path = await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            if future.cancelled():  # The paper was deleted while queued
+                raise RuntimeError("export was cancelled")
+            raise
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:
+            log.info("Export %s was replaced before it could be served; rendering it again", path.name)
+    raise RuntimeError(f"export kept being replaced during {OPEN_ATTEMPTS} renders")
@@ -1,91 +1,268 @@
 """Export generated papers to PDF and Word formats."""
 
-import markdown
+from html import escape
 from io import BytesIO
+from ..config import settings
+from .document_model import (
+    Block, BlockQuote, CodeBlock, Document, Heading, ListBlock, Paragraph, Rule, Run, Table, parse_markdown,
+)
 
+# Bump whenever rendering output changes so cached exports are re-rendered
+RENDERER_VERSION = 3
 
-def markdown_to_pdf(md_text: str, title: str = "Exam Paper") -> bytes:
-    """Convert markdown to PDF using xhtml2pdf."""
-    from xhtml2pdf import pisa
 
-    html_content = markdown.markdown(md_text, extensions=['tables', 'fenced_code'])
+PDF_CSS = """
+body {
+    font-family: Helvetica, Arial, sans-serif;
+    font-size: 11pt;
+    line-height: 1.5;
+    color: #222;
+}
+h1 { font-size: 17pt; text-align: center; margin-bottom: 8px; }
+h2 { font-size: 13pt; margin-top: 18px; border-bottom: 1px solid #ccc; padding-bottom: 4px; }
+h3 { font-size: 11pt; margin-top: 14px; }
+table { border-collapse: collapse; width: 100%; margin: 10px 0; }
+th, td { border: 1px solid #ccc; padding: 5px 8px; text-align: left; }
+th { background: #f5f5f5; }
+ol, ul { margin-left: 18px; }
+p { margin: 5px 0; }
+blockquote { margin: 6px 0 6px 14px; padding-left: 8px; border-left: 3px solid #ccc; color: #444; }
+"""
 
-    full_html = f"""<!DOCTYPE html>
+PAGE_MARGIN_PT = 56.7  # 2cm
+
+
+class XHTML2PDFBackend:
+    """Reference renderer: full CSS paged media, but slow and memory-hungry on long papers."""
+
+    def render(self, body_html: str, title: str) -> bytes:
+        from xhtml2pdf import pisa
+
+        full_html = f"""<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
-    <title>{title}</title>
+    <title>{escape(title)}</title>
     <style>
-        @page {{
-            size: A4;
-            margin: 2cm;
-        }}
-        body {{
-            font-family: Helvetica, Arial, sans-serif;
-            font-size: 11pt;
-            line-height: 1.5;
-            color: #222;
-        }}
-        h1 {{ font-size: 17pt; text-align: center; margin-bottom: 8px; }}
-        h2 {{ font-size: 13pt; margin-top: 18px; border-bottom: 1px solid #ccc; padding-bottom: 4px; }}
-        h3 {{ font-size: 11pt; margin-top: 14px; }}
-        table {{ border-collapse: collapse; width: 100%; margin: 10px 0; }}
-        th, td {{ border: 1px solid #ccc; padding: 5px 8px; text-align: left; }}
-        th {{ background: #f5f5f5; }}
-        ol, ul {{ margin-left: 18px; }}
-        p {{ margin: 5px 0; }}
+        @page {{ size: A4; margin: 2cm; }}
+        {PDF_CSS}
     </style>
 </head>
-<body>{html_content}</body>
+<body>{body_html}</body>
 </html>"""
 
-    buffer = BytesIO()
-    pisa_status = pisa.CreatePDF(full_html, dest=buffer, encoding='utf-8')
-    if pisa_status.err:
-        raise RuntimeError("PDF generation failed")
-    return buffer.getvalue()
+        buffer = BytesIO()
+        pisa_status = pisa.CreatePDF(full_html, dest=buffer, encoding='utf-8')
+        if pisa_status.err:
+            raise RuntimeError("PDF generation failed")
+        return buffer.getvalue()
 
 
-def markdown_to_docx(md_text: str, title: str = "Exam Paper") -> bytes:
-    """Convert markdown to DOCX using python-docx."""
-    from docx import Document
-    from docx.shared import Pt
+class PyMuPDFStoryBackend:
+    """Lays the HTML out with PyMuPDF's Story engine (MuPDF, native code)."""
+
+    def render(self, body_html: str, title: str) -> bytes:
+        import fitz  # PyMuPDF
+
+        story = fitz.Story(html=body_html, user_css=PDF_CSS)
+        buffer = BytesIO()
+        writer = fitz.DocumentWriter(buffer)
+        mediabox = fitz.paper_rect("a4")
+        where = mediabox + (PAGE_MARGIN_PT, PAGE_MARGIN_PT, -PAGE_MARGIN_PT, -PAGE_MARGIN_PT)
+        more = True
+        while more:
+            device = writer.begin_page(mediabox)
+            more, _ = story.place(where)
+            story.draw(device)
+            writer.end_page()
+        writer.close()
+
+        # Story output has no document title; set it like the HTML <title>
+        doc = fitz.open("pdf", buffer.getvalue())
+        doc.set_metadata({"title": title})
+        return doc.tobytes(deflate=True)
+
+
+PDF_BACKENDS = {"xhtml2pdf": XHTML2PDFBackend, "pymupdf": PyMuPDFStoryBackend}
+
+
+def renderer_tag(fmt: str) -> str:
+    """Identifies the renderer in export cache keys, so switching backends re-renders."""
+    return f"r{RENDERER_VERSION}{settings.PDF_BACKEND}" if fmt == "pdf" else f"r{RENDERER_VERSION}"
+
+
+def _runs_html(runs: tuple[Run, ...]) -> str:
+    out = []
+    for run in runs:
+        if run.line_break:
+            out.append("<br/>")
+            continue
+        html = escape(run.text, quote=False)
+        if run.code:
+            html = f"<code>{html}</code>"
+        if run.superscript:
+            html = f"<sup>{html}</sup>"
+        if run.subscript:
+            html = f"<sub>{html}</sub>"
+        if run.underline:
+            html = f"<u>{html}</u>"
+        if run.italic:
+            html = f"<em>{html}</em>"
+        if run.bold:
+            html = f"<strong>{html}</strong>"
+        if run.href:
+            html = f'<a href="{escape(run.href)}">{html}</a>'
+        out.append(html)
+    return "".join(out)
+
+
+def _list_html(block: ListBlock) -> str:
+    items = []
+    for item in block.items:
+        items.append(f"<li>{_runs_html(item.runs)}{_blocks_html(item.children)}</li>")
+    if block.ordered:
+        start = f' start="{block.start}"' if block.start != 1 else ""
+        return f"<ol{start}>{''.join(items)}</ol>"
+    return f"<ul>{''.join(items)}</ul>"
+
+
+def _blocks_html(blocks: tuple[Block, ...]) -> str:
+    parts = []
+    for block in blocks:
+        if isinstance(block, Heading):
+            parts.append(f"<h{block.level}>{_runs_html(block.runs)}</h{block.level}>")
+        elif isinstance(block, Paragraph):
+            parts.append(f"<p>{_runs_html(block.runs)}</p>")
+        elif isinstance(block, ListBlock):
+            parts.append(_list_html(block))
+        elif isinstance(block, Table):
+            head = "".join(f"<th>{_runs_html(cell)}</th>" for cell in block.header)
+            body = "".join(
+                "<tr>" + "".join(f"<td>{_runs_html(cell)}</td>" for cell in row) + "</tr>"
+                for row in block.rows
+            )
+            parts.append(f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>")
+        elif isinstance(block, Rule):
+            parts.append("<hr/>")
+        elif isinstance(block, CodeBlock):
+            parts.append(f"<pre><code>{escape(block.text, quote=False)}</code></pre>")
+        elif isinstance(block, BlockQuote):
+            parts.append(f"<blockquote>{_blocks_html(block.blocks)}</blockquote>")
+    return "\n".join(parts)
+
+
+def to_html(document: Document) -> str:
+    """Body HTML for the PDF backends."""
+    return _blocks_html(document.blocks)
+
+
+def document_to_pdf(document: Document, title: str = "Exam Paper", backend: str | None = None) -> bytes:
+    """Render a parsed paper to PDF with the configured backend (settings.PDF_BACKEND)."""
+    return PDF_BACKENDS[backend or settings.PDF_BACKEND]().render(to_html(document), title)
+
+
+def markdown_to_pdf(md_text: str, title: str = "Exam Paper", backend: str | None = None) -> bytes:
+    """Convert markdown to PDF with the configured backend (settings.PDF_BACKEND)."""
+    return document_to_pdf(parse_markdown(md_text), title, backend)
+
+
+def _add_runs(paragraph, runs: tuple[Run, ...], bold: bool = False):
+    for run in runs:
+        if run.line_break:
+            paragraph.add_run().add_break()
+            continue
+        r = paragraph.add_run(run.text)
+        r.bold = run.bold or bold or None
+        r.italic = run.italic or None
+        r.underline = run.underline or None
+        if run.superscript:
+            r.font.superscript = True
+        if run.subscript:
+            r.font.subscript = True
+        if run.code:
+            r.font.name = 'Courier New'
+
+
+def _add_list(doc, block: ListBlock, depth: int = 0):
+    from docx.shared import Inches
+
+    # python-docx's 'List Number' style shares one numbering sequence across the
+    # whole document, so numbers are written out as in the source instead
+    style = 'List Bullet' if depth == 0 else 'List Bullet 2'
+    for offset, item in enumerate(block.items):
+        if block.ordered:
+            p = doc.add_paragraph()
+            p.paragraph_format.left_indent = Inches(0.25 * (depth + 1))
+            p.paragraph_format.first_line_indent = Inches(-0.25)
+            p.add_run(f"{item.number or block.start + offset}. ")
+        else:
+            p = doc.add_paragraph(style=style)
+        _add_runs(p, item.runs)
+        for child in item.children:
+            if isinstance(child, ListBlock):
+                _add_list(doc, child, min(depth + 1, 1))
+            else:
+                _add_blocks(doc, (child,), depth + 1)
+
+
+def _add_blocks(doc, blocks: tuple[Block, ...], indent: int = 0):
+    """Add blocks to the document; `indent` steps in for list item bodies and quotes."""
+    from docx.shared import Inches, Pt
     from docx.enum.text import WD_ALIGN_PARAGRAPH
 
-    doc = Document()
+    def paragraph():
+        p = doc.add_paragraph()
+        if indent:
+            p.paragraph_format.left_indent = Inches(0.25 * indent)
+        return p
+
+    for block in blocks:
+        if isinstance(block, Heading):
+            p = doc.add_heading(level=min(block.level, 9))
+            _add_runs(p, block.runs)
+            if block.level == 1:
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        elif isinstance(block, Paragraph):
+            _add_runs(paragraph(), block.runs)
+        elif isinstance(block, ListBlock):
+            _add_list(doc, block, min(indent, 1))
+        elif isinstance(block, Table):
+            columns = max([len(block.header)] + [len(row) for row in block.rows])
+            table = doc.add_table(rows=1 + len(block.rows), cols=columns)
+            table.style = 'Table Grid'
+            for r, row in enumerate((block.header, *block.rows)):
+                for c, cell in enumerate(row):
+                    _add_runs(table.cell(r, c).paragraphs[0], cell, bold=r == 0)
+        elif isinstance(block, Rule):
+            paragraph().add_run('_' * 50)
+        elif isinstance(block, CodeBlock):
+            r = paragraph().add_run(block.text)
+            r.font.name = 'Courier New'
+            r.font.size = Pt(10)
+        elif isinstance(block, BlockQuote):
+            _add_blocks(doc, block.blocks, indent + 1)
+
+
+def document_to_docx(document: Document, title: str = "Exam Paper") -> bytes:
+    """Render a parsed paper to DOCX using python-docx."""
+    from docx import Document as DocxDocument
+    from docx.shared import Pt
+
+    doc = DocxDocument()
+    doc.core_properties.title = title
 
     # Set default style
     style = doc.styles['Normal']
     style.font.name = 'Calibri'
     style.font.size = Pt(11)
 
-    lines = md_text.split('\n')
-    for line in lines:
-        stripped = line.strip()
-        if not stripped:
-            continue
-
-        if stripped.startswith('### '):
-            doc.add_heading(stripped[4:], level=3)
-        elif stripped.startswith('## '):
-            doc.add_heading(stripped[3:], level=2)
-        elif stripped.startswith('# '):
-            p = doc.add_heading(stripped[2:], level=1)
-            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        elif stripped.startswith('- ') or stripped.startswith('* '):
-            doc.add_paragraph(stripped[2:], style='List Bullet')
-        elif len(stripped) > 2 and stripped[0].isdigit() and stripped[1] in '.):':
-            text = stripped.split(' ', 1)[1] if ' ' in stripped else stripped
-            doc.add_paragraph(text, style='List Number')
-        elif stripped.startswith('**') and stripped.endswith('**'):
-            p = doc.add_paragraph()
-            run = p.add_run(stripped.strip('*'))
-            run.bold = True
-        elif stripped.startswith('---') or stripped.startswith('___'):
-            doc.add_paragraph('_' * 50)
-        else:
-            doc.add_paragraph(stripped)
+    _add_blocks(doc, document.blocks)
 
     buffer = BytesIO()
     doc.save(buffer)
     return buffer.getvalue()
+
+
+def markdown_to_docx(md_text: str, title: str = "Exam Paper") -> bytes:
+    """Convert markdown to DOCX using python-docx."""
+    return document_to_docx(parse_markdown(md_text), title)
@@ -0,0 +1,115 @@
+"""Reduce an uploaded paper's text to its layout: header, sections, numbering and marks notation.
+
+The skeleton is computed once at ingest and used by generation as the format
+reference, so prompts carry the paper's structure without its question bodies.
+"""
+
+import re
+from collections import Counter
+
+HEADER_MAX_LINES = 12
+LINE_MAX_CHARS = 120
+
+SECTION_RE = re.compile(r"^(?:#+\s*)?\**\s*(section|part)\s*[-–:]?\s*([A-Z]|[IVX]+|\d+)\b", re.I)
+
+QUESTION_STYLES = [
+    ("Q1.", re.compile(r"^(Q\.?\s*\d+\s*[.):]?)\s+", re.I)),
+    ("1.", re.compile(r"^(\d{1,3}\.)\s+")),
+    ("1)", re.compile(r"^(\d{1,3}\))\s+")),
+    ("(1)", re.compile(r"^(\(\d{1,3}\))\s+")),
+]
+
+SUBPART_STYLES = [
+    ("(i)", re.compile(r"^\((i{1,3}|iv|v|vi{0,3}|ix|x)\)\s+", re.I)),
+    ("(a)", re.compile(r"^\([a-h]\)\s+")),
+    ("a)", re.compile(r"^[a-h]\)\s+")),
+    ("a.", re.compile(r"^[a-h]\.\s+")),
+]
+
+MARKS_STYLES = [
+    ("[N marks]", re.compile(r"\[\s*\d+(?:\.\d+)?\s*marks?\s*\]", re.I)),
+    ("(N marks)", re.compile(r"\(\s*\d+(?:\.\d+)?\s*marks?\s*\)", re.I)),
+    ("N x M = T", re.compile(r"\d+\s*[x×]\s*\d+\s*=\s*\d+")),
+    ("[N]", re.compile(r"\[\s*\d+(?:\.\d+)?\s*\]\s*$")),
+    ("(N)", re.compile(r"\(\s*\d+(?:\.\d+)?\s*\)\s*$")),
+    ("NM", re.compile(r"\b\d+\s*M\b")),
+]
+
+
+def _match_style(line: str, styles) -> tuple[str, re.Match] | None:
+    for label, pattern in styles:
+        m = pattern.search(line)
+        if m:
+            return label, m
+    return None
+
+
+def build_format_skeleton(text: str) -> str:
+    """Header lines, section headings, numbering style and marks notation of a paper."""
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+
+    header: list[str] = []
+    sections: list[list] = []  # [heading, question count]
+    numbering: Counter = Counter()
+    subparts: Counter = Counter()
+    marks: Counter = Counter()
+    marks_example: dict[str, str] = {}
+    sample_line = None
+    body_started = False
+    # With sections, numbered lines before the first one are instructions, not questions
+    has_sections = any(SECTION_RE.match(l) for l in lines)
+
+    for line in lines:
+        if SECTION_RE.match(line):
+            body_started = True
+            if not any(s[0] == line[:LINE_MAX_CHARS] for s in sections):
+                sections.append([line[:LINE_MAX_CHARS], 0])
+            continue
+        if has_sections and not sections:
+            if len(header) < HEADER_MAX_LINES:
+                header.append(line[:LINE_MAX_CHARS])
+            continue
+
+        question = _match_style(line, QUESTION_STYLES)
+        mark = _match_style(line, MARKS_STYLES)
+        if mark:
+            marks[mark[0]] += 1
+            marks_example.setdefault(mark[0], mark[1].group(0).strip())
+
+        if question:
+            body_started = True
+            numbering[question[0]] += 1
+            if sections:
+                sections[-1][1] += 1
+            if sample_line is None:
+                suffix = f" {mark[1].group(0).strip()}" if mark else ""
+                sample_line = f"{question[1].group(1)} …{suffix}"
+            continue
+
+        subpart = _match_style(line, SUBPART_STYLES)
+        if subpart:
+            body_started = True
+            subparts[subpart[0]] += 1
+        elif not body_started and len(header) < HEADER_MAX_LINES:
+            header.append(line[:LINE_MAX_CHARS])
+
+    if not (header or sections or numbering or marks):
+        return ""
+
+    parts = []
+    if header:
+        parts.append("HEADER:\n" + "\n".join(f"  {l}" for l in header))
+    if sections:
+        parts.append("SECTIONS:\n" + "\n".join(
+            f"  {heading} — {count} question{'s' if count != 1 else ''}" for heading, count in sections
+        ))
+    if numbering:
+        style = numbering.most_common(1)[0][0]
+        sub = f" (sub-parts: {subparts.most_common(1)[0][0]})" if subparts else ""
+        parts.append(f"QUESTION NUMBERING: {style}{sub}")
+    if marks:
+        style = marks.most_common(1)[0][0]
+        parts.append(f'MARKS NOTATION: {style}, e.g. "{marks_example[style]}"')
+    if sample_line:
+        parts.append(f"SAMPLE QUESTION LINE: {sample_line}")
+    return "\n".join(parts)
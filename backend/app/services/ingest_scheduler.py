@@ -0,0 +1,146 @@
+"""Pack small uploaded papers into shared analysis calls.
+
+For a one-page quiz the analysis instructions cost more than the paper itself.
+Small papers are held for a short window and sent to Gemini together, each
+wrapped in its own delimiters; results are split back per paper. Papers the
+batch couldn't finish fall back to the single-paper analyze_paper path.
+
+The scheduler thread only collects batches; the Gemini calls run on a small
+worker pool, so one slow call doesn't hold up the next window.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from ..config import settings
+from .claude_analyzer import analyze_paper, analyze_papers_batch
+
+log = logging.getLogger(__name__)
+
+
+class _Job:
+    def __init__(self, paper_id: int, text: str):
+        self.paper_id = paper_id
+        self.text = text
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+    @property
+    def key(self) -> str:
+        return f"p{self.paper_id}"
+
+
+class IngestScheduler:
+    def __init__(self):
+        self._pending: list[_Job] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._pool: ThreadPoolExecutor | None = None
+        self._stats = {
+            "papers": 0,
+            "batches": 0,
+            "batched_papers": 0,
+            "single_calls": 0,
+            "fallbacks": 0,
+            "calls_saved": 0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def is_small(self, text: str) -> bool:
+        return len(text) <= settings.ANALYSIS_BATCH_MAX_CHARS
+
+    def submit(self, paper_id: int, text: str) -> Future:
+        """Queue a small paper. Resolves to its list of question dicts, like analyze_paper."""
+        job = _Job(paper_id, text)
+        with self._cond:
+            self._pending.append(job)
+            self._stats["papers"] += 1
+            if self._thread is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=settings.ANALYSIS_BATCH_WORKERS, thread_name_prefix="ingest-analysis"
+                )
+                self._thread = threading.Thread(target=self._run, name="ingest-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job.future
+
+    def metrics(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending_papers"] = len(self._pending)
+        stats["avg_batch_size"] = round(stats["batched_papers"] / stats["batches"], 1) if stats["batches"] else 0.0
+        return stats
+
+    def _take_batch(self) -> list[_Job]:
+        """Wait for the oldest job's window to close (or the batch to fill), then pop a batch."""
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                total = sum(len(j.text) for j in self._pending)
+                full = (
+                    len(self._pending) >= settings.ANALYSIS_BATCH_MAX_PAPERS
+                    or total >= settings.ANALYSIS_BATCH_MAX_TOTAL_CHARS
+                )
+                remaining = self._pending[0].submitted_at + settings.ANALYSIS_BATCH_WINDOW_SECONDS - time.monotonic()
+                if full or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._pending and len(batch) < settings.ANALYSIS_BATCH_MAX_PAPERS:
+                job = self._pending[0]
+                if batch and size + len(job.text) > settings.ANALYSIS_BATCH_MAX_TOTAL_CHARS:
+                    break
+                batch.append(self._pending.pop(0))
+                size += len(job.text)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            now = time.monotonic()
+            with self._cond:
+                self._stats["wait_seconds_max"] = round(
+                    max(self._stats["wait_seconds_max"], *(now - j.submitted_at for j in batch)), 1
+                )
+            if len(batch) == 1:
+                self._pool.submit(self._analyze_single, batch[0])
+            else:
+                self._pool.submit(self._analyze_batch, batch)
+
+    def _analyze_single(self, job: _Job):
+        with self._cond:
+            self._stats["single_calls"] += 1
+        try:
+            job.future.set_result(analyze_paper(job.text))
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def _analyze_batch(self, batch: list[_Job]):
+        try:
+            results, done = analyze_papers_batch({job.key: job.text for job in batch})
+        except Exception as e:
+            log.warning("Batched analysis of %d papers failed, analysing individually: %s", len(batch), e)
+            results, done = {}, set()
+        # A small paper that came back empty was most likely skipped; give it its own call
+        done = {key for key in done if results.get(key)}
+
+        leftovers = [job for job in batch if job.key not in done]
+        with self._cond:
+            self._stats["batches"] += 1
+            self._stats["batched_papers"] += len(batch) - len(leftovers)
+            self._stats["fallbacks"] += len(leftovers)
+            self._stats["calls_saved"] += max(len(batch) - len(leftovers) - 1, 0)
+        log.info("Analysed %d papers in one call (%d fell back to single analysis)", len(batch), len(leftovers))
+
+        for job in batch:
+            if job.key in done:
+                job.future.set_result(results[job.key])
+        for job in leftovers:
+            self._pool.submit(self._analyze_single, job)
+
+
+ingest_scheduler = IngestScheduler()
@@ -0,0 +1,301 @@
+"""Background worker that extracts reusable user preferences from chat conversations.
+
+Extraction requests are debounced per user (a burst of chat messages yields one
+extraction) and due users are batched into a single structured Gemini call.
+"""
+
+import json
+import logging
+import threading
+import time
+from pydantic import BaseModel
+from google import genai
+from google.genai import types
+from sqlalchemy import select, func, update, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from ..database import SyncSessionLocal
+from ..models import Conversation, UserLearning
+from ..config import settings
+from . import learnings_cache
+
+log = logging.getLogger(__name__)
+
+LEARNING_CATEGORIES = ("formatting", "content", "style", "structure", "general")
+MAX_LEARNINGS_PER_USER = 5
+CONVERSATION_TAIL = 6  # last N messages per paper
+
+EXTRACT_LEARNINGS_PROMPT = """Below are conversations between teachers and an AI about refining exam papers, grouped by teacher.
+For EACH teacher separately, extract ONLY reusable preferences — rules, formatting choices, content guidelines,
+or style instructions that should be applied to ALL future exam papers for that teacher.
+
+RULES:
+- Do NOT extract one-time requests (e.g. "change question 3 to be about photosynthesis")
+- Do NOT extract anything uncertain or ambiguous
+- Do NOT repeat any of the teacher's existing learnings
+- Never attribute one teacher's preference to another teacher
+- Each learning should be a short, clear instruction (one sentence)
+- At most {max_per_user} learnings per teacher
+- Categorize each as: formatting, content, style, structure, or general
+
+{blocks}
+
+Return one item per new learning, tagged with the teacher's user_id and the paper_id it came from.
+If there are no new reusable preferences, return an empty array."""
+
+
+def learning_key(learning: str) -> str:
+    """What makes two learnings the same: text compared case- and whitespace-insensitively."""
+    return " ".join(learning.split()).lower()
+
+
+class ExtractedLearning(BaseModel):
+    user_id: int
+    paper_id: int
+    category: str
+    learning: str
+
+
+class _Pending:
+    def __init__(self, now: float):
+        self.paper_ids: set[int] = set()
+        self.first_at = now
+        self.due_at = now
+
+
+class LearningWorker:
+    def __init__(self):
+        self._pending: dict[int, _Pending] = {}
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stats = {
+            "scheduled": 0,
+            "debounced": 0,
+            "batches": 0,
+            "users_processed": 0,
+            "learnings_written": 0,
+            "failed_batches": 0,
+            "lag_seconds_max": 0.0,
+            "lag_seconds_total": 0.0,
+            "last_batch_seconds": 0.0,
+        }
+
+    def schedule(self, paper_id: int, user_id: int):
+        """Request extraction for a user; restarts that user's debounce window."""
+        now = time.monotonic()
+        with self._cond:
+            self._stats["scheduled"] += 1
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = self._pending[user_id] = _Pending(now)
+            else:
+                self._stats["debounced"] += 1
+            pending.paper_ids.add(paper_id)
+            # Trailing debounce, but never starve a user who keeps chatting
+            pending.due_at = min(
+                now + settings.LEARNING_DEBOUNCE_SECONDS,
+                pending.first_at + settings.LEARNING_MAX_WAIT_SECONDS,
+            )
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="learning-worker", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def metrics(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending_users"] = len(self._pending)
+            now = time.monotonic()
+            stats["oldest_pending_seconds"] = round(
+                max((now - p.first_at for p in self._pending.values()), default=0.0), 1
+            )
+        lag_total = stats.pop("lag_seconds_total")
+        stats["lag_seconds_avg"] = round(lag_total / stats["users_processed"], 1) if stats["users_processed"] else 0.0
+        return stats
+
+    def _take_due(self) -> dict[int, _Pending]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [uid for uid, p in self._pending.items() if p.due_at <= now]
+                if due:
+                    break
+                timeout = min((p.due_at for p in self._pending.values()), default=None)
+                self._cond.wait(None if timeout is None else timeout - now)
+            due.sort(key=lambda uid: self._pending[uid].first_at)
+            return {uid: self._pending.pop(uid) for uid in due[:settings.LEARNING_BATCH_MAX_USERS]}
+
+    def _run(self):
+        while True:
+            jobs = self._take_due()
+            started = time.monotonic()
+            try:
+                written = extract_learnings({uid: p.paper_ids for uid, p in jobs.items()})
+            except Exception as e:
+                log.warning("Learning extraction batch failed (non-critical): %s", e)
+                written, failed = 0, True
+            else:
+                failed = False
+            finished = time.monotonic()
+            with self._cond:
+                self._stats["batches"] += 1
+                self._stats["failed_batches"] += int(failed)
+                self._stats["users_processed"] += len(jobs)
+                self._stats["learnings_written"] += written
+                self._stats["last_batch_seconds"] = round(finished - started, 2)
+                for p in jobs.values():
+                    lag = finished - p.first_at
+                    self._stats["lag_seconds_total"] += lag
+                    self._stats["lag_seconds_max"] = round(max(self._stats["lag_seconds_max"], lag), 1)
+
+
+def _recent_conversations(session, paper_ids: set[int]) -> dict[int, list[tuple[str, str]]]:
+    """Last CONVERSATION_TAIL messages of each paper, oldest first, in one query."""
+    ranked = select(
+        Conversation.generated_paper_id,
+        Conversation.role,
+        Conversation.content,
+        func.row_number().over(
+            partition_by=Conversation.generated_paper_id,
+            order_by=Conversation.id.desc(),
+        ).label("rn"),
+    ).where(Conversation.generated_paper_id.in_(paper_ids)).subquery()
+
+    rows = session.execute(
+        select(ranked.c.generated_paper_id, ranked.c.role, ranked.c.content)
+        .where(ranked.c.rn <= CONVERSATION_TAIL)
+        .order_by(ranked.c.generated_paper_id, ranked.c.rn.desc())
+    ).all()
+    convos: dict[int, list[tuple[str, str]]] = {}
+    for paper_id, role, content in rows:
+        convos.setdefault(paper_id, []).append((role, content))
+    return convos
+
+
+def extract_learnings(jobs: dict[int, set[int]]) -> int:
+    """Extract learnings for {user_id: paper_ids} with one Gemini call. Returns rows written."""
+    session = SyncSessionLocal()
+    try:
+        all_papers = set().union(*jobs.values())
+        convos = _recent_conversations(session, all_papers)
+
+        existing: dict[int, list[UserLearning]] = {uid: [] for uid in jobs}
+        for l in session.query(UserLearning).filter(
+            UserLearning.user_id.in_(jobs), UserLearning.is_active == True
+        ):
+            existing[l.user_id].append(l)
+
+        blocks = []
+        for user_id, paper_ids in jobs.items():
+            papers = [pid for pid in sorted(paper_ids) if len(convos.get(pid, [])) >= 2]
+            if not papers:
+                continue
+            existing_text = "\n".join(f"- [{l.category}] {l.learning}" for l in existing[user_id]) or "(none)"
+            block = f"=== TEACHER user_id={user_id} ===\nEXISTING LEARNINGS (do not duplicate these):\n{existing_text}\n"
+            for pid in papers:
+                conv_text = "\n".join(f"{role.upper()}: {content[:500]}" for role, content in convos[pid])
+                block += f"\nCONVERSATION (paper_id={pid}):\n{conv_text}\n"
+            blocks.append(block)
+        if not blocks:
+            return 0
+
+        prompt = EXTRACT_LEARNINGS_PROMPT.format(
+            max_per_user=MAX_LEARNINGS_PER_USER,
+            blocks="\n".join(blocks),
+        )
+        client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        response = client.models.generate_content(
+            model=settings.GEMINI_MODEL,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=list[ExtractedLearning],
+            ),
+        )
+        items = response.parsed
+        if items is None:
+            items = [ExtractedLearning.model_validate(i) for i in json.loads(response.text)]
+
+        seen = {uid: {learning_key(l.learning) for l in rows} for uid, rows in existing.items()}
+        per_user: dict[int, int] = {}
+        new_rows = []
+        for item in items:
+            learning_text = item.learning.strip()
+            category = item.category.strip().lower()
+            key = learning_key(learning_text)
+            # Drop hallucinated ids, duplicates, and anything over the per-user cap
+            if item.user_id not in jobs or not learning_text or key in seen[item.user_id]:
+                continue
+            if per_user.get(item.user_id, 0) >= MAX_LEARNINGS_PER_USER:
+                continue
+            if category not in LEARNING_CATEGORIES:
+                category = "general"
+            new_rows.append({
+                "user_id": item.user_id,
+                "category": category,
+                "learning": learning_text,
+                "learning_key": key,
+                "source_paper_id": item.paper_id if item.paper_id in jobs[item.user_id] else None,
+                "is_active": True,
+            })
+            seen[item.user_id].add(key)
+            per_user[item.user_id] = per_user.get(item.user_id, 0) + 1
+
+        written = _insert_learnings(session, new_rows) if new_rows else 0
+        session.commit()
+        for user_id in per_user:
+            learnings_cache.invalidate_user(user_id)
+        log.info("Extracted %d learnings for %d users", written, len(jobs))
+        return written
+
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _insert_learnings(session, rows: list[dict]) -> int:
+    """Insert in one statement, skipping learnings the user already has. Returns rows inserted.
+
+    `existing` was read before the Gemini call, so a learning written since then (by the
+    worker of another app process) is caught by the unique (user_id, learning_key)
+    index rather than duplicated.
+    """
+    insert = postgresql.insert if session.get_bind().dialect.name == "postgresql" else sqlite.insert
+    stmt = (
+        insert(UserLearning)
+        .on_conflict_do_nothing(index_elements=["user_id", "learning_key"])
+        .returning(UserLearning.id)
+    )
+    return len(session.execute(stmt, rows).all())
+
+
+async def backfill(conn):
+    """Key learnings stored before learning_key existed, dropping the duplicates among them."""
+    rows = (await conn.execute(
+        select(UserLearning.id, UserLearning.user_id, UserLearning.learning).order_by(UserLearning.id)
+    )).all()
+    keys, duplicates, seen = [], [], set()
+    for learning_id, user_id, learning in rows:
+        key = learning_key(learning)
+        if (user_id, key) in seen:
+            duplicates.append(learning_id)
+            continue
+        seen.add((user_id, key))
+        keys.append({"b_id": learning_id, "b_key": key})
+    if duplicates:
+        await conn.execute(UserLearning.__table__.delete().where(UserLearning.id.in_(duplicates)))
+    if keys:
+        await conn.execute(
+            update(UserLearning.__table__)
+            .where(UserLearning.id == bindparam("b_id"))
+            .values(learning_key=bindparam("b_key")),
+            keys,
+        )
+    # create_all skipped it: the table already existed
+    for index in UserLearning.__table__.indexes:
+        await conn.run_sync(index.create, checkfirst=True)
+    log.info("Keyed %d existing learnings, removed %d duplicates", len(keys), len(duplicates))
+
+
+learning_worker = LearningWorker()
@@ -0,0 +1,177 @@
+"""Per-user cache of active UserLearning rows and their formatted prompt block.
+
+Every generation and chat turn needs the same learnings block, so it is loaded
+once per user and kept until a write invalidates it. Writers call
+invalidate_user() after committing; with several processes the invalidation is
+fanned out through a broadcaster (Postgres LISTEN/NOTIFY), and a TTL bounds the
+damage of a missed message.
+"""
+
+import logging
+import select as select_module
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import text
+from ..config import settings
+from ..database import sync_engine
+from ..models import UserLearning
+
+log = logging.getLogger(__name__)
+
+BLOCK_LIMIT = 20  # learnings injected into prompts, newest first
+NOTIFY_CHANNEL = "examforge_learnings"
+
+
+@dataclass(frozen=True)
+class CachedLearning:
+    id: int
+    category: str
+    learning: str
+    source_paper_id: int | None
+    is_active: bool
+    created_at: datetime
+
+
+@dataclass(frozen=True)
+class _Entry:
+    rows: tuple[CachedLearning, ...]
+    block: str
+    loaded_at: float
+
+
+_entries: dict[int, _Entry] = {}
+_versions: dict[int, int] = {}  # bumped on every invalidation; guards against caching stale loads
+_lock = threading.Lock()
+
+
+def active_learnings_query(user_id: int):
+    return (
+        UserLearning.__table__.select()
+        .where(UserLearning.user_id == user_id, UserLearning.is_active == True)
+        .order_by(UserLearning.created_at.desc())
+    )
+
+
+def _format_block(rows: tuple[CachedLearning, ...]) -> str:
+    if not rows:
+        return ""
+    lines = [f"- [{l.category}] {l.learning}" for l in rows[:BLOCK_LIMIT]]
+    return (
+        "\n\nUSER PREFERENCES (learned from previous sessions — always apply these):\n"
+        + "\n".join(lines)
+    )
+
+
+def version(user_id: int) -> int:
+    """Take before loading from the DB and pass to store()."""
+    with _lock:
+        return _versions.get(user_id, 0)
+
+
+def get(user_id: int) -> _Entry | None:
+    with _lock:
+        entry = _entries.get(user_id)
+    if entry and time.monotonic() - entry.loaded_at < settings.LEARNINGS_CACHE_TTL_SECONDS:
+        return entry
+    return None
+
+
+def store(user_id: int, rows, loaded_version: int) -> _Entry:
+    """Cache rows loaded with active_learnings_query (mappings or objects)."""
+    cached = tuple(
+        CachedLearning(r.id, r.category, r.learning, r.source_paper_id, r.is_active, r.created_at)
+        for r in rows
+    )
+    entry = _Entry(cached, _format_block(cached), time.monotonic())
+    with _lock:
+        # An invalidation raced with this load: serve the result but don't cache it
+        if _versions.get(user_id, 0) == loaded_version:
+            _entries[user_id] = entry
+    return entry
+
+
+def load(user_id: int, session) -> _Entry:
+    """Cached entry for a user, loading through a sync session on a miss."""
+    entry = get(user_id)
+    if entry is None:
+        loaded_version = version(user_id)
+        rows = session.execute(active_learnings_query(user_id)).all()
+        entry = store(user_id, rows, loaded_version)
+    return entry
+
+
+def invalidate_user(user_id: int, broadcast: bool = True):
+    """Drop a user's cached learnings. Call after committing a learnings write."""
+    with _lock:
+        _entries.pop(user_id, None)
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+    if broadcast:
+        try:
+            _broadcaster.publish(user_id)
+        except Exception as e:
+            # Other processes fall back to the TTL
+            log.warning("Learnings invalidation broadcast failed for user %d: %s", user_id, e)
+
+
+def _clear():
+    with _lock:
+        for user_id in _entries:
+            _versions[user_id] = _versions.get(user_id, 0) + 1
+        _entries.clear()
+
+
+# ── Broadcast ────────────────────────────────────────────────────────────────
+
+class LocalBroadcast:
+    """Single-process deployments: nothing to fan out."""
+
+    def publish(self, user_id: int):
+        pass
+
+    def start(self):
+        pass
+
+
+class PostgresBroadcast:
+    """Fan invalidations out to every process via LISTEN/NOTIFY."""
+
+    def publish(self, user_id: int):
+        with sync_engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": str(user_id)})
+
+    def start(self):
+        threading.Thread(target=self._listen, name="learnings-listener", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            raw = None
+            try:
+                raw = sync_engine.raw_connection()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Anything published while we were disconnected was missed
+                _clear()
+                while True:
+                    if select_module.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        invalidate_user(int(note.payload), broadcast=False)
+            except Exception as e:
+                log.warning("Learnings listener disconnected, retrying: %s", e)
+                if raw is not None:
+                    raw.invalidate()
+                time.sleep(5)
+
+
+_broadcasters = {"local": LocalBroadcast, "postgres": PostgresBroadcast}
+_broadcaster = _broadcasters[settings.LEARNINGS_CACHE_BROADCAST]()
+
+
+def start_broadcast_listener():
+    _broadcaster.start()
@@ -0,0 +1,226 @@
+"""Assemble a paper from the user's question bank without an LLM call.
+
+select_questions() picks ExtractedQuestion rows that satisfy the difficulty mix,
+topics and question types, then repairs the selection toward total_marks with
+greedy swaps. render_paper() / render_answer_key() lay the result out as markdown.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from itertools import cycle
+
+# Marks assumed for questions whose source paper didn't state them
+DEFAULT_MARKS = {"mcq": 1, "true_false": 1, "fill_blank": 1, "short_answer": 2, "long_answer": 5}
+
+SECTION_ORDER = ["mcq", "fill_blank", "true_false", "short_answer", "long_answer"]
+SECTION_TITLES = {
+    "mcq": "Multiple Choice Questions",
+    "fill_blank": "Fill in the Blanks",
+    "true_false": "True or False",
+    "short_answer": "Short Answer Questions",
+    "long_answer": "Long Answer Questions",
+}
+
+MAX_REPAIR_SWAPS = 200
+_OPTION_PREFIX_RE = re.compile(r"^\(?[A-Ha-h][).:]\s*")
+
+
+class AssemblyError(RuntimeError):
+    """The bank can't satisfy the requested constraints."""
+
+
+@dataclass
+class Candidate:
+    id: int
+    question_text: str
+    answer_text: str | None
+    question_type: str
+    difficulty: str
+    topic: str | None
+    marks: float
+    options: list[str]
+    correct_option: str | None
+
+    @classmethod
+    def from_row(cls, row) -> "Candidate":
+        try:
+            options = json.loads(row.options_json) if row.options_json else []
+        except ValueError:
+            options = []
+        return cls(
+            id=row.id,
+            question_text=row.question_text.strip(),
+            answer_text=row.answer_text,
+            question_type=row.question_type,
+            difficulty=row.difficulty,
+            topic=row.topic,
+            marks=row.marks or DEFAULT_MARKS.get(row.question_type, 1),
+            options=options if isinstance(options, list) else [],
+            correct_option=row.correct_option,
+        )
+
+
+def _pick_round_robin(pool: list[Candidate], count: int, target_each: float) -> list[Candidate]:
+    """Take `count` questions spreading across topics, preferring marks near target_each."""
+    by_topic: dict[str, list[Candidate]] = {}
+    for c in sorted(pool, key=lambda c: (abs(c.marks - target_each), -c.id)):
+        by_topic.setdefault((c.topic or "").lower(), []).append(c)
+
+    picked: list[Candidate] = []
+    for topic in cycle(list(by_topic)):
+        if len(picked) == count or not any(by_topic.values()):
+            break
+        if by_topic[topic]:
+            picked.append(by_topic[topic].pop(0))
+    return picked
+
+
+def _repair_marks(selected: list[Candidate], pool: list[Candidate], target: float) -> list[Candidate]:
+    """Swap questions of the same difficulty while it brings the total closer to target."""
+    selected = list(selected)
+    chosen = {c.id for c in selected}
+    # Spare questions bucketed by (difficulty, marks): a swap only depends on those two
+    spare: dict[tuple[str, float], list[Candidate]] = {}
+    for c in pool:
+        if c.id not in chosen:
+            spare.setdefault((c.difficulty, c.marks), []).append(c)
+    total = sum(c.marks for c in selected)
+
+    for _ in range(MAX_REPAIR_SWAPS):
+        gap = abs(total - target)
+        if gap == 0:
+            break
+        best = None
+        for i, out in enumerate(selected):
+            for (difficulty, marks), bucket in spare.items():
+                if difficulty != out.difficulty or not bucket:
+                    continue
+                new_gap = abs(total - out.marks + marks - target)
+                if new_gap < gap and (best is None or new_gap < best[0]):
+                    best = (new_gap, i, (difficulty, marks))
+        if best is None:
+            break
+        _, i, key = best
+        out, inn = selected[i], spare[key].pop(0)
+        total += inn.marks - out.marks
+        selected[i] = inn
+        spare.setdefault((out.difficulty, out.marks), []).append(out)
+    return selected
+
+
+def select_questions(
+    candidates: list[Candidate],
+    difficulty_mix: dict[str, int],
+    total_marks: float | None = None,
+    topics: list[str] | None = None,
+    question_types: list[str] | None = None,
+    exclude_ids: set[int] | None = None,
+) -> list[Candidate]:
+    """Choose questions for the difficulty counts in difficulty_mix, aiming at total_marks."""
+    wanted_topics = {t.lower() for t in topics or []}
+    seen_texts = set()
+    pool = []
+    for c in candidates:
+        key = " ".join(c.question_text.lower().split())
+        if (exclude_ids and c.id in exclude_ids) or key in seen_texts:
+            continue
+        if wanted_topics and (c.topic or "").lower() not in wanted_topics:
+            continue
+        if question_types and c.question_type not in question_types:
+            continue
+        seen_texts.add(key)
+        pool.append(c)
+
+    total_count = sum(difficulty_mix.values())
+    if total_count <= 0:
+        raise AssemblyError("Difficulty mix must ask for at least one question")
+    target_each = (total_marks / total_count) if total_marks else 0
+
+    selected: list[Candidate] = []
+    for difficulty, count in difficulty_mix.items():
+        if count <= 0:
+            continue
+        available = [c for c in pool if c.difficulty == difficulty]
+        if len(available) < count:
+            raise AssemblyError(
+                f"Not enough '{difficulty}' questions in your bank for these filters "
+                f"(need {count}, found {len(available)})"
+            )
+        selected += _pick_round_robin(available, count, target_each)
+
+    if total_marks:
+        selected = _repair_marks(selected, pool, total_marks)
+    return selected
+
+
+def _clean_option(option: str) -> str:
+    return _OPTION_PREFIX_RE.sub("", str(option).strip())
+
+
+def _sections(selected: list[Candidate]) -> list[tuple[str, list[Candidate]]]:
+    grouped: dict[str, list[Candidate]] = {}
+    for c in selected:
+        grouped.setdefault(c.question_type, []).append(c)
+    order = SECTION_ORDER + sorted(set(grouped) - set(SECTION_ORDER))
+    return [(t, grouped[t]) for t in order if t in grouped]
+
+
+def _format_marks(marks: float) -> str:
+    return str(int(marks)) if float(marks).is_integer() else str(marks)
+
+
+def _marks_label(marks: float) -> str:
+    return f"[{_format_marks(marks)} mark{'s' if marks != 1 else ''}]"
+
+
+def render_paper(
+    selected: list[Candidate],
+    title: str,
+    board: str | None,
+    grade: str | None,
+    subject: str | None,
+    duration: int | None,
+) -> str:
+    total = sum(c.marks for c in selected)
+    sections = _sections(selected)
+    lines = [
+        f"# {title}",
+        "",
+        f"**Board:** {board or 'General'} | **Grade:** {grade or '-'} | **Subject:** {subject or 'General'}",
+        "",
+        f"**Time:** {duration or 180} minutes | **Maximum Marks:** {_format_marks(total)}",
+        "",
+        "**General Instructions:**",
+        "",
+        "1. All questions are compulsory.",
+        f"2. This paper contains {len(selected)} questions in {len(sections)} sections.",
+        "3. Marks for each question are indicated against it.",
+        "",
+    ]
+    number = 1
+    for letter, (qtype, questions) in zip("ABCDEFGHIJ", sections):
+        lines += ["---", "", f"## Section {letter} — {SECTION_TITLES.get(qtype, qtype.replace('_', ' ').title())}", ""]
+        for c in questions:
+            body = c.question_text.replace("\n", "\n   ")
+            lines.append(f"{number}. {body} **{_marks_label(c.marks)}**")
+            for opt_letter, option in zip("ABCDEFGH", c.options):
+                lines.append(f"   - ({opt_letter}) {_clean_option(option)}")
+            lines.append("")
+            number += 1
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def render_answer_key(selected: list[Candidate], title: str) -> str:
+    lines = [f"# {title} — Answer Key", ""]
+    number = 1
+    for letter, (qtype, questions) in zip("ABCDEFGHIJ", _sections(selected)):
+        lines += [f"## Section {letter} — {SECTION_TITLES.get(qtype, qtype.replace('_', ' ').title())}", ""]
+        for c in questions:
+            answer = (c.answer_text or "").strip().replace("\n", "\n   ")
+            if c.correct_option:
+                answer = f"**({c.correct_option.strip('() ').upper()})** {answer}".rstrip()
+            lines.append(f"{number}. {answer or '*Answer not available in the question bank.*'}")
+            lines.append("")
+            number += 1
+    return "\n".join(lines).rstrip() + "\n"
@@ -2,133 +2,35 @@
 
 import json
 import logging
+import re
 import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from google import genai
 from google.genai import types
+from sqlalchemy import func, select
 from ..database import SyncSessionLocal
-from ..models import GeneratedPaper, ExtractedQuestion, Conversation, UploadedPaper, UserLearning
+from ..models import GeneratedPaper, ExtractedQuestion, Conversation, UploadedPaper
 from ..config import settings
+from .chat_context import condense_history
+from .context_cache import cached_prefix, invalidate_paper
+from .export_pool import export_pool
+from .learning_worker import learning_worker
+from . import learnings_cache
+from .format_skeleton import build_format_skeleton, SECTION_RE, QUESTION_STYLES, MARKS_STYLES
+from .paper_assembler import Candidate, select_questions, render_paper, render_answer_key
 
 log = logging.getLogger(__name__)
 
+DEFAULT_DIFFICULTY_MIX = {"easy": 3, "medium": 4, "hard": 3}
+BANK_REFERENCE_LIMIT = 50  # Reference questions per generated paper
 
-# ── Learning extraction ──────────────────────────────────────────────────────
-
-EXTRACT_LEARNINGS_PROMPT = """Analyze the following conversation between a user and an AI about refining an exam paper.
-Extract ONLY reusable preferences — rules, formatting choices, content guidelines, or style instructions
-that should be applied to ALL future exam papers for this user.
-
-RULES:
-- Do NOT extract one-time requests (e.g. "change question 3 to be about photosynthesis")
-- Do NOT extract anything uncertain or ambiguous
-- Do NOT repeat any of the existing learnings listed below
-- Each learning should be a short, clear instruction (one sentence)
-- Categorize each as: formatting, content, style, structure, or general
-
-EXISTING LEARNINGS (do not duplicate these):
-{existing_learnings}
-
-CONVERSATION:
-{conversation}
-
-Return a JSON array of objects. If there are no new reusable preferences, return an empty array [].
-Example: [{{"category": "formatting", "learning": "Always bold section headers"}}, {{"category": "content", "learning": "Include Bloom's taxonomy level for each question"}}]
-
-JSON array:"""
 
+# ── User learnings ──────────────────────────────────────────────────────────
 
 def _get_user_learnings_block(user_id: int, session) -> str:
-    """Fetch active learnings and format as a prompt block."""
-    learnings = (
-        session.query(UserLearning)
-        .filter(UserLearning.user_id == user_id, UserLearning.is_active == True)
-        .order_by(UserLearning.created_at.desc())
-        .limit(20)
-        .all()
-    )
-    if not learnings:
-        return ""
-    lines = [f"- [{l.category}] {l.learning}" for l in learnings]
-    return (
-        "\n\nUSER PREFERENCES (learned from previous sessions — always apply these):\n"
-        + "\n".join(lines)
-    )
-
-
-def extract_learnings(paper_id: int, user_id: int):
-    """Background: call Gemini to extract reusable preferences from conversation."""
-    session = SyncSessionLocal()
-    try:
-        conversations = (
-            session.query(Conversation)
-            .filter(Conversation.generated_paper_id == paper_id)
-            .order_by(Conversation.created_at)
-            .all()
-        )
-        if len(conversations) < 2:
-            return
-
-        conv_text = "\n".join(
-            f"{c.role.upper()}: {c.content[:500]}" for c in conversations[-6:]  # last 6 messages
-        )
-
-        existing = (
-            session.query(UserLearning)
-            .filter(UserLearning.user_id == user_id, UserLearning.is_active == True)
-            .all()
-        )
-        existing_text = "\n".join(f"- [{l.category}] {l.learning}" for l in existing) or "(none)"
-
-        prompt = EXTRACT_LEARNINGS_PROMPT.format(
-            existing_learnings=existing_text,
-            conversation=conv_text,
-        )
-
-        client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        response = client.models.generate_content(model=settings.GEMINI_MODEL, contents=prompt)
-
-        raw = response.text.strip()
-        # Strip markdown code fences if present
-        if raw.startswith("```"):
-            raw = raw.split("\n", 1)[1] if "\n" in raw else raw[3:]
-            if raw.endswith("```"):
-                raw = raw[:-3]
-            raw = raw.strip()
-
-        new_learnings = json.loads(raw)
-        if not isinstance(new_learnings, list):
-            return
-
-        existing_texts = {l.learning.lower().strip() for l in existing}
-
-        for item in new_learnings[:5]:  # max 5 per extraction
-            learning_text = item.get("learning", "").strip()
-            category = item.get("category", "general").strip().lower()
-            if not learning_text:
-                continue
-            if learning_text.lower().strip() in existing_texts:
-                continue
-            if category not in ("formatting", "content", "style", "structure", "general"):
-                category = "general"
-
-            session.add(UserLearning(
-                user_id=user_id,
-                category=category,
-                learning=learning_text,
-                source_paper_id=paper_id,
-                is_active=True,
-            ))
-            existing_texts.add(learning_text.lower().strip())
-
-        session.commit()
-        log.info("Extracted learnings for user %d from paper %d", user_id, paper_id)
-
-    except Exception as e:
-        log.warning("Learning extraction failed (non-critical): %s", e)
-        session.rollback()
-    finally:
-        session.close()
+    """Active learnings formatted as a prompt block (cached per user)."""
+    return learnings_cache.load(user_id, session).block
 
 
 def _clean_paper_content(text: str) -> str:
@@ -148,6 +50,42 @@ def _clean_paper_content(text: str) -> str:
     # No preamble detected, return as-is
     return text.strip()
 
+
+def _get_format_skeleton(session, user_id: int, subject: str | None) -> str:
+    """Skeleton of the newest completed upload for a subject, without loading its extracted text."""
+    ref = session.query(UploadedPaper.id, UploadedPaper.format_skeleton).filter(
+        UploadedPaper.user_id == user_id,
+        UploadedPaper.subject == subject,
+        UploadedPaper.status == "completed",
+        UploadedPaper.extracted_text.isnot(None),
+    ).order_by(UploadedPaper.created_at.desc()).first()
+    if not ref:
+        return ""
+    if ref.format_skeleton is not None:
+        return ref.format_skeleton
+
+    # Uploaded before skeletons were computed at ingest: backfill once
+    text = session.query(UploadedPaper.extracted_text).filter(UploadedPaper.id == ref.id).scalar()
+    skeleton = build_format_skeleton(text or "")
+    session.query(UploadedPaper).filter(UploadedPaper.id == ref.id).update({"format_skeleton": skeleton})
+    session.commit()
+    return skeleton
+
+
+def _format_reference_block(session, user_id: int, subject: str | None) -> str:
+    """Prompt block with the skeleton of the teacher's most recent paper for this subject."""
+    skeleton = _get_format_skeleton(session, user_id, subject)
+    if not skeleton:
+        return ""
+    return (
+        "FORMAT REFERENCE (skeleton of the teacher's own paper — replicate its header, section structure, "
+        "numbering style, and marks notation; question bodies are intentionally omitted):\n"
+        "---\n"
+        f"{skeleton}\n"
+        "---"
+    )
+
+
 GENERATE_PROMPT = """You are an expert exam paper creator for {board} board, Grade {grade}, {subject}.
 
 Using the question bank below as reference material and style guide, create a NEW original exam paper.
@@ -174,7 +112,11 @@ CRITICAL FORMATTING RULES:
 - Match the reference paper's section headings (e.g. Section A, Section B), question grouping, and marks distribution pattern exactly.
 - Preserve the same style of marks indication (e.g. "[2 marks]", "(2)", "2M") as used in the reference.
 
-Generate TWO sections in your response, separated by the exact marker "===ANSWER_KEY===":
+{output_instructions}
+
+Output the paper now:"""
+
+PAPER_AND_KEY_OUTPUT = """Generate TWO sections in your response, separated by the exact marker "===ANSWER_KEY===":
 
 1. FIRST: The complete exam paper in Markdown format with:
    - Paper header matching the reference format (school name, logo placement, exam title, subject, grade, marks, duration)
@@ -182,13 +124,120 @@ Generate TWO sections in your response, separated by the exact marker "===ANSWER
    - Numbered questions organized by sections exactly as in the reference paper
    - Marks indicated for each question
 
-2. AFTER the marker "===ANSWER_KEY===": The complete answer key in Markdown with answers for every question.
+2. AFTER the marker "===ANSWER_KEY===": The complete answer key in Markdown with answers for every question."""
+
+PAPER_ONLY_OUTPUT = """Generate ONLY the complete exam paper in Markdown format (no answer key) with:
+   - Paper header matching the reference format (school name, logo placement, exam title, subject, grade, marks, duration)
+   - Clear instructions for students
+   - Numbered questions organized by sections exactly as in the reference paper
+   - Marks indicated for each question"""
+
+ANSWER_KEY_PROMPT = """You are an expert examiner for {board} board, Grade {grade}, {subject}.
+Write the complete answer key for the exam paper below in Markdown.
+- Answer every question in order, using the paper's own section headings and question numbers
+- For MCQs give the correct option and a one-line justification
+- For long answers list the expected marking points with marks
+{additional_instructions}
+
+Start directly with the answer key title — no preamble.
+
+---PAPER---
+{paper}
+---END PAPER---"""
+
+
+def _bank_questions_query(user_id: int, subject: str | None, limit: int):
+    return select(ExtractedQuestion).where(
+        ExtractedQuestion.user_id == user_id,
+        ExtractedQuestion.subject == subject,
+        ExtractedQuestion.duplicate_of_id.is_(None),
+    ).limit(limit)
+
+
+def _load_bank_questions(session, user_id: int, subject: str | None, limit: int) -> list:
+    return session.scalars(_bank_questions_query(user_id, subject, limit)).all()
+
+
+def _format_question_bank(questions) -> str:
+    question_bank = ""
+    for q in questions:
+        question_bank += f"- [{q.question_type}][{q.difficulty}] {q.question_text}\n"
+        if q.answer_text:
+            question_bank += f"  Answer: {q.answer_text}\n"
+    return question_bank or "(No reference questions available - generate original content)"
+
+
+def _build_generate_prompt(paper, question_bank: str, format_reference: str, learnings_block: str, with_answer_key: bool = True) -> str:
+    topics = json.loads(paper.topics_json) if paper.topics_json else ["General"]
+    difficulty_mix = json.loads(paper.difficulty_mix_json) if paper.difficulty_mix_json else DEFAULT_DIFFICULTY_MIX
+    return GENERATE_PROMPT.format(
+        board=paper.board or "General",
+        grade=paper.grade_level or "10",
+        subject=paper.subject or "General",
+        title=paper.title,
+        total_marks=paper.total_marks or 100,
+        duration=paper.duration_minutes or 180,
+        difficulty_mix=json.dumps(difficulty_mix),
+        topics=", ".join(topics),
+        question_types="all types",
+        additional_instructions=learnings_block,
+        question_bank=question_bank[:20000],
+        format_reference=format_reference,
+        output_instructions=PAPER_AND_KEY_OUTPUT if with_answer_key else PAPER_ONLY_OUTPUT,
+    )
+
+
+def _generate_text(prompt: str) -> str:
+    client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    response = client.models.generate_content(model=settings.GEMINI_MODEL, contents=prompt)
+    return response.text
+
+
+def _store_generated(paper, response_text: str, with_answer_key: bool = True):
+    """Split a paper + answer key response onto the paper row."""
+    if not with_answer_key:
+        # Paper only: the key is produced later by ensure_answer_key
+        paper.content_markdown = _clean_paper_content(response_text.split("===ANSWER_KEY===", 1)[0])
+        paper.answer_key_markdown = None
+        paper.answer_key_status = "pending"
+    elif "===ANSWER_KEY===" in response_text:
+        parts = response_text.split("===ANSWER_KEY===", 1)
+        paper.content_markdown = _clean_paper_content(parts[0])
+        paper.answer_key_markdown = _clean_paper_content(parts[1])
+        paper.answer_key_status = "completed"
+    else:
+        # No key in the reply: leave it for ensure_answer_key like the on-demand path
+        paper.content_markdown = _clean_paper_content(response_text)
+        paper.answer_key_markdown = None
+        paper.answer_key_status = "pending"
+
+
+def _prerender(paper):
+    """Queue background export renders for the paper's current version."""
+    try:
+        export_pool.prerender(paper.id, paper.title, paper.content_markdown, paper.answer_key_markdown)
+    except Exception as e:
+        # Non-critical: the first download renders on demand
+        log.warning("Export pre-render for paper %d could not be queued: %s", paper.id, e)
+
+
+def _mark_failed(session, paper_id: int, error: Exception):
+    try:
+        paper = session.get(GeneratedPaper, paper_id)
+        if paper:
+            paper.status = "failed"
+            paper.error_message = str(error)[:500]
+            session.commit()
+    except Exception:
+        session.rollback()
 
-Output the paper now:"""
 
+def generate_paper_background(paper_id: int, answer_key: str = "eager"):
+    """Run in a background thread. Generates paper content using Gemini.
 
-def generate_paper_background(paper_id: int):
-    """Run in a background thread. Generates paper content using Gemini."""
+    answer_key: "eager" writes paper and key in one call; "background" completes the
+    paper first and then fills the key; "on_demand" leaves it for ensure_answer_key.
+    """
     session = SyncSessionLocal()
     try:
         paper = session.get(GeneratedPaper, paper_id)
@@ -196,113 +245,433 @@ def generate_paper_background(paper_id: int):
             return
 
         # Gather questions from user's bank for context
-        questions = session.query(ExtractedQuestion).filter(
-            ExtractedQuestion.user_id == paper.user_id,
-            ExtractedQuestion.subject == paper.subject,
-        ).limit(50).all()
-
-        question_bank = ""
-        for q in questions:
-            question_bank += f"- [{q.question_type}][{q.difficulty}] {q.question_text}\n"
-            if q.answer_text:
-                question_bank += f"  Answer: {q.answer_text}\n"
-
-        if not question_bank:
-            question_bank = "(No reference questions available - generate original content)"
-
-        # Fetch format reference from the most recent uploaded paper for this subject
-        ref_paper = session.query(UploadedPaper).filter(
-            UploadedPaper.user_id == paper.user_id,
-            UploadedPaper.subject == paper.subject,
-            UploadedPaper.status == "completed",
-            UploadedPaper.extracted_text.isnot(None),
-        ).order_by(UploadedPaper.created_at.desc()).first()
-
-        if ref_paper and ref_paper.extracted_text:
-            format_reference = (
-                "FORMAT REFERENCE (replicate this paper's layout, header style, section structure, "
-                "school name position, and overall formatting — but generate NEW questions):\n"
-                "---\n"
-                f"{ref_paper.extracted_text[:5000]}\n"
-                "---"
-            )
-        else:
-            format_reference = ""
-
-        topics = json.loads(paper.topics_json) if paper.topics_json else ["General"]
-        difficulty_mix = json.loads(paper.difficulty_mix_json) if paper.difficulty_mix_json else {"easy": 3, "medium": 4, "hard": 3}
-
+        questions = _load_bank_questions(session, paper.user_id, paper.subject, BANK_REFERENCE_LIMIT)
+        format_reference = _format_reference_block(session, paper.user_id, paper.subject)
         # Inject learned user preferences
         learnings_block = _get_user_learnings_block(paper.user_id, session)
 
-        prompt = GENERATE_PROMPT.format(
-            board=paper.board or "General",
-            grade=paper.grade_level or "10",
-            subject=paper.subject or "General",
-            title=paper.title,
-            total_marks=paper.total_marks or 100,
-            duration=paper.duration_minutes or 180,
-            difficulty_mix=json.dumps(difficulty_mix),
-            topics=", ".join(topics),
-            question_types="all types",
-            additional_instructions=learnings_block,
-            question_bank=question_bank[:20000],
-            format_reference=format_reference,
-        )
+        with_key = answer_key == "eager"
+        prompt = _build_generate_prompt(paper, _format_question_bank(questions), format_reference, learnings_block, with_key)
+        _store_generated(paper, _generate_text(prompt), with_key)
 
-        client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        response = client.models.generate_content(model=settings.GEMINI_MODEL, contents=prompt)
+        paper.status = "completed"
+        session.commit()
+        log.info("Paper %d generated successfully", paper_id)
+        _prerender(paper)
 
-        response_text = response.text
+        if answer_key == "background":
+            try:
+                ensure_answer_key(paper_id)
+            except Exception:
+                pass  # Logged by ensure_answer_key; retried on first request
 
-        if "===ANSWER_KEY===" in response_text:
-            parts = response_text.split("===ANSWER_KEY===", 1)
-            paper.content_markdown = _clean_paper_content(parts[0])
-            paper.answer_key_markdown = _clean_paper_content(parts[1])
-        else:
-            paper.content_markdown = _clean_paper_content(response_text)
-            paper.answer_key_markdown = "*Answer key was not generated separately. Please use chat to request it.*"
+    except Exception as e:
+        log.error("Paper %d generation failed: %s\n%s", paper_id, e, traceback.format_exc())
+        _mark_failed(session, paper_id, e)
+    finally:
+        session.close()
+
+
+# ── Assembly from the question bank ─────────────────────────────────────────
+
+POLISH_PROMPT = """You are an expert exam paper editor for {board} board, Grade {grade}, {subject}.
+The exam paper and answer key below were assembled from the teacher's own question bank. Polish them for printing:
+- Fix grammar, spacing, and inconsistent formatting
+- Keep EVERY question, its number, its marks, and its section exactly as given — do not add, remove, reorder, or reword questions
+- Keep each answer matched to its question number
+{additional_instructions}
+
+{format_reference}
+
+Output the polished paper, then the exact marker "===ANSWER_KEY===", then the polished answer key.
+Do NOT include any conversational text before the paper.
+
+---PAPER---
+{paper}
+---ANSWER KEY---
+{answer_key}"""
+
+
+def _candidates_query(user_id: int, subject: str | None):
+    return select(
+        ExtractedQuestion.id,
+        ExtractedQuestion.question_text,
+        ExtractedQuestion.answer_text,
+        ExtractedQuestion.question_type,
+        ExtractedQuestion.difficulty,
+        ExtractedQuestion.topic,
+        ExtractedQuestion.marks,
+        ExtractedQuestion.options_json,
+        ExtractedQuestion.correct_option,
+    ).where(
+        ExtractedQuestion.user_id == user_id,
+        ExtractedQuestion.subject == subject,
+        ExtractedQuestion.duplicate_of_id.is_(None),
+    ).order_by(ExtractedQuestion.id.desc())
+
+
+def _load_candidates(session, user_id: int, subject: str | None) -> list[Candidate]:
+    return [Candidate.from_row(r) for r in session.execute(_candidates_query(user_id, subject))]
+
+
+def _assemble(paper, candidates: list[Candidate], question_types: list[str], exclude_ids: set[int] | None = None) -> list[Candidate]:
+    """Select questions for a paper and render its markdown. Returns the selection."""
+    selected = select_questions(
+        candidates,
+        json.loads(paper.difficulty_mix_json) if paper.difficulty_mix_json else DEFAULT_DIFFICULTY_MIX,
+        total_marks=paper.total_marks,
+        topics=json.loads(paper.topics_json) if paper.topics_json else [],
+        question_types=question_types,
+        exclude_ids=exclude_ids,
+    )
+    paper.content_markdown = render_paper(
+        selected, paper.title, paper.board, paper.grade_level, paper.subject, paper.duration_minutes,
+    )
+    paper.answer_key_markdown = render_answer_key(selected, paper.title)
+    return selected
+
+
+def _build_polish_prompt(paper, format_reference: str, learnings_block: str) -> str:
+    return POLISH_PROMPT.format(
+        board=paper.board or "General",
+        grade=paper.grade_level or "10",
+        subject=paper.subject or "General",
+        additional_instructions=learnings_block,
+        format_reference=format_reference,
+        paper=paper.content_markdown,
+        answer_key=paper.answer_key_markdown,
+    )
+
+
+def _store_polished(paper, response_text: str):
+    # Only trust a response that kept both halves; otherwise keep the assembled version
+    if "===ANSWER_KEY===" in response_text:
+        parts = response_text.split("===ANSWER_KEY===", 1)
+        paper.content_markdown = _clean_paper_content(parts[0])
+        paper.answer_key_markdown = _clean_paper_content(parts[1])
+
+
+def assemble_paper_background(paper_id: int, question_types: list[str], polish: bool = False):
+    """Run in a background thread. Builds the paper from the question bank, optionally polishing it with Gemini."""
+    session = SyncSessionLocal()
+    try:
+        paper = session.get(GeneratedPaper, paper_id)
+        if not paper:
+            return
+
+        candidates = _load_candidates(session, paper.user_id, paper.subject)
+        selected = _assemble(paper, candidates, question_types)
+
+        if polish:
+            try:
+                prompt = _build_polish_prompt(
+                    paper,
+                    _format_reference_block(session, paper.user_id, paper.subject),
+                    _get_user_learnings_block(paper.user_id, session),
+                )
+                _store_polished(paper, _generate_text(prompt))
+            except Exception as e:
+                # Non-critical: the assembled paper is already complete
+                log.warning("Polish pass failed for paper %d, keeping assembled version: %s", paper_id, e)
 
         paper.status = "completed"
         session.commit()
-        log.info("Paper %d generated successfully", paper_id)
+        log.info("Paper %d assembled from %d bank questions", paper_id, len(selected))
+        _prerender(paper)
 
     except Exception as e:
-        log.error("Paper %d generation failed: %s\n%s", paper_id, e, traceback.format_exc())
-        try:
+        log.error("Paper %d assembly failed: %s\n%s", paper_id, e, traceback.format_exc())
+        _mark_failed(session, paper_id, e)
+    finally:
+        session.close()
+
+
+# ── Batch variants (Set A/B/C) ──────────────────────────────────────────────
+
+VARIANT_INSTRUCTIONS = (
+    "\n- This is Set {label} of {count} parallel versions of the same test. Each set gets a different "
+    "slice of the reference bank; base your questions only on the references given here so no two sets "
+    "share a question. Keep the same structure, marks distribution, and difficulty as the other sets."
+)
+VARIANT_AVOID_INSTRUCTIONS = "\n- These questions are already in another set; do not reuse or reword any of them:\n{questions}"
+VARIANT_ATTEMPTS = 3  # Generations per variant before one that keeps repeating another set fails
+VARIANT_OVERLAP_THRESHOLD = 0.6  # Share of word trigrams at which two questions count as the same
+INSTRUCTIONS_RE = re.compile(r"^(?:general\s+)?instructions\b", re.I)
+
+
+def _shingles(text: str) -> frozenset:
+    for _, pattern in MARKS_STYLES:
+        text = pattern.sub(" ", text)
+    words = re.findall(r"\w+", text.lower())
+    return frozenset(tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2)))
+
+
+def _variant_questions(response_text: str) -> list[tuple[str, frozenset]]:
+    """(stem, word trigrams) of each numbered question in a generated paper, instructions skipped."""
+    paper_text = response_text.split("===ANSWER_KEY===", 1)[0]
+    lines = [l.strip().lstrip("#").replace("*", "").strip() for l in paper_text.splitlines()]
+    # With sections, numbered lines before the first one are instructions, not questions
+    in_preamble = any(SECTION_RE.match(l) for l in lines)
+    questions = []
+    for line in lines:
+        if SECTION_RE.match(line):
+            in_preamble = False
+            continue
+        if INSTRUCTIONS_RE.match(line):
+            in_preamble = True
+            continue
+        if in_preamble:
+            continue
+        for _, pattern in QUESTION_STYLES:
+            m = pattern.match(line)
+            if m:
+                stem = line[m.end():].strip()
+                if stem:
+                    questions.append((stem, _shingles(stem)))
+                break
+    return questions
+
+
+def _repeated_questions(questions: list[tuple[str, frozenset]], taken: list[tuple[str, frozenset]]) -> list[str]:
+    """Stems of `questions` that match a question already in another set."""
+    return [
+        stem for stem, shingles in questions
+        if any(len(shingles & other) >= VARIANT_OVERLAP_THRESHOLD * len(shingles | other) for _, other in taken)
+    ]
+
+
+def _generate_variants(session, papers: list, answer_key: str = "eager"):
+    """LLM variants: shared context built once, disjoint reference slices, Gemini calls in parallel.
+
+    The slices and instructions only ask for distinct questions, so each finished variant
+    is checked against the variants already stored. One that repeats a question is
+    regenerated with the repeats listed to avoid, and fails after VARIANT_ATTEMPTS.
+    """
+    base = papers[0]
+    questions = _load_bank_questions(session, base.user_id, base.subject, BANK_REFERENCE_LIMIT * len(papers))
+    format_reference = _format_reference_block(session, base.user_id, base.subject)
+    learnings_block = _get_user_learnings_block(base.user_id, session)
+    banks = {paper.id: _format_question_bank(questions[i::len(papers)]) for i, paper in enumerate(papers)}
+
+    def prompt(paper, avoid: str = "") -> str:
+        note = VARIANT_INSTRUCTIONS.format(label=paper.variant_label, count=len(papers))
+        return _build_generate_prompt(
+            paper, banks[paper.id], format_reference, learnings_block + note + avoid,
+            with_answer_key=answer_key == "eager",
+        )
+
+    by_id = {p.id: p for p in papers}
+    attempts = dict.fromkeys(by_id, 1)
+    taken: list[tuple[str, frozenset]] = []  # Questions of the variants stored so far
+    with ThreadPoolExecutor(max_workers=len(papers)) as pool:
+        pending = {pool.submit(_generate_text, prompt(p)): p.id for p in papers}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                paper = by_id[pending.pop(future)]
+                try:
+                    response_text = future.result()
+                    variant_questions = _variant_questions(response_text)
+                    repeated = _repeated_questions(variant_questions, taken)
+                    if repeated:
+                        if attempts[paper.id] >= VARIANT_ATTEMPTS:
+                            raise ValueError(
+                                f"Set {paper.variant_label} repeats {len(repeated)} question(s) from another set "
+                                f"after {VARIANT_ATTEMPTS} attempts"
+                            )
+                        attempts[paper.id] += 1
+                        log.info("Batch variant %d repeats %d questions, regenerating", paper.id, len(repeated))
+                        avoid = VARIANT_AVOID_INSTRUCTIONS.format(questions="\n".join(f"  - {q}" for q in repeated))
+                        pending[pool.submit(_generate_text, prompt(paper, avoid))] = paper.id
+                        continue
+                    _store_generated(paper, response_text, with_answer_key=answer_key == "eager")
+                    taken.extend(variant_questions)
+                    paper.status = "completed"
+                except Exception as e:
+                    log.error("Batch variant %d generation failed: %s", paper.id, e)
+                    paper.status = "failed"
+                    paper.error_message = str(e)[:500]
+                session.commit()  # Batch progress is visible per finished variant
+                if paper.status == "completed":
+                    _prerender(paper)
+
+    if answer_key == "background":
+        with ThreadPoolExecutor(max_workers=len(papers)) as pool:
+            for paper in papers:
+                if paper.status == "completed":
+                    pool.submit(ensure_answer_key, paper.id)
+
+
+def _assemble_variants(session, papers: list, question_types: list[str], polish: bool):
+    """Bank variants: selected one after another so no question appears in two sets."""
+    base = papers[0]
+    candidates = _load_candidates(session, base.user_id, base.subject)
+    used: set[int] = set()
+    for paper in papers:
+        used.update(c.id for c in _assemble(paper, candidates, question_types, exclude_ids=used))
+
+    if polish:
+        format_reference = _format_reference_block(session, base.user_id, base.subject)
+        learnings_block = _get_user_learnings_block(base.user_id, session)
+        with ThreadPoolExecutor(max_workers=len(papers)) as pool:
+            futures = {
+                pool.submit(_generate_text, _build_polish_prompt(p, format_reference, learnings_block)): p
+                for p in papers
+            }
+            for future in as_completed(futures):
+                try:
+                    _store_polished(futures[future], future.result())
+                except Exception as e:
+                    log.warning("Polish pass failed for paper %d, keeping assembled version: %s", futures[future].id, e)
+
+    for paper in papers:
+        paper.status = "completed"
+    session.commit()
+    for paper in papers:
+        _prerender(paper)
+
+
+def generate_batch_background(
+    paper_ids: list[int], mode: str, question_types: list[str], polish: bool = False, answer_key: str = "eager",
+):
+    """Run in a background thread. Fills every variant paper of a batch."""
+    session = SyncSessionLocal()
+    try:
+        papers = session.query(GeneratedPaper).filter(
+            GeneratedPaper.id.in_(paper_ids)
+        ).order_by(GeneratedPaper.id).all()
+        if not papers:
+            return
+
+        if mode == "assemble":
+            _assemble_variants(session, papers, question_types, polish)
+        else:
+            _generate_variants(session, papers, answer_key)
+        log.info("Batch %s finished: %d variants", papers[0].batch_id, len(papers))
+
+    except Exception as e:
+        log.error("Batch generation failed for papers %s: %s\n%s", paper_ids, e, traceback.format_exc())
+        session.rollback()
+        for paper_id in paper_ids:
             paper = session.get(GeneratedPaper, paper_id)
-            if paper:
-                paper.status = "failed"
-                paper.error_message = str(e)[:500]
-                session.commit()
-        except Exception:
-            session.rollback()
+            if paper and paper.status == "generating":
+                _mark_failed(session, paper_id, e)
     finally:
         session.close()
 
 
-def refine_paper_with_chat(paper_id: int, user_message: str, user_id: int):
-    """Send conversation history + current paper to Gemini for refinement."""
+# ── Lazy answer keys ────────────────────────────────────────────────────────
+
+# Regenerations allowed when the paper is rewritten mid-generation
+ANSWER_KEY_ATTEMPTS = 3
+
+_answer_key_locks: dict[int, threading.Lock] = {}
+_answer_key_locks_guard = threading.Lock()
+
+
+def _answer_key_lock(paper_id: int) -> threading.Lock:
+    with _answer_key_locks_guard:
+        return _answer_key_locks.setdefault(paper_id, threading.Lock())
+
+
+def ensure_answer_key(paper_id: int) -> str | None:
+    """Return the paper's answer key, generating and caching it on first use.
+
+    Concurrent callers for the same paper wait for a single Gemini call. A chat
+    refinement can rewrite the paper while the key is being generated, so the key is
+    only stored if the paper is still the one it was written for; otherwise the
+    refinement's key is returned, or a new one is generated for the new content.
+    """
+    with _answer_key_lock(paper_id):
+        session = SyncSessionLocal()
+        try:
+            for _ in range(ANSWER_KEY_ATTEMPTS):
+                paper = session.get(GeneratedPaper, paper_id)
+                if not paper or not paper.content_markdown:
+                    return None
+                if paper.answer_key_markdown:
+                    return paper.answer_key_markdown
+
+                paper.answer_key_status = "generating"
+                session.commit()
+
+                used_content = paper.content_markdown
+                prompt = ANSWER_KEY_PROMPT.format(
+                    board=paper.board or "General",
+                    grade=paper.grade_level or "10",
+                    subject=paper.subject or "General",
+                    additional_instructions=_get_user_learnings_block(paper.user_id, session),
+                    paper=used_content,
+                )
+                answer_key = _clean_paper_content(_generate_text(prompt))
+
+                stored = session.query(GeneratedPaper).filter(
+                    GeneratedPaper.id == paper_id,
+                    GeneratedPaper.content_markdown == used_content,
+                    GeneratedPaper.answer_key_markdown.is_(None),
+                ).update({"answer_key_markdown": answer_key, "answer_key_status": "completed"}, synchronize_session=False)
+                session.commit()
+                session.expire_all()
+                if stored:
+                    log.info("Answer key generated for paper %d", paper_id)
+                    _prerender(session.get(GeneratedPaper, paper_id))
+                    return answer_key
+                log.info("Paper %d changed while its answer key was generated; discarding the key", paper_id)
+
+            raise RuntimeError(f"paper kept changing during {ANSWER_KEY_ATTEMPTS} answer key attempts")
+
+        except Exception as e:
+            log.error("Answer key generation failed for paper %d: %s", paper_id, e)
+            session.rollback()
+            paper = session.get(GeneratedPaper, paper_id)
+            if paper and not paper.answer_key_markdown:
+                paper.answer_key_status = "failed"
+                session.commit()
+            raise
+        finally:
+            session.close()
+
+
+def _combine_messages(user_messages: list[str]) -> str:
+    """Merge messages sent while a previous turn was in flight into one prompt."""
+    if len(user_messages) == 1:
+        return user_messages[0]
+    numbered = "\n".join(f"{i}. {m}" for i, m in enumerate(user_messages, 1))
+    return f"I sent several messages in a row. Apply all of them together in a single update:\n{numbered}"
+
+
+def refine_paper_with_chat(paper_id: int, user_messages: list[str], user_id: int):
+    """Send conversation history + current paper to Gemini for refinement.
+
+    Not safe to run concurrently for the same paper; go through chat_queue.submit_chat_message.
+    """
     session = SyncSessionLocal()
     try:
         paper = session.get(GeneratedPaper, paper_id)
         if not paper:
             return None, []
 
-        # Save user message
-        user_msg = Conversation(
-            generated_paper_id=paper_id,
-            user_id=user_id,
-            role="user",
-            content=user_message,
-        )
-        session.add(user_msg)
+        # Save user messages (one row each, answered by a single Gemini call)
+        for message in user_messages:
+            session.add(Conversation(
+                generated_paper_id=paper_id,
+                user_id=user_id,
+                role="user",
+                content=message,
+            ))
         session.commit()
 
-        # Build conversation history for Gemini chat
+        # Only messages not yet folded into the rolling summary are needed
         conversations = session.query(Conversation).filter(
-            Conversation.generated_paper_id == paper_id
-        ).order_by(Conversation.created_at).all()
+            Conversation.generated_paper_id == paper_id,
+            Conversation.id > (paper.chat_summary_through_id or 0),
+        ).order_by(Conversation.created_at, Conversation.id).all()
+
+        client = genai.Client(api_key=settings.GEMINI_API_KEY)
+
+        # Exclude the new messages (we'll send them via send_message)
+        recent = condense_history(paper, conversations[:-len(user_messages)], client)
+        session.commit()
 
         # Inject learned user preferences
         learnings_block = _get_user_learnings_block(user_id, session)
@@ -311,7 +680,7 @@ def refine_paper_with_chat(paper_id: int, user_message: str, user_id: int):
         system_context = (
             f"You are helping refine an exam paper. The current paper content is:\n\n"
             f"---PAPER---\n{paper.content_markdown}\n---END PAPER---\n\n"
-            f"---ANSWER KEY---\n{paper.answer_key_markdown}\n---END ANSWER KEY---\n\n"
+            f"---ANSWER KEY---\n{paper.answer_key_markdown or '(not written yet — include a complete one with your next update)'}\n---END ANSWER KEY---\n\n"
             f"CRITICAL RULES:\n"
             f"- Question numbering MUST always start from 1, never 0.\n"
             f"- Preserve the paper's existing structure, section organization, header format, and marks layout.\n"
@@ -323,23 +692,30 @@ def refine_paper_with_chat(paper_id: int, user_message: str, user_id: int):
             f"{learnings_block}"
         )
 
-        # Build Gemini chat history (all messages except the last user message)
-        history = [
-            {"role": "user", "parts": [system_context]},
-            {"role": "model", "parts": ["I understand. I have the current exam paper and answer key. What changes would you like me to make?"]},
+        # Paper context is the same on every turn until the paper changes: serve it from the context cache
+        context_turns = [
+            types.Content(role="user", parts=[types.Part.from_text(text=system_context)]),
+            types.Content(role="model", parts=[types.Part.from_text(
+                text="I understand. I have the current exam paper and answer key. What changes would you like me to make?"
+            )]),
         ]
+        history_typed, chat_config = cached_prefix(client, paper_id, context_turns)
 
-        for conv in conversations[:-1]:  # Exclude last message (we'll send it via send_message)
-            role = "model" if conv.role == "assistant" else "user"
-            history.append({"role": role, "parts": [conv.content]})
+        # Then the summary of older turns and the recent turns verbatim
+        history = []
+        if paper.chat_summary:
+            history.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{paper.chat_summary}"]})
+            history.append({"role": "model", "parts": ["Noted. I will keep those earlier decisions in mind."]})
 
-        history_typed = [
+        for role, text in recent:
+            history.append({"role": "model" if role == "assistant" else "user", "parts": [text]})
+
+        history_typed += [
             types.Content(role=item["role"], parts=[types.Part.from_text(text=item["parts"][0])])
             for item in history
         ]
-        client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        chat = client.chats.create(model=settings.GEMINI_MODEL, history=history_typed)
-        response = chat.send_message(user_message)
+        chat = client.chats.create(model=settings.GEMINI_MODEL, history=history_typed, config=chat_config)
+        response = chat.send_message(_combine_messages(user_messages))
 
         assistant_text = response.text
 
@@ -353,21 +729,25 @@ def refine_paper_with_chat(paper_id: int, user_message: str, user_id: int):
         session.add(asst_msg)
 
         # Update paper if response contains marker
-        if "===ANSWER_KEY===" in assistant_text:
+        updated = "===ANSWER_KEY===" in assistant_text
+        if updated:
             parts = assistant_text.split("===ANSWER_KEY===", 1)
             paper.content_markdown = _clean_paper_content(parts[0])
             paper.answer_key_markdown = _clean_paper_content(parts[1])
+            paper.answer_key_status = "completed"
+            invalidate_paper(paper_id, client)
 
         session.commit()
+        if updated:
+            _prerender(paper)
 
         # Trigger learning extraction every 3rd user message
-        user_msg_count = sum(1 for c in conversations if c.role == "user")
-        if user_msg_count % 3 == 0 and user_msg_count > 0:
-            threading.Thread(
-                target=extract_learnings,
-                args=(paper_id, user_id),
-                daemon=True,
-            ).start()
+        user_msg_count = session.query(func.count(Conversation.id)).filter(
+            Conversation.generated_paper_id == paper_id,
+            Conversation.role == "user",
+        ).scalar() or 0
+        if user_msg_count // 3 > (user_msg_count - len(user_messages)) // 3:
+            learning_worker.schedule(paper_id, user_id)
 
         # Return updated paper and all messages
         session.refresh(paper)
@@ -6,8 +6,12 @@ import traceback
 from pathlib import Path
 from ..database import SyncSessionLocal
 from ..models import UploadedPaper, ExtractedQuestion
-from .text_extractor import extract_text
+from .text_extractor import extract_pages
+from .text_normalizer import normalize_pages
 from .claude_analyzer import analyze_paper
+from .ingest_scheduler import ingest_scheduler
+from .format_skeleton import build_format_skeleton
+from .question_dedup import index_questions
 
 log = logging.getLogger(__name__)
 
@@ -24,8 +28,10 @@ def process_paper_background(paper_id: int, file_path: Path, file_type: str):
         paper.status = "extracting"
         session.commit()
 
-        extracted = extract_text(file_path, file_type)
+        pages = extract_pages(file_path, file_type)
+        extracted = "\n\n".join(pages)
         paper.extracted_text = extracted
+        paper.format_skeleton = build_format_skeleton(extracted)
 
         if not extracted.strip():
             paper.status = "failed"
@@ -37,10 +43,21 @@ def process_paper_background(paper_id: int, file_path: Path, file_type: str):
         paper.status = "analyzing"
         session.commit()
 
-        questions_data = analyze_paper(extracted)
+        normalized = normalize_pages(pages)
+        log.info(
+            "Paper %d normalized: %d -> %d chars, ~%d tokens saved (%d repeated, %d boilerplate lines)",
+            paper_id, normalized.chars_before, normalized.chars_after, normalized.tokens_saved,
+            normalized.repeated_lines_removed, normalized.boilerplate_lines_removed,
+        )
+        if ingest_scheduler.is_small(normalized.text):
+            # Shares one Gemini call with other small uploads; this thread waits for its share
+            questions_data = ingest_scheduler.submit(paper_id, normalized.text).result()
+        else:
+            questions_data = analyze_paper(normalized.text)
 
         # Step 3: Save questions
         topics = set()
+        saved = []
         for idx, q in enumerate(questions_data):
             eq = ExtractedQuestion(
                 paper_id=paper.id,
@@ -60,17 +77,26 @@ def process_paper_background(paper_id: int, file_path: Path, file_type: str):
                 order_in_paper=idx + 1,
             )
             session.add(eq)
+            saved.append(eq)
             if q.get("topic"):
                 topics.add(q["topic"])
 
+        session.flush()  # Ids for the similarity index
+        duplicates = index_questions(session, saved)
+
         paper.topics_json = json.dumps(sorted(topics)) if topics else None
+        paper.question_count = len(questions_data)  # Committed together with the questions
         paper.status = "completed"
         session.commit()
-        log.info("Paper %d processed: %d questions extracted", paper_id, len(questions_data))
+        log.info(
+            "Paper %d processed: %d questions extracted, %d near-duplicates of earlier questions",
+            paper_id, len(questions_data), duplicates,
+        )
 
     except Exception as e:
         log.error("Paper %d processing failed: %s\n%s", paper_id, e, traceback.format_exc())
         try:
+            session.rollback()  # Discard questions flushed before the failure
             paper = session.get(UploadedPaper, paper_id)
             if paper:
                 paper.status = "failed"
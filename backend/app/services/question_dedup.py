@@ -0,0 +1,296 @@
+"""Near-duplicate detection for the question bank: MinHash signatures with an LSH index.
+
+A question's normalized text is cut into character shingles and summarized by a
+MinHash signature. One-permutation hashing with rotation densification keeps
+that at one hash per shingle instead of one per shingle per permutation. The
+signature is split into bands. Each band is hashed to a bucket key stored in
+question_buckets, and two questions share a bucket with a probability that rises
+steeply with their similarity. A lookup reads only the query's own buckets, so
+its cost follows the number of similar questions, not the size of the bank.
+
+At ingest, a question whose estimated similarity to an earlier question of the
+same user reaches QUESTION_DEDUP_THRESHOLD gets duplicate_of_id pointing at the
+original. Flagged questions stay with their paper but are left out of the
+question bank list, the stats rollup and generation context. When an original
+is deleted, its oldest remaining duplicate takes its place.
+"""
+
+import hashlib
+import logging
+import re
+import struct
+from collections import defaultdict
+from operator import eq
+from sqlalchemy import bindparam, delete, event, select, update
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models import ExtractedQuestion, QuestionBucket, QuestionSignature, QuestionStat
+
+log = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5  # Characters
+# A pair at similarity s shares at least one bucket with probability 1 - (1 - s^ROWS)^BANDS:
+# 0.95 at s = 0.8, 0.38 at 0.6, 0.04 at 0.4. Six rows per band keep questions that only share
+# boilerplate ("Which of the following ...") out of each other's buckets.
+BANDS, ROWS = 10, 6
+NUM_HASHES = BANDS * ROWS
+BACKFILL_BATCH = 2000
+_IN_CHUNK = 500  # Values per IN (...) list
+
+_DENSIFY = 0x9E3779B97F4A7C15  # Mixed into values borrowed from a bin d places away
+_SIG_FORMAT = struct.Struct(f"<{NUM_HASHES}I")
+
+_NUMBERING_RE = re.compile(r"^\s*(?:q(?:uestion)?\.?\s*)?\(?(?:\d{1,3}|[ivx]{1,4}|[a-h])[.):]\s+", re.I)
+_MARKS_RE = re.compile(r"[\[(]\s*\d+(?:\.\d+)?\s*marks?\s*[\])]", re.I)
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercased words only, without the question number and a marks annotation."""
+    text = _MARKS_RE.sub(" ", _NUMBERING_RE.sub("", text or ""))
+    return _NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def minhash(text: str) -> tuple[int, ...] | None:
+    """NUM_HASHES 32-bit values, or None if the normalized text is empty."""
+    norm = normalize(text)
+    if not norm:
+        return None
+    shingles = {norm[i:i + SHINGLE_SIZE] for i in range(max(1, len(norm) - SHINGLE_SIZE + 1))}
+    bins: list[int | None] = [None] * NUM_HASHES
+    for shingle in shingles:
+        h = _hash64(shingle.encode())
+        v, b = divmod(h, NUM_HASHES)
+        if bins[b] is None or v < bins[b]:
+            bins[b] = v
+    # Short texts leave bins empty; each borrows from the next filled bin to its right
+    signature = []
+    for b in range(NUM_HASHES):
+        d = 0
+        while bins[(b + d) % NUM_HASHES] is None:
+            d += 1
+        signature.append((bins[(b + d) % NUM_HASHES] ^ (d * _DENSIFY)) & 0xFFFFFFFF)
+    return tuple(signature)
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the two texts' shingle sets."""
+    return sum(map(eq, a, b)) / NUM_HASHES
+
+
+def band_keys(signature: tuple[int, ...]) -> list[int]:
+    """One signed 64-bit bucket key per band."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        key = _hash64(struct.pack(f"<B{ROWS}I", band, *rows))
+        keys.append(key - (1 << 64) if key >= 1 << 63 else key)
+    return keys
+
+
+def _pack(signature: tuple[int, ...] | None) -> bytes:
+    return _SIG_FORMAT.pack(*signature) if signature else b""
+
+
+def _unpack(blob: bytes | None) -> tuple[int, ...] | None:
+    return _SIG_FORMAT.unpack(blob) if blob else None
+
+
+def _chunks(values: list, size: int = _IN_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _bucket_members_query(user_id: int, keys: list[int]):
+    return (
+        select(QuestionBucket.bucket, QuestionBucket.question_id)
+        .where(QuestionBucket.user_id == user_id, QuestionBucket.bucket.in_(keys))
+    )
+
+
+def _indexed_query(question_ids: list[int]):
+    return (
+        select(QuestionSignature.question_id, QuestionSignature.minhash, ExtractedQuestion.duplicate_of_id)
+        .join(ExtractedQuestion, ExtractedQuestion.id == QuestionSignature.question_id)
+        .where(QuestionSignature.question_id.in_(question_ids))
+    )
+
+
+def _unindex_statements(question_ids: list[int]) -> list:
+    return [
+        delete(QuestionBucket.__table__).where(QuestionBucket.question_id.in_(question_ids)),
+        delete(QuestionSignature.__table__).where(QuestionSignature.question_id.in_(question_ids)),
+    ]
+
+
+def _duplicates_query(original_ids: list[int]):
+    return (
+        select(ExtractedQuestion)
+        .where(ExtractedQuestion.duplicate_of_id.in_(original_ids))
+        .order_by(ExtractedQuestion.id)
+    )
+
+
+def _bucket_members(conn, user_id: int, keys: set[int]) -> dict[int, set[int]]:
+    members: dict[int, set[int]] = defaultdict(set)
+    for chunk in _chunks(list(keys)):
+        rows = conn.execute(_bucket_members_query(user_id, chunk))
+        for bucket, question_id in rows:
+            members[bucket].add(question_id)
+    return members
+
+
+def _load_indexed(conn, question_ids: set[int]) -> dict[int, tuple[tuple[int, ...] | None, int | None]]:
+    """question_id -> (signature, duplicate_of_id)."""
+    found = {}
+    for chunk in _chunks(list(question_ids)):
+        rows = conn.execute(_indexed_query(chunk))
+        for question_id, blob, duplicate_of_id in rows:
+            found[question_id] = (_unpack(blob), duplicate_of_id)
+    return found
+
+
+def index_rows(conn, questions: list[tuple[int, int, str]], threshold: float) -> dict[int, int]:
+    """Index (id, user_id, question_text) rows that aren't indexed yet, oldest first.
+
+    Each question is checked against the user's indexed questions and the ones
+    before it in `questions`. Returns {id: original id} for the near-duplicates.
+    """
+    if not questions:
+        return {}
+    signatures = {qid: minhash(text) for qid, _, text in questions}
+    keys = {qid: band_keys(sig) for qid, sig in signatures.items() if sig}
+
+    per_user: dict[int, set[int]] = defaultdict(set)
+    for qid, user_id, _ in questions:
+        per_user[user_id].update(keys.get(qid, ()))
+    members = {user_id: _bucket_members(conn, user_id, user_keys) for user_id, user_keys in per_user.items()}
+    indexed = _load_indexed(conn, {qid for buckets in members.values() for ids in buckets.values() for qid in ids})
+    known = {qid: sig for qid, (sig, _) in indexed.items()}
+    original_of = {qid: duplicate_of_id or qid for qid, (_, duplicate_of_id) in indexed.items()}
+
+    flagged, bucket_rows = {}, []
+    for qid, user_id, _ in questions:
+        signature = signatures[qid]
+        if signature is None:
+            continue
+        buckets = members[user_id]
+        candidates = {c for key in keys[qid] for c in buckets.get(key, ()) if known.get(c)}
+        # Most similar first, then the oldest
+        best = max(((similarity(signature, known[c]), -c) for c in candidates), default=None)
+        if best is not None and best[0] >= threshold:
+            flagged[qid] = original_of[-best[1]]
+        original_of[qid] = flagged.get(qid, qid)
+        known[qid] = signature
+        for key in keys[qid]:
+            buckets[key].add(qid)
+            bucket_rows.append({"user_id": user_id, "bucket": key, "question_id": qid})
+
+    conn.execute(QuestionSignature.__table__.insert(), [
+        {"question_id": qid, "minhash": _pack(signatures[qid])} for qid, _, _ in questions
+    ])
+    if bucket_rows:
+        conn.execute(QuestionBucket.__table__.insert(), bucket_rows)
+    return flagged
+
+
+def index_questions(session, questions: list[ExtractedQuestion]) -> int:
+    """Index just-flushed questions and flag the near-duplicates among them.
+
+    Runs in the session's transaction, so the index commits with the questions.
+    Returns the number flagged.
+    """
+    rows = [(q.id, q.user_id, q.question_text) for q in sorted(questions, key=lambda q: q.id)]
+    flagged = index_rows(session.connection(), rows, settings.QUESTION_DEDUP_THRESHOLD)
+    for q in questions:
+        if q.id in flagged:
+            q.duplicate_of_id = flagged[q.id]
+    return len(flagged)
+
+
+def find_similar(conn, question_id: int, user_id: int, limit: int, min_similarity: float) -> list[tuple[int, float]]:
+    """The user's questions most similar to `question_id`, as (id, similarity), best first.
+
+    Candidates come from the LSH buckets, so the lower a pair's similarity the
+    likelier it is to be missed (see BANDS, ROWS).
+    """
+    blob = conn.execute(
+        select(QuestionSignature.minhash).where(QuestionSignature.question_id == question_id)
+    ).scalar()
+    signature = _unpack(blob)
+    if signature is None:
+        return []
+    buckets = _bucket_members(conn, user_id, set(band_keys(signature)))
+    candidates = {c for ids in buckets.values() for c in ids} - {question_id}
+    scored = [
+        (c, similarity(signature, sig))
+        for c, (sig, _) in _load_indexed(conn, candidates).items() if sig
+    ]
+    scored = [(c, s) for c, s in scored if s >= min_similarity]
+    scored.sort(key=lambda cs: (-cs[1], cs[0]))
+    return scored[:limit]
+
+
+# Inserted ahead of the question_stats hook, so the stats see the promotions made here
+@event.listens_for(Session, "before_flush", insert=True)
+def _before_flush(session, flush_context, instances):
+    deleted = {obj.id for obj in session.deleted if isinstance(obj, ExtractedQuestion)}
+    if not deleted:
+        return
+    conn = session.connection()
+    for chunk in _chunks(sorted(deleted)):
+        for stmt in _unindex_statements(chunk):
+            conn.execute(stmt)
+
+    # The oldest surviving duplicate of a deleted original becomes the original
+    remaining: dict[int, list[ExtractedQuestion]] = defaultdict(list)
+    with session.no_autoflush:
+        for chunk in _chunks(sorted(deleted)):
+            for q in session.scalars(_duplicates_query(chunk)):
+                if q.id not in deleted:  # Deleted in the same flush; filtered here to keep the IN list bounded
+                    remaining[q.duplicate_of_id].append(q)
+    for first, *rest in remaining.values():
+        first.duplicate_of_id = None
+        for q in rest:
+            q.duplicate_of_id = first.id
+
+
+async def backfill(conn):
+    """Index questions that predate the index (first start after upgrading)."""
+    await conn.run_sync(_backfill)
+
+
+def _backfill(conn):
+    unindexed = (
+        select(ExtractedQuestion.id, ExtractedQuestion.user_id, ExtractedQuestion.question_text)
+        .outerjoin(QuestionSignature, QuestionSignature.question_id == ExtractedQuestion.id)
+        .where(QuestionSignature.question_id.is_(None))
+        .order_by(ExtractedQuestion.id)
+        .limit(BACKFILL_BATCH)
+    )
+    indexed = flagged = 0
+    last_id = 0
+    while True:
+        rows = [tuple(r) for r in conn.execute(unindexed.where(ExtractedQuestion.id > last_id))]
+        if not rows:
+            break
+        found = index_rows(conn, rows, settings.QUESTION_DEDUP_THRESHOLD)
+        if found:
+            conn.execute(
+                update(ExtractedQuestion.__table__)
+                .where(ExtractedQuestion.id == bindparam("b_id"))
+                .values(duplicate_of_id=bindparam("b_original")),
+                [{"b_id": qid, "b_original": original} for qid, original in found.items()],
+            )
+        indexed += len(rows)
+        flagged += len(found)
+        last_id = rows[-1][0]
+    if flagged:
+        # Counts changed under the rollup; question_stats.backfill rebuilds it
+        conn.execute(delete(QuestionStat.__table__))
+    if indexed:
+        log.info("Indexed %d questions for near-duplicate detection, %d flagged as duplicates", indexed, flagged)
@@ -0,0 +1,130 @@
+"""Full-text search over the question bank.
+
+SQLite uses an external-content FTS5 table (extracted_questions_fts) kept in sync
+by triggers; Postgres uses a stored generated tsvector column with a GIN index.
+Either way the database maintains the index on every insert, update and delete,
+cascades included, so ingestion and deletion code doesn't change. Matches are
+ranked with question text weighted over topic over answer text.
+"""
+
+import logging
+import re
+from sqlalchemy import func, literal_column, or_, table, column, text
+from ..config import settings
+from ..models import ExtractedQuestion
+
+log = logging.getLogger(__name__)
+
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+FTS_TABLE = "extracted_questions_fts"
+TS_CONFIG = "english"
+
+_fts_available = True  # Cleared if this SQLite build lacks FTS5
+
+_SQLITE_FTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        question_text, answer_text, topic,
+        content='extracted_questions', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON extracted_questions BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, question_text, answer_text, topic)
+        VALUES (new.id, new.question_text, new.answer_text, new.topic);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON extracted_questions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, question_text, answer_text, topic)
+        VALUES ('delete', old.id, old.question_text, old.answer_text, old.topic);
+    END""",
+    # Only edits to indexed columns touch the index (not duplicate flags or other bookkeeping).
+    # Recreated on startup so databases with the earlier any-column trigger pick this up.
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF question_text, answer_text, topic
+        ON extracted_questions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, question_text, answer_text, topic)
+        VALUES ('delete', old.id, old.question_text, old.answer_text, old.topic);
+        INSERT INTO {FTS_TABLE}(rowid, question_text, answer_text, topic)
+        VALUES (new.id, new.question_text, new.answer_text, new.topic);
+    END""",
+]
+
+_POSTGRES_FTS = [
+    # Adding a STORED generated column computes it for every existing row
+    f"""ALTER TABLE extracted_questions ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{TS_CONFIG}', coalesce(question_text, '')), 'A')
+            || setweight(to_tsvector('{TS_CONFIG}', coalesce(topic, '')), 'B')
+            || setweight(to_tsvector('{TS_CONFIG}', coalesce(answer_text, '')), 'C')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_extracted_questions_search ON extracted_questions USING GIN (search_vector)",
+]
+
+
+async def init_search(conn):
+    """Create the search index if missing and backfill it from existing questions."""
+    global _fts_available
+    if not IS_SQLITE:
+        for ddl in _POSTGRES_FTS:
+            await conn.execute(text(ddl))
+        return
+
+    exists = (await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    )).first()
+    try:
+        for ddl in _SQLITE_FTS:
+            await conn.execute(text(ddl))
+    except Exception as e:
+        _fts_available = False
+        log.warning("SQLite FTS5 unavailable, question search falls back to LIKE: %s", e)
+        return
+    if not exists:
+        await conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        log.info("Built question search index")
+
+
+def _fts5_query(query: str) -> str | None:
+    """User text -> FTS5 query: every word must match, the last one as a prefix.
+
+    Words are quoted so FTS5 operators and punctuation in the input can't cause
+    syntax errors.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"  # Search-as-you-type
+    return " ".join(terms)
+
+
+def apply_search(stmt, query: str):
+    """Restrict a select over ExtractedQuestion to matches of `query`.
+
+    Returns (statement, rank ordering), best match first, or (None, None) if the
+    query has no searchable words.
+    """
+    if not IS_SQLITE:
+        tsquery = func.websearch_to_tsquery(TS_CONFIG, query)
+        vector = literal_column("extracted_questions.search_vector")
+        return stmt.where(vector.op("@@")(tsquery)), func.ts_rank_cd(vector, tsquery).desc()
+
+    if not _fts_available:
+        words = re.findall(r"\w+", query)
+        if not words:
+            return None, None
+        for w in words:
+            pattern = f"%{w}%"
+            stmt = stmt.where(or_(
+                ExtractedQuestion.question_text.ilike(pattern),
+                ExtractedQuestion.answer_text.ilike(pattern),
+                ExtractedQuestion.topic.ilike(pattern),
+            ))
+        return stmt, ExtractedQuestion.id.desc()
+
+    match = _fts5_query(query)
+    if match is None:
+        return None, None
+    fts = table(FTS_TABLE, column("rowid"))
+    stmt = stmt.join(fts, fts.c.rowid == ExtractedQuestion.id).where(
+        text(f"{FTS_TABLE} MATCH :fts_match").bindparams(fts_match=match)
+    )
+    # bm25 is lower-is-better; column weights follow the declared column order
+    return stmt, text(f"bm25({FTS_TABLE}, 10.0, 1.0, 4.0)")
@@ -0,0 +1,127 @@
+"""Per-user question counts by type, difficulty, subject, grade, board and topic.
+
+The question_stats table holds one row per (user, dimension, value), plus a
+("total", "") row. It is kept current by a before_flush hook: every flush that
+inserts, deletes or edits ExtractedQuestion rows (including the cascade when a
+paper or user is deleted) applies the matching count changes on the flush's own
+connection, so they commit or roll back with the questions themselves.
+Near-duplicates (duplicate_of_id set, see question_dedup.py) aren't counted.
+"""
+
+import logging
+from collections import Counter
+from sqlalchemy import event, delete, func, inspect, literal, select, text
+from sqlalchemy.orm import Session
+from ..models import ExtractedQuestion, QuestionStat, User
+
+log = logging.getLogger(__name__)
+
+# dimension -> ExtractedQuestion attribute
+DIMENSIONS = {
+    "type": "question_type",
+    "difficulty": "difficulty",
+    "subject": "subject",
+    "grade": "grade_level",
+    "board": "board",
+    "topic": "topic",
+}
+TOTAL = "total"
+
+_UPSERT = text(
+    "INSERT INTO question_stats (user_id, dimension, value, count) VALUES (:user_id, :dimension, :value, :delta) "
+    "ON CONFLICT (user_id, dimension, value) DO UPDATE SET count = question_stats.count + excluded.count"
+)
+
+
+_TRACKED = (*DIMENSIONS.values(), "duplicate_of_id")
+
+
+def _current(question: ExtractedQuestion) -> dict:
+    return {attr: getattr(question, attr) for attr in _TRACKED}
+
+
+def _committed(question: ExtractedQuestion) -> dict:
+    """Values as the database has them, before this flush's edits."""
+    state = inspect(question)
+    values = {}
+    for attr in _TRACKED:
+        history = state.attrs[attr].history
+        if history.has_changes():
+            values[attr] = history.deleted[0] if history.deleted else None
+        else:
+            values[attr] = getattr(question, attr)
+    return values
+
+
+def _count(deltas: Counter, user_id: int, values: dict, sign: int):
+    if values["duplicate_of_id"] is not None:
+        return
+    deltas[(user_id, TOTAL, "")] += sign
+    for dimension, attr in DIMENSIONS.items():
+        value = values[attr]
+        if value is not None:
+            deltas[(user_id, dimension, str(value))] += sign
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    deltas: Counter = Counter()
+    deleted_users = set()
+    for obj in session.new:
+        if isinstance(obj, ExtractedQuestion):
+            _count(deltas, obj.user_id, _current(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, ExtractedQuestion):
+            _count(deltas, obj.user_id, _committed(obj), -1)
+        elif isinstance(obj, User):
+            deleted_users.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, ExtractedQuestion) and session.is_modified(obj, include_collections=False):
+            _count(deltas, obj.user_id, _committed(obj), -1)
+            _count(deltas, obj.user_id, _current(obj), 1)
+
+    rows = [
+        {"user_id": user_id, "dimension": dimension, "value": value, "delta": delta}
+        for (user_id, dimension, value), delta in deltas.items()
+        if delta and user_id not in deleted_users
+    ]
+    if not rows and not deleted_users:
+        return
+
+    conn = session.connection()
+    if rows:
+        conn.execute(_UPSERT, rows)
+        conn.execute(
+            delete(QuestionStat.__table__).where(
+                QuestionStat.user_id.in_({r["user_id"] for r in rows}),
+                QuestionStat.count <= 0,
+            )
+        )
+    if deleted_users:
+        # Before the users row goes, so the foreign key holds without relying on ON DELETE
+        conn.execute(delete(QuestionStat.__table__).where(QuestionStat.user_id.in_(deleted_users)))
+
+
+async def backfill(conn):
+    """Build the table from existing questions if it is empty (first start after upgrading)."""
+    if (await conn.execute(select(QuestionStat.user_id).limit(1))).first() is not None:
+        return
+    if (await conn.execute(select(ExtractedQuestion.id).limit(1))).first() is None:
+        return
+    stats = QuestionStat.__table__
+    originals = ExtractedQuestion.duplicate_of_id.is_(None)
+    await conn.execute(stats.insert().from_select(
+        ["user_id", "dimension", "value", "count"],
+        select(ExtractedQuestion.user_id, literal(TOTAL), literal(""), func.count())
+        .where(originals)
+        .group_by(ExtractedQuestion.user_id),
+    ))
+    for dimension, attr in DIMENSIONS.items():
+        column = getattr(ExtractedQuestion, attr)
+        await conn.execute(stats.insert().from_select(
+            ["user_id", "dimension", "value", "count"],
+            select(ExtractedQuestion.user_id, literal(dimension), column, func.count())
+            .where(originals, column.isnot(None))
+            .group_by(ExtractedQuestion.user_id, column),
+        ))
+    log.info("Backfilled question_stats from existing questions")
@@ -7,18 +7,23 @@ log = logging.getLogger(__name__)
 
 
 def extract_text(file_path: Path, file_type: str) -> str:
+    return "\n\n".join(extract_pages(file_path, file_type))
+
+
+def extract_pages(file_path: Path, file_type: str) -> list[str]:
+    """Text per page (a single entry for formats without pages)."""
     file_type = file_type.lower()
     if file_type == "pdf":
         return _extract_pdf(file_path)
     elif file_type == "docx":
-        return _extract_docx(file_path)
+        return [_extract_docx(file_path)]
     elif file_type in ("jpg", "jpeg", "png"):
-        return _extract_image(file_path)
+        return [_extract_image(file_path)]
     else:
         raise ValueError(f"Unsupported file type: {file_type}")
 
 
-def _extract_pdf(file_path: Path) -> str:
+def _extract_pdf(file_path: Path) -> list[str]:
     # Try pdfplumber first
     try:
         import pdfplumber
@@ -28,9 +33,8 @@ def _extract_pdf(file_path: Path) -> str:
                 t = page.extract_text()
                 if t:
                     text_parts.append(t)
-        text = "\n\n".join(text_parts)
-        if text.strip():
-            return text
+        if any(t.strip() for t in text_parts):
+            return text_parts
     except Exception as e:
         log.warning("pdfplumber failed, trying PyMuPDF: %s", e)
 
@@ -41,7 +45,7 @@ def _extract_pdf(file_path: Path) -> str:
     for page in doc:
         text_parts.append(page.get_text())
     doc.close()
-    return "\n\n".join(text_parts)
+    return text_parts
 
 
 def _extract_docx(file_path: Path) -> str:
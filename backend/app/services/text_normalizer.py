@@ -0,0 +1,169 @@
+"""Shrink extracted paper text before analysis without touching question content.
+
+Drops running headers/footers repeated verbatim across pages (the first
+occurrence is kept, so the paper's own header survives), page numbers and print
+boilerplate such as "P.T.O.", and collapses whitespace runs. Question, section,
+option and marks lines are never removed.
+"""
+
+import logging
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from ..utils.tokens import estimate_tokens
+from .format_skeleton import SECTION_RE, QUESTION_STYLES, SUBPART_STYLES, MARKS_STYLES
+
+log = logging.getLogger(__name__)
+
+EDGE_LINES = 3  # Lines at the top/bottom of a page that may be running headers/footers
+REPEAT_MIN_PAGES = 2
+REPEAT_MIN_SHARE = 0.5  # ...and on at least this share of pages
+
+# "Page 3", "Page 3 of 8", "3 of 8", "3/8", "- 3 -"; removed only near page edges
+PAGE_LABEL_RE = re.compile(r"^(?:page\s*\d{1,3}(?:\s*(?:of|/)\s*\d{1,3})?|\d{1,3}\s*(?:of|/)\s*\d{1,3}|[-–]\s*\d{1,3}\s*[-–])$", re.I)
+# A bare number is a page number only as a page's first/last line, and only when those
+# numbers count up with the pages; otherwise it may be marks
+BARE_NUMBER_RE = re.compile(r"^\d{1,3}$")
+OPTION_RE = re.compile(r"^\(?[a-hA-H][.)]\s+")  # MCQ options: "(a) 2 (b) 3", "A. Speed"
+BOILERPLATE_RE = re.compile(
+    r"^(?:\(?\s*p\.?\s*t\.?\s*o\.?\s*\)?|(?:please\s+)?turn\s+over|\(?continued(?:\s+on\s+(?:the\s+)?next\s+page)?\)?"
+    r"|space\s+for\s+rough\s+work|rough\s+work|this\s+page\s+(?:is\s+)?(?:intentionally\s+)?left\s+blank"
+    r"|\*+\s*end\s+of\s+(?:the\s+)?(?:question\s+)?paper\s*\*+)[.!]?$",
+    re.I,
+)
+RULE_RE = re.compile(r"^[\W_]{3,}$")  # ______, ------, *****, ......
+SPACES_RE = re.compile(r"[ \t ]+")
+
+
+@dataclass
+class NormalizedText:
+    text: str
+    chars_before: int
+    chars_after: int
+    tokens_before: int
+    tokens_after: int
+    repeated_lines_removed: int
+    boilerplate_lines_removed: int
+
+    @property
+    def chars_saved(self) -> int:
+        return self.chars_before - self.chars_after
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _line_key(line: str) -> str:
+    """A line with case and spacing folded; digits are kept, so differing marks or options never match."""
+    return SPACES_RE.sub(" ", line).strip().lower()
+
+
+def _is_protected(line: str) -> bool:
+    """Question content: never dropped as a repeated line or boilerplate."""
+    return bool(
+        SECTION_RE.match(line)
+        or OPTION_RE.match(line)
+        or BARE_NUMBER_RE.match(line)
+        or any(p.match(line) for _, p in QUESTION_STYLES + SUBPART_STYLES)
+        or any(p.search(line) for _, p in MARKS_STYLES)
+    )
+
+
+def _edge_indices(lines: list[str]) -> set[int]:
+    filled = [i for i, l in enumerate(lines) if l.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def _page_number_lines(pages: list[list[str]]) -> set[tuple[int, int]]:
+    """(page, line) of bare numbers at a page's first/last line that count up with the pages."""
+    runs: dict[tuple[str, int], list[tuple[int, int]]] = {}
+    for page, lines in enumerate(pages):
+        filled = [i for i, l in enumerate(lines) if l.strip()]
+        if not filled:
+            continue
+        for position, i in (("first", filled[0]), ("last", filled[-1])):
+            value = lines[i].strip()
+            if BARE_NUMBER_RE.match(value):
+                # Page numbers keep the same offset from the page index
+                runs.setdefault((position, int(value) - page), []).append((page, i))
+    threshold = max(REPEAT_MIN_PAGES, len(pages) * REPEAT_MIN_SHARE)
+    return {line for run in runs.values() if len(run) >= threshold for line in run}
+
+
+def _repeated_keys(pages: list[list[str]]) -> set[str]:
+    """Keys of edge lines that recur on enough pages to be running headers/footers."""
+    seen = Counter()
+    for lines in pages:
+        seen.update({_line_key(lines[i]) for i in _edge_indices(lines)})
+    threshold = max(REPEAT_MIN_PAGES, len(pages) * REPEAT_MIN_SHARE)
+    return {key for key, count in seen.items() if key and count >= threshold}
+
+
+def normalize_pages(pages: list[str]) -> NormalizedText:
+    """Normalize per-page extracted text and join it for analysis."""
+    raw = "\n\n".join(pages)
+    split = [p.splitlines() for p in pages]
+    repeated = _repeated_keys(split) if len(pages) >= REPEAT_MIN_PAGES else set()
+    page_numbers = _page_number_lines(split)
+
+    kept_first: set[str] = set()
+    repeated_removed = boilerplate_removed = 0
+    out: list[str] = []
+    for page, lines in enumerate(split):
+        edges = _edge_indices(lines)
+        for i, line in enumerate(lines):
+            line = SPACES_RE.sub(" ", line).strip()
+            if not line:
+                out.append("")
+                continue
+            if (page, i) in page_numbers:
+                boilerplate_removed += 1
+                continue
+            if not _is_protected(line):
+                if (i in edges and PAGE_LABEL_RE.match(line)) or BOILERPLATE_RE.match(line) or RULE_RE.match(line):
+                    boilerplate_removed += 1
+                    continue
+                key = _line_key(line)
+                if i in edges and key in repeated:
+                    if key in kept_first:
+                        repeated_removed += 1
+                        continue
+                    kept_first.add(key)
+            out.append(line)
+        out.append("")
+
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(out)).strip()
+    result = NormalizedText(
+        text=text,
+        chars_before=len(raw),
+        chars_after=len(text),
+        tokens_before=estimate_tokens(raw),
+        tokens_after=estimate_tokens(text),
+        repeated_lines_removed=repeated_removed,
+        boilerplate_lines_removed=boilerplate_removed,
+    )
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats["chars_saved"] += result.chars_saved
+        _stats["tokens_saved"] += result.tokens_saved
+        _stats["tokens_before"] += result.tokens_before
+    return result
+
+
+def normalize_text(text: str) -> NormalizedText:
+    """Normalize text whose page boundaries are unknown (form feeds are honoured)."""
+    return normalize_pages(text.split("\f"))
+
+
+def metrics() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    before = stats.get("tokens_before", 0)
+    stats["tokens_saved_pct"] = round(100 * stats.get("tokens_saved", 0) / before, 1) if before else 0.0
+    return stats
@@ -0,0 +1,47 @@
+"""Conditional GET: ETags and 304 Not Modified responses."""
+
+import hashlib
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"  # The browser may keep a copy but must revalidate it
+
+
+def make_etag(*parts, weak: bool = True) -> str:
+    """ETag from the values a response is built from.
+
+    Weak by default: JSON bodies may be gzipped on the way out, and a weak tag
+    still matches the same content in either encoding.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode())
+        h.update(b"\0")
+    tag = f'"{h.hexdigest()[:32]}"'
+    return f"W/{tag}" if weak else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check, using weak comparison as RFC 9110 requires for GET."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    ours = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == ours for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def json_with_etag(request: Request, etag: str, build_body) -> Response:
+    """304 if the client already has `etag`; otherwise call build_body() for the JSON text.
+
+    Serialization is skipped entirely on a match.
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(
+        build_body(), media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
@@ -0,0 +1,10 @@
+"""Rough token accounting for prompt budgeting."""
+
+CHARS_PER_TOKEN = 4  # Gemini averages ~4 chars/token on English prose
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Cheap token estimate; good enough for budgets, not for billing."""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
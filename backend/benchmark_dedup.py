@@ -0,0 +1,232 @@
+"""Benchmark near-duplicate detection on a synthetic question bank. Run from the backend/ directory.
+
+Builds a scratch SQLite bank in which a share of the questions are copies of
+earlier ones, indexes it the way the startup backfill does, then measures:
+
+- indexing throughput, and how many of the planted copies were flagged, per kind
+  of copy, plus flags pointing at the wrong question. "format" copies only differ
+  in numbering, marks annotation, case and punctuation; "typo" copies also have
+  one misspelt word; "word" copies have a word replaced, which in a short
+  question can fairly fall below the threshold
+- ingest latency for a new paper checked against the full bank
+- "similar questions" lookup latency for planted copies, against a scan over every
+  signature, with the share of the scan's matches at or above the threshold that
+  the LSH lookup also found
+
+Fixture questions come from a handful of templates, so unrelated questions share
+far more text than in a real bank and land in each other's buckets more often.
+Read the costs as an upper bound.
+
+Usage:
+    python benchmark_dedup.py
+    python benchmark_dedup.py --questions 200000 --duplicate-rate 0.2 --probes 500
+"""
+
+import argparse
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sqlalchemy import bindparam, create_engine, func, select
+from app.config import settings
+from app.database import Base
+from app.models import ExtractedQuestion, QuestionBucket, QuestionSignature, UploadedPaper, User
+from app.services.question_dedup import BACKFILL_BATCH, NUM_HASHES, find_similar, index_rows, similarity
+
+USER_ID = 1
+PAPER_SIZE = 50
+
+TEMPLATES = [
+    "Explain the role of {0} {1} in {2} and give {n} examples of {3} {4}.",
+    "A {0} of mass {n} kg moves along a {1} {2}. Calculate the {3} after {m} seconds.",
+    "Distinguish between {0} {1} and {2} {3} with reference to {4}.",
+    "Which of the following best describes the {0} of {1} {2}?",
+    "State {n} differences between {0} and {1}, and explain why {2} {3} depends on {4}.",
+    "Describe an experiment to show that {0} {1} affects the {2} of {3}.",
+    "Fill in the blank: the {0} of a {1} is measured in {2} {3}.",
+    "True or false: {0} {1} always increases the {2} of {3} {4}. Justify your answer.",
+]
+
+
+def _vocabulary(rng: random.Random, size: int = 3000) -> list[str]:
+    syllables = ["ka", "ro", "mi", "te", "sul", "phon", "gra", "vi", "den", "lu", "tro", "mag", "ne", "cel", "por", "ax"]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _fresh(rng: random.Random, vocab: list[str]) -> str:
+    words = [rng.choice(vocab) for _ in range(5)]
+    return rng.choice(TEMPLATES).format(*words, n=rng.randint(2, 9), m=rng.randint(2, 30))
+
+
+COPY_KINDS = ["format", "typo", "word"]
+
+
+def _reword(rng: random.Random, text: str, vocab: list[str], kind: str) -> str:
+    """A copy as from a re-upload or a reused sample paper."""
+    words = text.split()
+    i = rng.randrange(len(words))
+    if kind == "word":
+        words[i] = rng.choice(vocab)
+    elif kind == "typo":
+        w = words[i]
+        j = rng.randrange(len(w))
+        words[i] = w[:j] + rng.choice("aeiou") + w[j + 1:]
+    elif rng.random() < 0.5:
+        words = [w.upper() if rng.random() < 0.1 else w.rstrip(".,?") for w in words]
+    marks = rng.choice(["", f" [{rng.randint(1, 5)} marks]", f" ({rng.randint(1, 5)} marks)"])
+    return f"{rng.choice(['', 'Q', '('])}{rng.randint(1, 40)}{rng.choice(['.', ')'])} " + " ".join(words) + marks
+
+
+def synthetic_bank(n: int, duplicate_rate: float, seed: int) -> tuple[list[str], dict[int, tuple[int, str]]]:
+    """Question texts (index + 1 is the id) and {copy id: (id it was copied from, kind)}."""
+    rng = random.Random(seed)
+    vocab = _vocabulary(rng)
+    texts, source = [], {}
+    for i in range(n):
+        if texts and rng.random() < duplicate_rate:
+            origin = rng.randrange(len(texts))
+            while origin + 1 in source:  # Copy an original, so the expected flag is unambiguous
+                origin = rng.randrange(len(texts))
+            kind = rng.choice(COPY_KINDS)
+            texts.append(_reword(rng, texts[origin], vocab, kind))
+            source[i + 1] = (origin + 1, kind)
+        else:
+            texts.append(_fresh(rng, vocab))
+    return texts, source
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MinHash/LSH near-duplicate detection")
+    parser.add_argument("--questions", type=int, default=100_000, help="Bank size")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="Share of the bank planted as reworded copies")
+    parser.add_argument("--threshold", type=float, default=settings.QUESTION_DEDUP_THRESHOLD)
+    parser.add_argument("--probes", type=int, default=200, help="Similar-question lookups to time")
+    parser.add_argument("--brute-force-probes", type=int, default=20, help="Lookups also answered by a full scan")
+    parser.add_argument("--papers", type=int, default=20, help=f"New {PAPER_SIZE}-question papers to ingest")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    texts, source = synthetic_bank(args.questions, args.duplicate_rate, args.seed)
+    db_path = Path(tempfile.mkdtemp()) / "dedup_bench.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{
+            "id": USER_ID, "email": "bench@example.com", "username": "bench",
+            "hashed_password": "-", "full_name": "Bench", "role": "user",
+        }])
+        conn.execute(UploadedPaper.__table__.insert(), [{
+            "id": p + 1, "user_id": USER_ID, "filename": "-", "original_filename": "-", "file_type": "pdf",
+            "status": "completed", "question_count": PAPER_SIZE,
+        } for p in range(args.questions // PAPER_SIZE + args.papers + 1)])
+        conn.execute(ExtractedQuestion.__table__.insert(), [{
+            "id": i + 1, "paper_id": i // PAPER_SIZE + 1, "user_id": USER_ID, "question_text": text,
+            "question_type": "short_answer", "difficulty": "medium", "order_in_paper": i % PAPER_SIZE,
+        } for i, text in enumerate(texts)])
+
+    # Index the bank in backfill-sized batches
+    rows = [(i + 1, USER_ID, text) for i, text in enumerate(texts)]
+    flagged = {}
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for i in range(0, len(rows), BACKFILL_BATCH):
+            found = index_rows(conn, rows[i:i + BACKFILL_BATCH], args.threshold)
+            flagged.update(found)
+            if found:  # Later batches resolve their originals through these
+                conn.execute(
+                    ExtractedQuestion.__table__.update()
+                    .where(ExtractedQuestion.id == bindparam("b_id"))
+                    .values(duplicate_of_id=bindparam("b_original")),
+                    [{"b_id": qid, "b_original": original} for qid, original in found.items()],
+                )
+    index_seconds = time.perf_counter() - started
+
+    wrong = sum(1 for qid, original in flagged.items() if source.get(qid, (None,))[0] != original)
+    with engine.connect() as conn:
+        bucket_rows = conn.execute(select(func.count()).select_from(QuestionBucket)).scalar()
+    print(f"bank: {args.questions} questions, {len(source)} planted copies, threshold {args.threshold}")
+    print(f"index: {index_seconds:.1f} s ({args.questions / index_seconds:,.0f} questions/s), "
+          f"{bucket_rows:,} bucket rows, database {os.path.getsize(db_path) / 2**20:.0f} MB")
+    caught = []
+    for kind in COPY_KINDS:
+        copies = [(qid, origin) for qid, (origin, k) in source.items() if k == kind]
+        hits = sum(1 for qid, origin in copies if flagged.get(qid) == origin)
+        caught.append(f"{kind} {hits}/{len(copies)} ({hits / max(1, len(copies)):.1%})")
+    print(f"flagged: {len(flagged)}; copies caught: {', '.join(caught)}; wrong flags {wrong}")
+
+    # Ingest new papers against the full bank; half of each paper copies bank questions
+    rng = random.Random(args.seed + 1)
+    vocab = _vocabulary(rng)
+    timings, paper_flags = [], []
+    next_id = args.questions + 1
+    for p in range(args.papers):
+        paper = []
+        for _ in range(PAPER_SIZE):
+            if rng.random() < 0.5:
+                text = _reword(rng, rng.choice(texts), vocab, rng.choice(COPY_KINDS))
+            else:
+                text = _fresh(rng, vocab)
+            paper.append((next_id, USER_ID, text))
+            next_id += 1
+        with engine.connect() as conn:
+            with conn.begin() as tx:
+                started = time.perf_counter()
+                paper_flags.append(len(index_rows(conn, paper, args.threshold)))
+                timings.append(time.perf_counter() - started)
+                tx.rollback()  # Keep the bank the same size for every paper
+    print(f"ingest ({PAPER_SIZE}-question paper): median {statistics.median(timings) * 1000:.0f} ms, "
+          f"p95 {_percentile(timings, 95) * 1000:.0f} ms, {statistics.mean(paper_flags):.1f} flagged per paper")
+
+    # Similar-question lookups for planted copies, some also answered by scanning every signature
+    probe_ids = rng.sample(sorted(source), min(args.probes, len(source)))
+    lsh_timings = []
+    with engine.connect() as conn:
+        results = {}
+        for qid in probe_ids:
+            started = time.perf_counter()
+            results[qid] = find_similar(conn, qid, USER_ID, limit=1000, min_similarity=args.threshold)
+            lsh_timings.append(time.perf_counter() - started)
+    print(f"similar (LSH): median {statistics.median(lsh_timings) * 1000:.1f} ms, "
+          f"p95 {_percentile(lsh_timings, 95) * 1000:.1f} ms")
+
+    brute = probe_ids[:args.brute_force_probes]
+    if brute:
+        unpack = struct.Struct(f"<{NUM_HASHES}I").unpack
+        with engine.connect() as conn:  # Packed, as stored: unpacked tuples for the whole bank won't fit in memory
+            blobs = dict(conn.execute(select(QuestionSignature.question_id, QuestionSignature.minhash)).all())
+        scan_timings, expected, found = [], 0, 0
+        for qid in brute:
+            started = time.perf_counter()
+            target = unpack(blobs[qid])
+            matches = {
+                other for other, blob in blobs.items()
+                if other != qid and blob and similarity(target, unpack(blob)) >= args.threshold
+            }
+            scan_timings.append(time.perf_counter() - started)
+            expected += len(matches)
+            found += len(matches & {m for m, _ in results[qid]})
+        print(f"similar (full scan): median {statistics.median(scan_timings) * 1000:.0f} ms; "
+              f"LSH found {found}/{expected} of its matches")
+
+    engine.dispose()
+    db_path.unlink()
+    db_path.parent.rmdir()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Compare PDF export backends on fixture papers of increasing size. Run from the backend/ directory.
+
+Each (backend, size) pair renders in a fresh process so peak memory (max RSS)
+is measured in isolation. Pick the winner with PDF_BACKEND in .env. Where the
+resource module is missing (Windows), peak memory comes from psutil if it is
+installed, else from tracemalloc, which sees Python allocations only.
+
+Usage:
+    python benchmark_pdf.py
+    python benchmark_pdf.py --sizes 10 50 200 --repeat 3 --backends xhtml2pdf pymupdf
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from app.services.paper_assembler import Candidate, render_paper
+from app.services.export_service import PDF_BACKENDS, markdown_to_pdf
+
+QUESTION_TYPES = ["mcq", "short_answer", "long_answer", "fill_blank", "true_false"]
+MARKS = {"mcq": 1, "true_false": 1, "fill_blank": 1, "short_answer": 3, "long_answer": 5}
+
+
+def fixture_paper(num_questions: int) -> str:
+    """A realistic paper: sectioned questions, MCQ options and a marks table per section."""
+    candidates = []
+    for i in range(num_questions):
+        qtype = QUESTION_TYPES[i % len(QUESTION_TYPES)]
+        candidates.append(Candidate(
+            id=i + 1,
+            question_text=(
+                f"Question {i + 1} on topic {i % 7}: explain the relationship between force, mass and "
+                f"acceleration, giving one everyday example and a worked calculation for a body of {i + 2} kg."
+            ),
+            answer_text=None,
+            question_type=qtype,
+            difficulty=("easy", "medium", "hard")[i % 3],
+            topic=f"Topic {i % 7}",
+            marks=MARKS[qtype],
+            options=[f"Option {c} for question {i + 1}" for c in "ABCD"] if qtype == "mcq" else [],
+            correct_option=None,
+        ))
+    md = render_paper(candidates, "Benchmark Paper", "CBSE", "10", "Physics", 180)
+    table = ["| Section | Questions | Marks |", "|---|---|---|"]
+    table += [f"| {t.replace('_', ' ').title()} | {num_questions // 5} | {MARKS[t] * (num_questions // 5)} |" for t in QUESTION_TYPES]
+    return md + "\n\n## Marks Distribution\n\n" + "\n".join(table) + "\n"
+
+
+def _peak_memory_mb() -> float:
+    """Peak memory of this process so far, in MB."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # Bytes on macOS, KiB on Linux
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20  # peak_wset: Windows' peak working set
+    return tracemalloc.get_traced_memory()[1] / 2**20
+
+
+def _measure(backend: str, md_text: str, repeat: int, results):
+    markdown_to_pdf("# warm-up", "warm-up", backend=backend)  # Imports and font loading
+    if resource is None and psutil is None:
+        tracemalloc.start()
+    peak_before = _peak_memory_mb()
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(markdown_to_pdf(md_text, "Benchmark Paper", backend=backend))
+        timings.append(time.perf_counter() - started)
+    results.put((min(timings), sum(timings) / len(timings), _peak_memory_mb() - peak_before, size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF export backends")
+    parser.add_argument("--backends", nargs="+", default=list(PDF_BACKENDS), choices=list(PDF_BACKENDS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 50, 200], help="Questions per fixture paper")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'backend':<10} {'questions':>9} {'best s':>8} {'mean s':>8} {'peak +MB':>9} {'pdf KB':>8}")
+    for size in args.sizes:
+        md_text = fixture_paper(size)
+        for backend in args.backends:
+            results = ctx.Queue()
+            proc = ctx.Process(target=_measure, args=(backend, md_text, args.repeat, results))
+            proc.start()
+            proc.join()
+            if proc.exitcode != 0:
+                print(f"{backend:<10} {size:>9} failed (exit code {proc.exitcode})")
+                continue
+            best, mean, peak_mb, pdf_bytes = results.get()
+            print(f"{backend:<10} {size:>9} {best:>8.2f} {mean:>8.2f} {peak_mb:>9.1f} {pdf_bytes / 1024:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
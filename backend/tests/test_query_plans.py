@@ -0,0 +1,80 @@
+"""Query-plan regression check for the hot queries.
+
+Each query is built by the same helper its route or service uses and EXPLAINed on a
+fresh in-memory SQLite schema from the models. It must reach its rows through an
+index rather than scanning a table, and a query whose ORDER BY an index should serve
+must not sort in a temp b-tree.
+"""
+
+import re
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from app.database import Base
+from app.routers import generation, papers, questions
+from app.services import paper_generator, question_dedup
+
+HOT_TABLES = {
+    "extracted_questions", "generated_papers", "uploaded_papers", "conversations", "question_stats",
+    "question_buckets", "question_signatures",
+}
+SCAN_RE = re.compile(r"SCAN (?:TABLE )?(\w+)")  # SEARCH is an index lookup; SCAN reads everything
+
+USER_ID, PAPER_ID, SUBJECT, TOPIC = 1, 1, "Physics", "Kinematics"
+IDS = [1, 2, 3]
+BUCKETS = [-4_000_000_000_000_000_000, 17, 4_000_000_000_000_000_000]  # Signed 64-bit band keys
+PAGE = questions.DEFAULT_PAGE_SIZE + 1  # The route reads one extra row to detect a next page
+
+
+def _bank_page(after_id=None, **filters):
+    stmt = questions._rows_query(["id", "question_text"], questions._bank_filters(USER_ID, **filters))
+    return questions._keyset_page(stmt, after_id).limit(PAGE)
+
+
+# (name, statement, ORDER BY served by an index)
+HOT_QUERIES = [
+    ("list_questions first page", _bank_page(), True),
+    ("list_questions next page", _bank_page(after_id=10_000), True),
+    ("list_questions by subject", _bank_page(subject=SUBJECT), False),
+    ("list_questions by topic", _bank_page(topic=TOPIC), False),
+    ("list_questions total", questions._count_query(questions._bank_filters(USER_ID)), False),
+    ("question_stats", questions._stats_query(USER_ID), False),
+    ("list_topics", questions._topics_query(USER_ID), True),
+    ("generation context", paper_generator._bank_questions_query(
+        USER_ID, SUBJECT, paper_generator.BANK_REFERENCE_LIMIT), False),
+    ("assembler candidates", paper_generator._candidates_query(USER_ID, SUBJECT), False),
+    ("similarity bucket lookup", question_dedup._bucket_members_query(USER_ID, BUCKETS), False),
+    ("similarity candidate signatures", question_dedup._indexed_query(IDS), False),
+    ("duplicates of deleted originals", question_dedup._duplicates_query(IDS), False),
+    *((f"index removal {i}", stmt, False) for i, stmt in enumerate(question_dedup._unindex_statements(IDS), 1)),
+    ("generated papers list", generation._generated_papers_query(USER_ID), True),
+    ("daily generation limit", generation._created_since_query(USER_ID, datetime(2025, 1, 1)), False),
+    ("uploaded papers list", papers._uploaded_papers_query(USER_ID), True),
+    ("chat history", generation._chat_history_query(PAPER_ID), True),
+    ("chat history validator", generation._chat_version_query(PAPER_ID), False),
+]
+
+
+@pytest.fixture(scope="module")
+def conn():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+def _plan(conn, stmt) -> list[str]:
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})  # Expands IN lists
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    return [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+
+
+@pytest.mark.parametrize("stmt, ordered", [pytest.param(stmt, ordered, id=name) for name, stmt, ordered in HOT_QUERIES])
+def test_hot_query_uses_an_index(conn, stmt, ordered):
+    plan = _plan(conn, stmt)
+    scans = [d for d in plan if (m := SCAN_RE.match(d)) and m.group(1) in HOT_TABLES]
+    assert not scans, "full scan:\n" + "\n".join(plan)
+    if ordered:
+        sorts = [d for d in plan if "TEMP B-TREE FOR ORDER BY" in d]
+        assert not sorts, "sorts instead of reading in index order:\n" + "\n".join(plan)
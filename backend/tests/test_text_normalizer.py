@@ -0,0 +1,115 @@
+from collections import Counter
+from app.services import text_normalizer
+from app.services.text_normalizer import normalize_pages, OPTION_RE
+from app.services.format_skeleton import SECTION_RE, QUESTION_STYLES, MARKS_STYLES
+
+# Three pages with a running header, bare page numbers and print boilerplate. Pages 1
+# and 2 repeat an options line and a marks line at their foot, and the paper ends on a
+# bare marks value.
+FIXTURE_PAGES = [
+    """SPRINGFIELD HIGH SCHOOL
+Half-Yearly Examination 2024   Class X   Science
+Time: 3 hours                                  Maximum Marks: 40
+
+General Instructions:
+1. All questions are compulsory.
+2. Marks are indicated against each question.
+
+SECTION A
+Q1. Which of the following is a vector quantity?   [1 mark]
+(a) Speed  (b) Velocity  (c) Distance  (d) Mass
+Q2. The SI unit of force is ______.   [1 mark]
+Q3. How many laws of motion did Newton state?
+(a) 2 (b) 3 (c) 4 (d) 5
+[2]
+1""",
+    """SPRINGFIELD HIGH SCHOOL
+Half-Yearly Examination 2024   Class X   Science
+Q4. A body of mass 2 kg moves with velocity 3 m/s. Find its momentum.   [2 marks]
+
+
+SECTION B
+Q5. (a) Define acceleration.
+    (b) A car accelerates from rest to 20 m/s in 5 s. Find the acceleration.   [3 marks]
+Q6. How many forces act on a book resting on a table?
+(a) 2 (b) 3 (c) 4 (d) 5
+[2]
+2""",
+    """SPRINGFIELD HIGH SCHOOL
+Half-Yearly Examination 2024   Class X   Science
+SECTION C
+Q7. Derive the equations of motion graphically.   [5 marks]
+Q8. State the law of conservation of momentum and explain recoil of a gun.
+Space for rough work
+*** End of Question Paper ***
+5""",
+]
+
+# Bare page numbers ending pages 1 and 2; the "5" ending page 3 is Q8's marks
+PAGE_NUMBERS = {"1", "2"}
+HEADER = ["SPRINGFIELD HIGH SCHOOL", "Half-Yearly Examination 2024 Class X Science"]
+
+
+def _lines(text: str) -> list[str]:
+    return [" ".join(l.split()) for l in text.splitlines() if l.strip()]
+
+
+def _content_lines(text: str) -> Counter:
+    """Question, section, option and marks lines (and bare marks values), with their multiplicity."""
+    return Counter(
+        l for l in _lines(text)
+        if SECTION_RE.match(l) or OPTION_RE.match(l)
+        or any(p.match(l) for _, p in QUESTION_STYLES) or any(p.search(l) for _, p in MARKS_STYLES)
+        or (l.isdigit() and l not in PAGE_NUMBERS)
+    )
+
+
+def test_keeps_every_question():
+    result = normalize_pages(FIXTURE_PAGES)
+    questions = [l for l in _lines(result.text) if l.startswith("Q")]
+    assert len(questions) == 8
+    assert _content_lines(result.text) == _content_lines("\n".join(FIXTURE_PAGES))
+
+
+def test_keeps_question_text_verbatim():
+    result = normalize_pages(FIXTURE_PAGES)
+    assert "Q4. A body of mass 2 kg moves with velocity 3 m/s. Find its momentum. [2 marks]" in result.text
+    assert result.text.rstrip().endswith(
+        "Q8. State the law of conservation of momentum and explain recoil of a gun.\n5"
+    )
+
+
+def test_drops_repeated_headers_but_keeps_the_first():
+    result = normalize_pages(FIXTURE_PAGES)
+    lines = _lines(result.text)
+    assert lines[:2] == HEADER
+    for header in HEADER:
+        assert lines.count(header) == 1
+    assert result.repeated_lines_removed == 4
+
+
+def test_drops_page_numbers_and_boilerplate():
+    result = normalize_pages(FIXTURE_PAGES)
+    lines = _lines(result.text)
+    assert not PAGE_NUMBERS & set(lines)
+    assert "Space for rough work" not in lines
+    assert "*** End of Question Paper ***" not in lines
+    assert result.boilerplate_lines_removed == 4
+
+
+def test_reports_savings():
+    before = text_normalizer.metrics()
+    result = normalize_pages(FIXTURE_PAGES)
+    assert result.chars_before == len("\n\n".join(FIXTURE_PAGES))
+    assert result.chars_after == len(result.text)
+    assert result.chars_saved > 0 and result.tokens_saved > 0
+    assert result.tokens_after < result.tokens_before
+
+    after = text_normalizer.metrics()
+    assert after["documents"] == before.get("documents", 0) + 1
+    assert after["tokens_saved"] == before.get("tokens_saved", 0) + result.tokens_saved
+    assert 0 < after["tokens_saved_pct"] < 100
+
+
+def test_form_feeds_split_pages():
+    assert normalize_pages(FIXTURE_PAGES).text == text_normalizer.normalize_text("\f".join(FIXTURE_PAGES)).text
@@ -1,7 +1,7 @@
 import { useState, useEffect, type FormEvent } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
 import { ChevronDown } from 'lucide-react';
-import { generateAPI, questionsAPI } from '../services/api';
+import { generateAPI, questionsAPI, exportAPI } from '../services/api';
 import { BOARDS, GRADES, SUBJECTS, DIFFICULTIES } from '../constants';
 import type { GeneratedPaperListItem } from '../types';
 
@@ -17,10 +17,15 @@ export default function GeneratePage() {
   const [totalMarks, setTotalMarks] = useState(100);
   const [duration, setDuration] = useState(180);
   const [instructions, setInstructions] = useState('');
+  const [mode, setMode] = useState<'generate' | 'assemble'>('generate');
+  const [polish, setPolish] = useState(false);
+  const [answerKey, setAnswerKey] = useState<'eager' | 'background' | 'on_demand'>('eager');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [papers, setPapers] = useState<GeneratedPaperListItem[]>([]);
   const [showAdvanced, setShowAdvanced] = useState(false);
+  const [selected, setSelected] = useState<number[]>([]);
+  const [exporting, setExporting] = useState(false);
 
   useEffect(() => {
     generateAPI.list().then(r => setPapers(r.data)).catch(() => {});
@@ -36,9 +41,31 @@ export default function GeneratePage() {
     try {
       await generateAPI.delete(id);
       setPapers(prev => prev.filter(p => p.id !== id));
+      setSelected(prev => prev.filter(x => x !== id));
     } catch { /* ignore */ }
   };
 
+  const toggleSelected = (id: number) => {
+    setSelected(prev => prev.includes(id) ? prev.filter(x => x !== id) : [...prev, id]);
+  };
+
+  const handleBulkExport = async () => {
+    setExporting(true);
+    try {
+      const res = await exportAPI.bulk(selected, ['paper', 'answer_key'], ['pdf', 'docx']);
+      const url = window.URL.createObjectURL(new Blob([res.data]));
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = 'exam-papers.zip';
+      a.click();
+      window.URL.revokeObjectURL(url);
+    } catch {
+      alert('Export failed');
+    } finally {
+      setExporting(false);
+    }
+  };
+
   const handleSubmit = async (e: FormEvent) => {
     e.preventDefault();
     if (!title || !board || !grade || !subject) {
@@ -54,6 +81,9 @@ export default function GeneratePage() {
         total_marks: totalMarks,
         duration_minutes: duration,
         additional_instructions: instructions || undefined,
+        mode,
+        polish: mode === 'assemble' && polish,
+        answer_key: answerKey,
       });
       navigate(`/paper/${res.data.id}`);
     } catch (err: any) {
@@ -157,6 +187,31 @@ export default function GeneratePage() {
                 </div>
               )}
 
+              <div className="form-group">
+                <label>Mode</label>
+                <select value={mode} onChange={e => setMode(e.target.value as 'generate' | 'assemble')}>
+                  <option value="generate">Generate new questions with AI</option>
+                  <option value="assemble">Assemble from my question bank (instant)</option>
+                </select>
+                {mode === 'assemble' && (
+                  <label style={{ display: 'flex', alignItems: 'center', gap: '0.5rem', marginTop: '0.5rem', fontSize: '0.85rem' }}>
+                    <input type="checkbox" checked={polish} onChange={e => setPolish(e.target.checked)} style={{ width: 'auto' }} />
+                    Polish formatting with AI afterwards
+                  </label>
+                )}
+              </div>
+
+              {mode === 'generate' && (
+                <div className="form-group">
+                  <label>Answer Key</label>
+                  <select value={answerKey} onChange={e => setAnswerKey(e.target.value as 'eager' | 'background' | 'on_demand')}>
+                    <option value="eager">Write with the paper</option>
+                    <option value="background">Write after the paper is ready (faster preview)</option>
+                    <option value="on_demand">Only when I open or export it</option>
+                  </select>
+                </div>
+              )}
+
               <div className="form-group">
                 <label>Additional Instructions</label>
                 <textarea value={instructions} onChange={e => setInstructions(e.target.value)}
@@ -171,16 +226,31 @@ export default function GeneratePage() {
         </div>
 
         <div className="card">
-          <h3 style={{ fontSize: '1rem', marginBottom: '0.75rem', fontWeight: 700 }}>Previously Generated</h3>
+          <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '0.75rem' }}>
+            <h3 style={{ fontSize: '1rem', fontWeight: 700 }}>Previously Generated</h3>
+            {selected.length > 0 && (
+              <button className="btn btn-outline btn-sm" onClick={handleBulkExport} disabled={exporting}>
+                {exporting ? <><span className="spinner" /> Exporting...</> : `Export ${selected.length} (ZIP)`}
+              </button>
+            )}
+          </div>
           {papers.length === 0 ? (
             <div className="empty-state"><p>No papers generated yet</p></div>
           ) : (
             <div className="table-wrap">
               <table>
-                <thead><tr><th>Title</th><th>Status</th><th></th></tr></thead>
+                <thead><tr><th></th><th>Title</th><th>Status</th><th></th></tr></thead>
                 <tbody>
                   {papers.map(p => (
                     <tr key={p.id}>
+                      <td>
+                        <input
+                          type="checkbox"
+                          checked={selected.includes(p.id)}
+                          disabled={p.status !== 'completed'}
+                          onChange={() => toggleSelected(p.id)}
+                        />
+                      </td>
                       <td><Link to={`/paper/${p.id}`}>{p.title}</Link></td>
                       <td><span className={`badge badge-${p.status}`}>{p.status}</span></td>
                       <td>
@@ -1,35 +1,90 @@
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { Link } from 'react-router-dom';
 import { SlidersHorizontal, Upload } from 'lucide-react';
 import { questionsAPI } from '../services/api';
 import { BOARDS, GRADES, SUBJECTS, QUESTION_TYPES, DIFFICULTIES } from '../constants';
-import type { ExtractedQuestion } from '../types';
+import type { ExtractedQuestion, SimilarQuestion } from '../types';
+
+// Only what the cards show; skips options_json and the other unused columns
+const LIST_FIELDS = 'question_text,answer_text,question_type,difficulty,topic,marks';
 
 export default function QuestionsPage() {
   const [questions, setQuestions] = useState<ExtractedQuestion[]>([]);
   const [topics, setTopics] = useState<string[]>([]);
   const [loading, setLoading] = useState(true);
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [filters, setFilters] = useState<Record<string, string>>({});
   const [showMoreFilters, setShowMoreFilters] = useState(false);
+  const [search, setSearch] = useState('');
+  const [similar, setSimilar] = useState<{ id: number; items: SimilarQuestion[] | null } | null>(null);
 
   useEffect(() => {
     questionsAPI.topics().then(r => setTopics(r.data)).catch(() => {});
   }, []);
 
+  // Bumped whenever the filters change; responses for an older query are dropped
+  const queryId = useRef(0);
+
+  const fetchPage = (cursor?: string) => {
+    const id = queryId.current;
+    const params: Record<string, string> = { fields: LIST_FIELDS };
+    Object.entries(filters).forEach(([k, v]) => { if (v) params[k] = v; });
+    if (cursor) params.cursor = cursor;
+    return questionsAPI.list(params).then(r => {
+      if (id !== queryId.current) return null;
+      setTotal(Number(r.headers['x-total-count'] ?? r.data.length));
+      setNextCursor(r.headers['x-next-cursor'] || null);
+      return r.data;
+    });
+  };
+
   useEffect(() => {
+    const id = ++queryId.current;
     setLoading(true);
-    const params: Record<string, string> = {};
-    Object.entries(filters).forEach(([k, v]) => { if (v) params[k] = v; });
-    questionsAPI.list(params)
-      .then(r => setQuestions(r.data))
+    setNextCursor(null);
+    setLoadingMore(false);
+    fetchPage()
+      .then(page => { if (page) setQuestions(page); })
       .catch(() => {})
-      .finally(() => setLoading(false));
+      .finally(() => { if (id === queryId.current) setLoading(false); });
   }, [filters]);
 
+  const loadMore = () => {
+    if (!nextCursor) return;
+    const id = queryId.current;
+    setLoadingMore(true);
+    fetchPage(nextCursor)
+      .then(page => { if (page) setQuestions(prev => [...prev, ...page]); })
+      .catch(() => {})
+      .finally(() => { if (id === queryId.current) setLoadingMore(false); });
+  };
+
   const setFilter = (key: string, value: string) => {
     setFilters(prev => ({ ...prev, [key]: value }));
   };
 
+  // Debounced: search as you type without a request per keystroke
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      const q = search.trim();
+      setFilters(prev => (prev.q || '') === q ? prev : { ...prev, q });
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [search]);
+
+  const toggleSimilar = (id: number) => {
+    if (similar?.id === id) {
+      setSimilar(null);
+      return;
+    }
+    setSimilar({ id, items: null });
+    questionsAPI.similar(id)
+      .then(r => setSimilar(prev => (prev?.id === id ? { id, items: r.data } : prev)))
+      .catch(() => setSimilar(prev => (prev?.id === id ? { id, items: [] } : prev)));
+  };
+
   const typeLabel = (t: string) => QUESTION_TYPES.find(qt => qt.value === t)?.label || t;
 
   // Count active hidden filters (board, type, topic)
@@ -41,11 +96,20 @@ export default function QuestionsPage() {
     <div className="page">
       <div className="page-header">
         <h1>Question Bank</h1>
-        <p>{questions.length} questions in your bank</p>
+        <p>{total} questions in your bank</p>
       </div>
 
       {/* Primary filters */}
       <div className="filter-bar">
+        <div className="form-group" style={{ flex: 2 }}>
+          <label>Search</label>
+          <input
+            type="search"
+            value={search}
+            placeholder="Words in question, answer or topic"
+            onChange={e => setSearch(e.target.value)}
+          />
+        </div>
         <div className="form-group">
           <label>Subject</label>
           <select value={filters.subject || ''} onChange={e => setFilter('subject', e.target.value)}>
@@ -138,10 +202,43 @@ export default function QuestionsPage() {
               <span className={`badge badge-${q.difficulty}`}>{q.difficulty}</span>
               {q.topic && <span className="badge badge-topic">{q.topic}</span>}
               {q.marks && <span style={{ fontSize: '0.75rem', color: 'var(--gray-500)' }}>{q.marks} marks</span>}
+              <button
+                type="button"
+                className="btn btn-outline btn-sm"
+                style={{ marginLeft: 'auto' }}
+                onClick={() => toggleSimilar(q.id)}
+              >
+                {similar?.id === q.id ? 'Hide similar' : 'Similar'}
+              </button>
             </div>
+            {similar?.id === q.id && (
+              <div style={{ marginTop: '0.75rem', fontSize: '0.85rem', color: 'var(--gray-600)' }}>
+                {similar.items === null ? (
+                  <span className="spinner" />
+                ) : similar.items.length === 0 ? (
+                  'No similar questions in your bank'
+                ) : (
+                  similar.items.map(s => (
+                    <div key={s.id} style={{ padding: '0.35rem 0', borderTop: '1px solid var(--gray-200)' }}>
+                      <strong>{Math.round(s.similarity * 100)}%</strong>
+                      {s.duplicate_of_id != null && <span className="badge" style={{ marginLeft: '0.4rem' }}>duplicate</span>}
+                      {' '}{s.question_text}
+                    </div>
+                  ))
+                )}
+              </div>
+            )}
           </div>
         ))
       )}
+
+      {!loading && nextCursor && (
+        <div style={{ textAlign: 'center', marginTop: '1rem' }}>
+          <button className="btn btn-outline btn-sm" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? <><span className="spinner" /> Loading...</> : `Load more (${questions.length} of ${total})`}
+          </button>
+        </div>
+      )}
     </div>
   );
 }
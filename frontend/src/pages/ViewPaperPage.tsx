@@ -22,6 +22,7 @@ export default function ViewPaperPage() {
   const [sending, setSending] = useState(false);
   const [view, setView] = useState<'paper' | 'answer_key'>('paper');
   const [loading, setLoading] = useState(true);
+  const [loadingKey, setLoadingKey] = useState(false);
   const chatEndRef = useRef<HTMLDivElement>(null);
   const textareaRef = useRef<HTMLTextAreaElement>(null);
   const pollRef = useRef<ReturnType<typeof setInterval> | null>(null);
@@ -48,6 +49,16 @@ export default function ViewPaperPage() {
     setLoading(false);
   };
 
+  // Papers can be generated without a key; it is written the first time someone asks for it
+  useEffect(() => {
+    if (view !== 'answer_key' || !paper || paper.status !== 'completed' || paper.answer_key_markdown || loadingKey) return;
+    setLoadingKey(true);
+    generateAPI.answerKey(paperId)
+      .then(r => setPaper(p => p && { ...p, answer_key_markdown: r.data.answer_key_markdown, answer_key_status: 'completed' }))
+      .catch(() => setPaper(p => p && { ...p, answer_key_status: 'failed' }))
+      .finally(() => setLoadingKey(false));
+  }, [view, paper?.answer_key_markdown, paper?.status]);
+
   const startPolling = () => {
     if (pollRef.current) return;
     pollRef.current = setInterval(async () => {
@@ -230,7 +241,15 @@ export default function ViewPaperPage() {
             <button className={view === 'answer_key' ? 'active' : ''} onClick={() => setView('answer_key')}>Answer Key</button>
           </div>
           <div className="paper-content">
-            <ReactMarkdown>{content || ''}</ReactMarkdown>
+            {view === 'answer_key' && loadingKey ? (
+              <div style={{ textAlign: 'center', color: 'var(--gray-400)', marginTop: '2rem' }}>
+                <span className="spinner" /> Writing the answer key…
+              </div>
+            ) : view === 'answer_key' && !content && paper.answer_key_status === 'failed' ? (
+              <p style={{ color: 'var(--danger)' }}>Answer key generation failed. Switch tabs to try again.</p>
+            ) : (
+              <ReactMarkdown>{content || ''}</ReactMarkdown>
+            )}
           </div>
         </div>
 
@@ -3,11 +3,13 @@ import type {
   TokenResponse,
   UploadedPaper,
   ExtractedQuestion,
+  SimilarQuestion,
   QuestionStats,
   GeneratedPaper,
   GeneratedPaperListItem,
   ConversationMessage,
   GeneratePaperRequest,
+  BatchStatus,
   AdminStats,
   UserDetail,
 } from '../types';
@@ -93,6 +95,7 @@ export const papersAPI = {
 export const questionsAPI = {
   list: (params?: Record<string, string>) =>
     api.get<ExtractedQuestion[]>('/questions', { params }),
+  similar: (id: number) => api.get<SimilarQuestion[]>(`/questions/${id}/similar`),
   stats: () => api.get<QuestionStats>('/questions/stats'),
   topics: () => api.get<string[]>('/questions/topics'),
 };
@@ -101,10 +104,15 @@ export const questionsAPI = {
 export const generateAPI = {
   create: (data: GeneratePaperRequest) =>
     api.post<GeneratedPaper>('/generate', data),
+  createBatch: (data: GeneratePaperRequest & { variant_count: number }) =>
+    api.post<BatchStatus>('/generate/batch', data),
+  batchStatus: (batchId: string) => api.get<BatchStatus>(`/generate/batch/${batchId}`),
   list: () => api.get<GeneratedPaperListItem[]>('/generate'),
   get: (id: number) => api.get<GeneratedPaper>(`/generate/${id}`),
   status: (id: number) =>
     api.get<{ id: number; status: string; error_message: string | null }>(`/generate/${id}/status`),
+  answerKey: (id: number) =>
+    api.get<{ paper_id: number; status: string; answer_key_markdown: string }>(`/generate/${id}/answer-key`),
   delete: (id: number) => api.delete(`/generate/${id}`),
 };
 
@@ -129,6 +137,8 @@ export const exportAPI = {
     api.get(`/export/${id}/answer-key/pdf`, { responseType: 'blob' }),
   answerKeyWord: (id: number) =>
     api.get(`/export/${id}/answer-key/word`, { responseType: 'blob' }),
+  bulk: (paperIds: number[], parts: string[], formats: string[]) =>
+    api.post('/export/bulk', { paper_ids: paperIds, parts, formats }, { responseType: 'blob' }),
 };
 
 export default api;
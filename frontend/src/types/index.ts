@@ -45,6 +45,11 @@ export interface ExtractedQuestion {
   correct_option: string | null;
   bloom_level: string | null;
   order_in_paper: number;
+  duplicate_of_id?: number | null;
+}
+
+export interface SimilarQuestion extends ExtractedQuestion {
+  similarity: number;
 }
 
 export interface QuestionStats {
@@ -69,6 +74,7 @@ export interface GeneratedPaper {
   duration_minutes: number | null;
   content_markdown: string | null;
   answer_key_markdown: string | null;
+  answer_key_status?: 'pending' | 'generating' | 'completed' | 'failed' | null;
   error_message: string | null;
   created_at: string;
 }
@@ -148,4 +154,16 @@ export interface GeneratePaperRequest {
   total_marks?: number;
   duration_minutes?: number;
   additional_instructions?: string;
+  mode?: 'generate' | 'assemble';
+  polish?: boolean;
+  answer_key?: 'eager' | 'background' | 'on_demand';
+}
+
+export interface BatchStatus {
+  batch_id: string;
+  status: 'generating' | 'completed' | 'partial' | 'failed';
+  total: number;
+  completed: number;
+  failed: number;
+  papers: { id: number; title: string; variant_label: string | null; status: string; error_message: string | null }[];
 }